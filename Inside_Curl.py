@@ -3,167 +3,1204 @@
 # Discord Bot + FastAPI + 健康檢查
 # =========================
 import os
+import asyncio
+import contextlib
+import functools
+import hashlib
+import hmac
+import json
+import socket
+import sqlite3
+import subprocess
+import sys
 import threading
 import datetime
 import time
 import discord
 from discord import app_commands
 from discord.ext import commands
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import uvicorn
+from log_queue import LogSenderPool
+from session_store import SessionStore
+from rollups import RollupEngine
+from sessions import SessionTable
+from rooms import RoomTracker
+from metrics import MetricsRegistry, resident_memory_bytes
+from scheduler import TimerHeap
+from status_snapshot import SnapshotWriter, StatusBoard, default_snapshot_path, dumps
+from lease import FileLease, LeaderElector, SqliteLease
+from broadcast import BroadcastHub
+from names import DisplayNameCache
+from topics import TopicIndex
+from topic_canon import TopicCanon, fold
+from guild_config import load_guild_configs, parse_shard_ids, shard_of
+from digest import PERIODS, compute_digests, last_completed, next_midnight, resolve_timezone, window_for
+from profiler import HandlerMonitor, SamplingProfiler, collapsed
+from history import QueryError, SessionQuery, gzip_stream, open_readonly, parse_time, stream_csv, stream_ndjson, user_topics
+from session_archive import ArchiveError, SessionArchive
+from jsonlog import log
+
+# 行程啟動時間（量測啟動耗時用）
+PROCESS_START = time.perf_counter()
+
+# 執行模式：threaded = uvicorn 在背景執行緒；single = uvicorn 與 bot 共用一個 event loop
+RUNTIME_MODE = os.getenv("RUNTIME_MODE", "threaded")
+PORT = int(os.environ.get("PORT", 10000))
+
+# 啟動耗時與事件處理延遲
+runtime_stats = {
+    "mode": RUNTIME_MODE,
+    "web_ready_ms": None,
+    "bot_ready_ms": None,
+    "reconnects": 0,
+    "reconnect_ready_ms": None,
+    "resumes": 0,
+    "resume_ms": None,
+    "loop_lag_ms": 0.0,
+    "loop_lag_max_ms": 0.0,
+    "voice_events": 0,
+    "voice_event_last_ms": 0.0,
+    "voice_event_max_ms": 0.0
+}
+
+def elapsed_ms(start=PROCESS_START):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+# =========================
+# 監控指標（/metrics）
+# =========================
+metrics = MetricsRegistry()
+VOICE_EVENTS = metrics.counter(
+    "inside_curl_voice_events_total", "Voice state events by type", label="type"
+)
+VOICE_HANDLER_SECONDS = metrics.histogram(
+    "inside_curl_voice_handler_seconds", "on_voice_state_update handling time"
+)
+LOG_SEND_SECONDS = metrics.histogram(
+    "inside_curl_log_send_seconds", "log_channel.send latency"
+)
+COMMAND_SECONDS = metrics.histogram(
+    "inside_curl_command_seconds", "Slash command response time", label="command"
+)
+EVENT_SECONDS = metrics.histogram(
+    "inside_curl_event_handler_seconds", "Discord event handler time", label="event"
+)
+ROOM_EVENTS = metrics.counter(
+    "inside_curl_room_events_total", "Room-level events (open / empty / peak)", label="type"
+)
+
+# 慢處理偵測：事件處理器 / 指令超過幾毫秒就記錄堆疊，最近幾筆留在 /debug/slow
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", 250))
+SLOW_HANDLER_KEEP = int(os.getenv("SLOW_HANDLER_KEEP", 50))
+handler_monitor = HandlerMonitor(threshold=SLOW_HANDLER_MS / 1000, keep=SLOW_HANDLER_KEEP)
+sampling_profiler = SamplingProfiler()
 
 # =========================
 # FastAPI 初始化
 # =========================
-app = FastAPI(title="Inside_Curl Discord Bot")
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    runtime_stats["web_ready_ms"] = elapsed_ms()
+    yield
 
-# 全域變數：追蹤 bot 狀態
-bot_status = {
-    "is_ready": False,
-    "last_check": datetime.datetime.utcnow(),
-    "uptime": 0,
-    "active_sessions": 0
-}
+app = FastAPI(title="Inside_Curl Discord Bot", lifespan=lifespan)
 
-@app.get("/")
-@app.head("/")
-def home():
-    """首頁 - 基本資訊"""
+# 全域變數：追蹤 bot 狀態（bot 端 publish，web 端只讀預先序列化的回應）
+status_board = StatusBoard(is_ready=False, ready_at=None, active_sessions=0, role="starting")
+
+def uptime_seconds(state):
+    return int(time.time() - state["ready_at"]) if state["is_ready"] else 0
+
+def utc_iso(ts=None):
+    return datetime.datetime.utcfromtimestamp(ts if ts is not None else time.time()).isoformat()
+
+@status_board.route("/")
+def home_payload(state):
     return {
         "status": "ok",
         "service": "Inside_Curl Discord Bot",
         "message": "🎧 Discord bot is running smoothly!",
-        "bot_ready": bot_status["is_ready"],
-        "active_voice_sessions": bot_status["active_sessions"],
-        "uptime_seconds": bot_status["uptime"]
+        "bot_ready": state["is_ready"],
+        "role": state["role"],
+        "active_voice_sessions": state["active_sessions"]
+    }, {
+        "uptime_seconds": uptime_seconds(state)
     }
 
+@status_board.route("/health")
+def health_payload(state):
+    return {
+        "status": "healthy",
+        "bot_ready": state["is_ready"],
+        "role": state["role"],
+        "instance": INSTANCE_ID,
+        "active_voice_sessions": state["active_sessions"]
+    }, {
+        "uptime_seconds": uptime_seconds(state),
+        "timestamp": utc_iso()
+    }
+
+@status_board.route("/ping")
+def ping_payload(state):
+    return {"ping": "pong"}, {"timestamp": utc_iso()}
+
+# 佇列深度、執行統計都在時鐘欄位裡，ETag 要涵蓋它們，否則帶 If-None-Match 的監控永遠拿到 304
+@status_board.route("/status", strict_etag=True)
+def status_payload(state):
+    return {
+        "bot_status": "online" if state["is_ready"] else "starting",
+        "role": state["role"],
+        "instance": INSTANCE_ID,
+        "active_voice_sessions": state["active_sessions"],
+        "session_details": len(voice_sessions),
+        "guilds": {str(guild_id): cfg.as_dict() for guild_id, cfg in guild_configs.items()},
+        "shard_ids": SHARD_IDS,
+        "shard_count": SHARD_COUNT
+    }, {
+        "uptime_seconds": uptime_seconds(state),
+        "last_health_check": utc_iso(status_board.last_probe) if status_board.last_probe else None,
+        "log_queue": log_senders.stats(),
+        "shards": shard_status(),
+        "rooms": room_tracker.stats(),
+        "session_store": session_store.stats(),
+        "archive": session_archive.stats() if session_archive is not None else None,
+        "logging": log.stats(),
+        "topics": topic_index.stats(),
+        "topic_canon": topic_canon.stats(),
+        "pending_leaves": leave_timers.stats(),
+        "live_feed": activity_hub.stats(),
+        "display_names": display_names.stats(),
+        "digests": digest_stats,
+        "handlers": handler_monitor.stats(),
+        "shared_snapshot": status_writer.stats() if status_writer is not None else None,
+        "lease": elector.stats() if elector is not None else None,
+        "runtime": runtime_stats
+    }
+
+@app.get("/")
+@app.head("/")
+async def home(request: Request):
+    """首頁 - 基本資訊"""
+    return status_board.respond("/", request)
+
 @app.get("/health")
 @app.head("/health")
-def health():
+async def health(request: Request):
     """健康檢查端點 - 給 UptimeRobot 用 (支援 HEAD 和 GET)"""
-    bot_status["last_check"] = datetime.datetime.utcnow()
-    
-    # 計算運行時間
-    if bot_status["is_ready"]:
-        bot_status["uptime"] = int((datetime.datetime.utcnow() - bot_start_time).total_seconds())
-    
-    return JSONResponse(
-        status_code=200,
-        content={
-            "status": "healthy",
-            "bot_ready": bot_status["is_ready"],
-            "active_voice_sessions": bot_status["active_sessions"],
-            "uptime_seconds": bot_status["uptime"],
-            "timestamp": datetime.datetime.utcnow().isoformat()
-        }
-    )
+    status_board.last_probe = time.time()
+    return status_board.respond("/health", request)
 
 @app.get("/ping")
 @app.head("/ping")
-def ping():
+async def ping(request: Request):
     """簡單的 ping 端點 (支援 HEAD 和 GET)"""
-    return {"ping": "pong", "timestamp": datetime.datetime.utcnow().isoformat()}
+    return status_board.respond("/ping", request)
 
 @app.get("/status")
 @app.head("/status")
-def status():
+async def status(request: Request):
     """詳細狀態 - 用於監控 (支援 HEAD 和 GET)"""
+    return status_board.respond("/status", request)
+
+# 單頁上限；limit=0 代表不分頁、串流全部結果
+HISTORY_MAX_LIMIT = 50000
+
+@app.get("/sessions")
+async def session_history(
+    request: Request,
+    user_id: int = None,
+    topic: str = None,
+    channel_id: int = None,
+    guild_id: int = None,
+    since: str = None,
+    until: str = None,
+    cursor: str = None,
+    limit: int = 1000,
+    format: str = "ndjson"
+):
+    """
+    歷史 session 查詢 - NDJSON / CSV 串流，下一頁 cursor 在 X-Next-Cursor。
+    客戶端送 Accept-Encoding: gzip 時逐塊壓縮（只壓這個端點：全域 GZipMiddleware 會改寫 StatusBoard 重用的快取回應標頭）
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format 只支援 ndjson 或 csv")
+    if limit < 0 or limit > HISTORY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit 需介於 0 ~ {HISTORY_MAX_LIMIT}")
+    try:
+        query = SessionQuery(user_id, topic, channel_id, since, until, cursor, limit, guild_id)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conn = open_readonly(SESSION_DB)
+    try:
+        next_cursor = await asyncio.to_thread(query.next_cursor, conn)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        headers["Vary"] = "Accept-Encoding"
+        if format == "csv":
+            body, media_type = stream_csv(conn, query), "text/csv; charset=utf-8"
+        else:
+            body, media_type = stream_ndjson(conn, query), "application/x-ndjson"
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            body = gzip_stream(body)
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+    except BaseException:
+        # 串流開始後由產生器關閉連線；在那之前失敗（資料庫被鎖、損毀、請求被取消）就在這裡關
+        conn.close()
+        raise
+
+@app.get("/archive")
+async def archive_report(
+    guild_id: int,
+    by: str = None,
+    since: str = None,
+    until: str = None,
+    user_id: int = None,
+    channel_id: int = None,
+    topic: str = None,
+    limit: int = 50
+):
+    """
+    多年歷史的統計（欄式封存）：開始時間在 [since, until) 的總時數，或依 user / channel / topic 分組。
+    最近 ARCHIVE_SEAL_INTERVAL 秒內結束的 session 還沒封存，要逐筆資料請用 /sessions
+    """
+    if session_archive is None:
+        raise HTTPException(status_code=404, detail="沒有啟用 session 封存（ARCHIVE_DIR）")
+    try:
+        since_ts, until_ts = parse_time(since), parse_time(until)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(
+            session_archive.scan, guild_id, by, since_ts, until_ts, user_id, channel_id, topic
+        )
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = {"guild_id": guild_id, "since": since_ts, "until": until_ts}
+    if by is None:
+        body.update(result)
+    else:
+        ranked = sorted(result.items(), key=lambda item: -item[1][0])[:max(0, limit)]
+        body["by"] = by
+        body["groups"] = [
+            {"key": key if by == "topic" else str(key), "seconds": seconds, "sessions": sessions}
+            for key, (seconds, sessions) in ranked
+        ]
+    body["took_ms"] = elapsed_ms(start)
+    return body
+
+@app.get("/digests")
+async def digest_preview(guild_id: int, period: str = "day", date: str = None):
+    """即時計算某個伺服器的學習摘要（JSON）；date 為本地日期，預設是最近一期已結束的週期"""
+    config = guild_configs.get(guild_id)
+    if config is None:
+        raise HTTPException(status_code=404, detail="沒有這個伺服器的設定")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period 只支援 {', '.join(PERIODS)}")
+    tz = resolve_timezone(config.timezone)
+    try:
+        if date:
+            window = window_for(period, datetime.date.fromisoformat(date))
+        else:
+            window = last_completed(tz, period, time.time())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"無法解析日期：{date}")
+    
+    digests = await asyncio.to_thread(
+        digest_job, config.timezone, [guild_id], [window], live_session_rows({guild_id}, time.time()), True
+    )
+    return digests[0]
+
+@app.get("/topics")
+async def topic_totals(guild_id: int, period: str = "week", limit: int = 20):
+    """目前週期各標準主題的學習時間（別名歸併後），附上歸到它的原始寫法"""
+    if guild_id not in guild_configs:
+        raise HTTPException(status_code=404, detail="沒有這個伺服器的設定")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period 只支援 {', '.join(PERIODS)}")
+    topics = topic_canon.guild(guild_id)
     return {
-        "bot_status": "online" if bot_status["is_ready"] else "starting",
-        "active_voice_sessions": bot_status["active_sessions"],
-        "session_details": len(voice_sessions),
-        "uptime_seconds": bot_status["uptime"],
-        "last_health_check": bot_status["last_check"].isoformat()
+        "guild_id": guild_id,
+        "period": period,
+        "subjects": [
+            {
+                "topic": subject,
+                "seconds": seconds,
+                "sessions": sessions,
+                "spellings": sorted(topics.members.get(fold(subject) or subject.casefold(), ()))
+            }
+            for subject, seconds, sessions in rollup_engine.top(guild_id, "subject", period, time.time(), limit)
+        ]
     }
 
+# 即時動態串流：每個訂閱者最多暫存幾筆事件，超過就改送快照
+LIVE_BUFFER = int(os.getenv("LIVE_BUFFER", 256))
+activity_hub = BroadcastHub(buffer_size=LIVE_BUFFER)
+
+@app.get("/live")
+async def live_feed():
+    """
+    語音動態 SSE 串流：連上先收到目前在線快照，之後是 open / topic / move / close 事件，
+    以及 room 事件（房間第一個人進來 open、最後一個人離開 empty、人數新高 peak）
+    """
+    return StreamingResponse(
+        activity_hub.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/rooms")
+async def room_occupancy(guild_id: int, channel_id: int = None):
+    """
+    沒給 channel_id：這個伺服器目前有人的語音頻道（人數、開始有人的時間、期間最高人數）。
+    有給：該頻道的佔用時間序列（每 ROOM_BUCKET_SECONDS 一桶：有人的秒數、平均人數、最高人數）
+    """
+    if guild_id not in guild_configs:
+        raise HTTPException(status_code=404, detail="沒有這個伺服器的設定")
+    if channel_id is None:
+        return {"guild_id": guild_id, "rooms": room_tracker.occupied(guild_id)}
+    if room_tracker.guild_of(channel_id) not in (None, guild_id):
+        raise HTTPException(status_code=404, detail="這個頻道不屬於該伺服器")
+    return {
+        "guild_id": guild_id,
+        "channel_id": channel_id,
+        "bucket_seconds": room_tracker.bucket_seconds,
+        "room": room_tracker.room(channel_id),
+        "series": room_tracker.series(channel_id)
+    }
+
+# /debug/* 需要帶 X-Debug-Token（或 Authorization: Bearer）；沒設定 DEBUG_TOKEN 就整組關閉
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+PROFILE_MAX_SECONDS = 60
+
+def require_debug_token(request):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("X-Debug-Token", "")
+    authorization = request.headers.get("Authorization", "")
+    if not supplied and authorization.startswith("Bearer "):
+        supplied = authorization[7:]
+    if not hmac.compare_digest(supplied.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="需要有效的 debug token")
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 5.0, interval_ms: float = 5.0):
+    """取樣 seconds 秒所有執行緒的堆疊，回傳 collapsed 格式（可直接餵給 flamegraph.pl / speedscope）"""
+    require_debug_token(request)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds 需介於 0 ~ {PROFILE_MAX_SECONDS}")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms 需介於 1 ~ 1000")
+    if sampling_profiler.busy:
+        raise HTTPException(status_code=409, detail="已有分析在進行中")
+    try:
+        samples, counts = await asyncio.to_thread(sampling_profiler.run, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    log.info("debug.profiled", f"🔬 取樣分析 {seconds}s，{samples} 次取樣", seconds=seconds, samples=samples)
+    return PlainTextResponse(collapsed(counts), headers={"X-Profile-Samples": str(samples)})
+
+@app.get("/debug/slow")
+async def debug_slow(request: Request):
+    """各事件處理器 / 指令的耗時統計，以及最近的慢處理與當時的堆疊"""
+    require_debug_token(request)
+    return handler_monitor.report()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 文字格式的監控指標"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# 多行程健康檢查：bot 每 STATUS_PUBLISH_INTERVAL 秒把 / /health /ping /status 的內容發布到共享記憶體，
+# 並啟動 STATUS_WORKERS 個獨立的 uvicorn worker（status_worker.py）在 STATUS_PORT 上直接讀。
+# 只設定 STATUS_SHM、不設 STATUS_WORKERS 時只發布，worker 由外部自行啟動
+STATUS_WORKERS = int(os.getenv("STATUS_WORKERS", 0))
+STATUS_PORT = int(os.getenv("STATUS_PORT", PORT + 1))
+STATUS_SHM = os.getenv("STATUS_SHM", "") or (default_snapshot_path(PORT) if STATUS_WORKERS else "")
+STATUS_PUBLISH_INTERVAL = float(os.getenv("STATUS_PUBLISH_INTERVAL", 1.0))
+status_writer = None
+status_workers = None
+if STATUS_SHM:
+    try:
+        status_writer = SnapshotWriter(STATUS_SHM)
+    except OSError as e:
+        log.error("config.invalid", f"❌ 無法建立共享狀態快照 {STATUS_SHM}: {e}")
+        exit(1)
+
+async def publish_status_loop():
+    """定期發布快照；worker 收到的 /health 探測時間併回本行程的 last_probe"""
+    while True:
+        probe = status_writer.last_probe
+        if probe and probe > (status_board.last_probe or 0):
+            status_board.last_probe = probe
+        try:
+            if not status_writer.publish(dumps(status_board.export())) and status_writer.oversized == 1:
+                log.warning(
+                    "status.snapshot_oversized", f"⚠️  狀態快照超過 {status_writer.capacity} bytes，worker 會看到舊資料",
+                    capacity=status_writer.capacity
+                )
+        except Exception:
+            log.exception("status.publish_failed", "❌ 發布狀態快照失敗")
+        await asyncio.sleep(STATUS_PUBLISH_INTERVAL)
+
+def start_status_workers():
+    global status_workers
+    if not STATUS_WORKERS or status_workers is not None:
+        return
+    status_workers = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "status_worker:app", "--host", "0.0.0.0",
+            "--port", str(STATUS_PORT), "--workers", str(STATUS_WORKERS), "--log-level", "warning"
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "STATUS_SHM": STATUS_SHM}
+    )
+    log.info(
+        "status.workers_started", f"🌐 {STATUS_WORKERS} 個狀態 worker 啟動於 Port {STATUS_PORT}",
+        workers=STATUS_WORKERS, port=STATUS_PORT, pid=status_workers.pid
+    )
+
+def stop_status_workers():
+    global status_workers
+    if status_workers is None:
+        return
+    status_workers.terminate()
+    try:
+        status_workers.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        status_workers.kill()
+        status_workers.wait()
+    status_workers = None
+
 def run_web():
     """啟動 FastAPI Web Service"""
-    port = int(os.environ.get("PORT", 10000))
-    print(f"🌐 FastAPI 啟動於 Port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
+    log.info("web.start", f"🌐 FastAPI 啟動於 Port {PORT}", port=PORT)
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="warning", timeout_graceful_shutdown=5)
 
 # =========================
 # Discord Bot 設定
 # =========================
 TOKEN = os.environ.get('DISCORD_BOT_TOKEN')
+# 單一伺服器的舊設定；多伺服器用 GUILD_CONFIG（JSON 字串或檔案路徑）
 GUILD_ID = int(os.getenv("GUILD_ID", 0))
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", 0))
+# 離開後幾秒內重新加入視為同一個 session（0 = 立即結算）；各伺服器可用 leave_grace 覆蓋
+VOICE_LEAVE_GRACE = float(os.getenv("VOICE_LEAVE_GRACE", 30))
+# 學習摘要依這個時區切日；各伺服器可用 timezone 覆蓋
+DIGEST_TIMEZONE = os.getenv("DIGEST_TIMEZONE", "UTC")
 
-if not TOKEN or GUILD_ID == 0 or LOG_CHANNEL_ID == 0:
-    print("❌ 錯誤：請設定 DISCORD_BOT_TOKEN、GUILD_ID 和 LOG_CHANNEL_ID")
+try:
+    guild_configs = load_guild_configs(
+        os.getenv("GUILD_CONFIG", ""), GUILD_ID, LOG_CHANNEL_ID, VOICE_LEAVE_GRACE, DIGEST_TIMEZONE
+    )
+except (OSError, ValueError) as e:
+    log.error("config.invalid", f"❌ 伺服器設定錯誤: {e}")
     exit(1)
 
+if not TOKEN or not guild_configs:
+    log.error("config.missing", "❌ 錯誤：請設定 DISCORD_BOT_TOKEN，以及 GUILD_CONFIG 或 GUILD_ID 和 LOG_CHANNEL_ID")
+    exit(1)
+
+# 分片：不設定就由 discord.py 自動決定；分成多個行程時每個行程設定自己的 SHARD_IDS
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0)) or None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+if SHARD_IDS and not SHARD_COUNT:
+    log.error("config.invalid", "❌ 設定 SHARD_IDS 時也必須設定 SHARD_COUNT")
+    exit(1)
+
+# 精簡快取模式：只快取在語音中的成員、不在啟動時 chunk 整個伺服器、
+# 不要 members / message_content 特權 intent；其他人的顯示名稱用到時再取
+LEAN_CACHE = os.getenv("LEAN_CACHE", "false").lower() in ("1", "true", "yes")
+runtime_stats["lean_cache"] = LEAN_CACHE
+
 intents = discord.Intents.default()
 intents.voice_states = True
 intents.guilds = True
-intents.members = True
-intents.message_content = True
+intents.members = not LEAN_CACHE
+intents.message_content = not LEAN_CACHE
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-voice_sessions = {}
-bot_start_time = None
+if LEAN_CACHE:
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+else:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+# 記錄頻道發送佇列：合併視窗（秒）與佇列上限
+LOG_BATCH_WINDOW = float(os.getenv("LOG_BATCH_WINDOW", 1.5))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", 500))
+# session 持久化：SQLite 路徑、批次寫入間隔（秒）、幾筆 journal 後做一次快照
+SESSION_DB = os.getenv("SESSION_DB", "inside_curl.db")
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 1.0))
+SESSION_COMPACT_EVERY = int(os.getenv("SESSION_COMPACT_EVERY", 2000))
+# /record 主題自動完成：最多快取幾位用戶的主題索引
+TOPIC_USER_CACHE = int(os.getenv("TOPIC_USER_CACHE", 2000))
+# 學習摘要：要發哪些週期（day / week / month，空字串停用）；
+# 週期結束後等幾秒才彙總，讓寬限期內的離開結算完、寫入 SQLite（應大於 leave_grace）
+DIGEST_PERIODS = [p.strip() for p in os.getenv("DIGEST_PERIODS", "day,week").split(",") if p.strip()]
+DIGEST_DELAY = float(os.getenv("DIGEST_DELAY", 120))
+if any(period not in PERIODS for period in DIGEST_PERIODS):
+    log.error("config.invalid", f"❌ DIGEST_PERIODS 只支援 {', '.join(PERIODS)}")
+    exit(1)
+# 房間佔用時間序列：每個時間桶幾秒、保留幾個桶（預設一小時一桶、保留一週）
+ROOM_BUCKET_SECONDS = int(os.getenv("ROOM_BUCKET_SECONDS", 3600))
+ROOM_KEEP_BUCKETS = int(os.getenv("ROOM_KEEP_BUCKETS", 168))
+# 已結束 session 的欄式封存（多年歷史的 /archive 報表）：目錄（空字串停用）、每個 segment 最多幾列、最久幾秒封存一次
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", f"{SESSION_DB}.archive")
+ARCHIVE_SEGMENT_ROWS = int(os.getenv("ARCHIVE_SEGMENT_ROWS", 65536))
+ARCHIVE_SEAL_INTERVAL = float(os.getenv("ARCHIVE_SEAL_INTERVAL", 60))
+# 主備切換：LEASE_BACKEND=sqlite / file 時可以同時跑多個實例（共用同一個 SESSION_DB），
+# 持有租約的是 leader；其餘是 standby：保持 gateway 連線、持續讀 leader 寫入的 journal，leader 停止後幾秒內接手。
+# none（預設）= 只有一個實例，永遠是 leader
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "none").lower()
+LEASE_PATH = os.getenv("LEASE_PATH", "") or SESSION_DB
+LEASE_TTL = float(os.getenv("LEASE_TTL", 6))
+LEASE_RETRY = float(os.getenv("LEASE_RETRY", 1))
+STANDBY_FOLLOW_INTERVAL = float(os.getenv("STANDBY_FOLLOW_INTERVAL", 2))
+INSTANCE_ID = os.getenv("INSTANCE_ID", "") or f"{socket.gethostname()}:{os.getpid()}"
+if LEASE_BACKEND not in ("none", "sqlite", "file"):
+    log.error("config.invalid", "❌ LEASE_BACKEND 只支援 none / sqlite / file")
+    exit(1)
+
+
+class InstrumentedTree(app_commands.CommandTree):
+    """記錄每個 slash 指令（含 autocomplete）的處理時間，慢的記下堆疊"""
+
+    async def _call(self, interaction):
+        if not is_serving():
+            # standby 不回應，交給 leader
+            return
+        name = (interaction.data or {}).get("name", "unknown")
+        if interaction.type is discord.InteractionType.autocomplete:
+            name += ":autocomplete"
+        await handler_monitor.track(name, super()._call(interaction), COMMAND_SECONDS)
+
+
+class InsideCurlBot(commands.AutoShardedBot):
+    def event(self, coro):
+        """每個 @bot.event 處理器都包上計時與慢處理偵測"""
+        name = coro.__name__
+        
+        @functools.wraps(coro)
+        async def monitored(*args, **kwargs):
+            return await handler_monitor.track(name, coro(*args, **kwargs), EVENT_SECONDS)
+        
+        return super().event(monitored)
+    
+    async def setup_hook(self):
+        # 讀回上次關機前仍開著的 session，等 on_ready 與語音頻道對帳
+        load_persisted_state()
+        session_store.start()
+        if session_archive is not None:
+            session_archive.start()
+        leave_timers.start()
+        handler_monitor.start()
+        self.lag_monitor = asyncio.create_task(monitor_loop_lag())
+        self.digest_task = asyncio.create_task(digest_loop()) if DIGEST_PERIODS else None
+        self.status_task = asyncio.create_task(publish_status_loop()) if status_writer is not None else None
+        self.follow_task = None
+        if elector is not None:
+            elector.start()
+            self.follow_task = asyncio.create_task(follow_leader_loop())
+        status_board.publish(role="leader" if elector is None else "standby")
+        start_status_workers()
+
+    async def close(self):
+        activity_hub.close()
+        if getattr(self, "digest_task", None) is not None:
+            self.digest_task.cancel()
+        if getattr(self, "follow_task", None) is not None:
+            self.follow_task.cancel()
+        if getattr(self, "status_task", None) is not None:
+            self.status_task.cancel()
+        await asyncio.to_thread(stop_status_workers)
+        # 寬限期內的離開直接結算，再把佇列中的通知送完才斷線
+        await leave_timers.close()
+        for key, pending in leave_timers.pop_all():
+            finish_leave(key, pending)
+        await log_senders.close()
+        await asyncio.to_thread(session_store.close)
+        if session_archive is not None:
+            await asyncio.to_thread(session_archive.close)
+        # 通知與寫入都收尾後才釋放租約，standby 接手時看到的是完整的狀態
+        if elector is not None:
+            await elector.close()
+        with topic_reader_lock:
+            if topic_reader is not None:
+                topic_reader.close()
+        handler_monitor.close()
+        await super().close()
+
+
+bot = InsideCurlBot(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=not LEAN_CACHE,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    tree_cls=InstrumentedTree
+)
+# 主備切換的租約（LEASE_BACKEND=none 時為 None）；每組分片各自一份租約
+elector = None
+
+def is_leader():
+    """持有租約：可以寫資料庫、發記錄頻道通知"""
+    return elector is None or elector.is_leader
+
+def is_serving():
+    """leader 且接手時的載入與對帳已完成：可以處理語音事件與指令"""
+    return elector is None or elector.serving
+
+# 不在快取裡的成員名稱（精簡模式下排行榜上不在語音的人）
+display_names = DisplayNameCache(ttl=float(os.getenv("NAME_CACHE_TTL", 600)))
+log_senders = LogSenderPool(
+    lambda guild_id: bot.get_channel(guild_configs[guild_id].log_channel_id),
+    window=LOG_BATCH_WINDOW,
+    maxsize=LOG_QUEUE_MAX,
+    send_latency=LOG_SEND_SECONDS,
+    can_send=is_leader
+)
+session_archive = None
+if ARCHIVE_DIR:
+    try:
+        session_archive = SessionArchive(
+            ARCHIVE_DIR,
+            # 分片行程各自負責不同的伺服器，各自一份 manifest
+            manifest="MANIFEST" if not SHARD_IDS else f"MANIFEST.{SHARD_COUNT}-{'-'.join(str(i) for i in SHARD_IDS)}",
+            segment_rows=ARCHIVE_SEGMENT_ROWS,
+            seal_interval=ARCHIVE_SEAL_INTERVAL,
+            fence=is_leader
+        )
+    except (OSError, ValueError, ArchiveError) as e:
+        log.error("config.invalid", f"❌ 無法開啟 session 封存 {ARCHIVE_DIR}: {e}")
+        exit(1)
+session_store = SessionStore(
+    SESSION_DB,
+    flush_interval=SESSION_FLUSH_INTERVAL,
+    compact_every=SESSION_COMPACT_EVERY,
+    shard_ids=SHARD_IDS,
+    shard_count=SHARD_COUNT,
+    legacy_guild_id=GUILD_ID,
+    fence=is_leader,
+    archive=session_archive
+)
+rollup_engine = RollupEngine()
+topic_reader = None
+
+def on_room_event(kind, guild_id, channel_id, **fields):
+    """房間層級事件：頻道名稱取自 gateway 快取，不呼叫 API"""
+    ROOM_EVENTS.inc(kind)
+    channel = bot.get_channel(channel_id)
+    channel_name = channel.name if channel else str(channel_id)
+    activity_hub.publish_room(kind, guild_id, channel_id, channel_name=channel_name, **fields)
+    log.debug(
+        f"room.{kind}", f"🚪 {channel_name}: {kind}（{fields['count']} 人）",
+        guild_id=guild_id, channel_id=channel_id, **fields
+    )
+
+room_tracker = RoomTracker(ROOM_BUCKET_SECONDS, ROOM_KEEP_BUCKETS, on_event=on_room_event)
+# 進出與換頻道都經過 SessionTable，房間索引與人數事件跟著更新
+voice_sessions = SessionTable(listener=room_tracker.update)
+restored_sessions = {}
+restored_last_alive = None
+# 上次成功同步的指令定義 hash（存在 SQLite meta）
+synced_command_hash = None
+# 各分片的斷線時間 shard_id -> (牆上時間, perf_counter)，重連後用來結算與量測
+disconnected_at = {}
+# 各分片的就緒耗時與重連 / RESUME 次數
+shard_stats = {}
+# 已發過的摘要 (guild_id, period) -> bucket（存在 SQLite meta，重啟不重發）
+digest_posted = {}
+digest_stats = {"runs": 0, "posted": 0, "last_run": None, "last_ms": None}
+
+metrics.gauge("inside_curl_gateway_latency_seconds", "Discord gateway heartbeat latency", lambda: bot.latency)
+metrics.gauge("inside_curl_event_loop_lag_seconds", "Event loop lag", lambda: runtime_stats["loop_lag_ms"] / 1000)
+metrics.gauge("inside_curl_resident_memory_bytes", "Resident set size", resident_memory_bytes)
+metrics.gauge("inside_curl_active_sessions", "Tracked voice sessions", lambda: len(voice_sessions))
+metrics.gauge("inside_curl_occupied_rooms", "Voice channels with at least one tracked member", lambda: len(voice_sessions.rooms()))
+metrics.gauge("inside_curl_log_queue_depth", "Pending log channel notices", lambda: log_senders.depth)
+metrics.gauge("inside_curl_pending_leaves", "Leaves waiting out the rejoin grace window", lambda: len(leave_timers))
+metrics.gauge("inside_curl_is_leader", "1 if this instance holds the lease and serves events", lambda: int(is_serving()))
 
 # =========================
-# Discord 事件處理
+# 工具函式
 # =========================
-@bot.event
-async def on_ready():
-    global bot_start_time
-    bot_start_time = datetime.datetime.utcnow()
+def format_duration(total_seconds):
+    """秒數 -> 1h2m3s 格式"""
+    hours, remainder = divmod(int(total_seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
     
-    print(f"✅ 已登入：{bot.user}")
-    print(f"📡 伺服器 ID: {GUILD_ID}")
-    print(f"📝 記錄頻道 ID: {LOG_CHANNEL_ID}")
+    time_parts = []
+    if hours > 0:
+        time_parts.append(f"{hours}h")
+    if minutes > 0:
+        time_parts.append(f"{minutes}m")
+    if seconds > 0 or not time_parts:
+        time_parts.append(f"{seconds}s")
+    return ''.join(time_parts)
+
+topic_reader_lock = threading.Lock()
+
+def load_user_topics(guild_id, user_id):
+    """主題索引沒命中時讀歷史表（在背景執行緒跑；唯讀連線，與背景寫入執行緒分開，同時只給一個執行緒用）"""
+    global topic_reader
+    with topic_reader_lock:
+        if topic_reader is None:
+            topic_reader = open_readonly(SESSION_DB)
+        return user_topics(topic_reader, guild_id, user_id)
+
+topic_index = TopicIndex(load_user_topics, user_capacity=TOPIC_USER_CACHE)
+# 主題歸併：原始寫法 -> 標準主題，以及管理員設定的別名
+topic_canon = TopicCanon()
+
+async def monitor_loop_lag(interval=0.5):
+    """量測 event loop 延遲：sleep 實際多睡了多久"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = (time.perf_counter() - start - interval) * 1000
+        runtime_stats["loop_lag_ms"] = round(lag, 3)
+        runtime_stats["loop_lag_max_ms"] = max(runtime_stats["loop_lag_max_ms"], round(lag, 3))
+
+def close_session(guild_id, user_id, topic, channel_id, start_ts, end_ts):
+    """結束 session：寫入 journal 與歷史表，並累加到統計"""
+    session_store.close_session(guild_id, user_id, end_ts)
+    session_store.add_completed(guild_id, user_id, channel_id, topic, start_ts, end_ts)
+    session_store.add_rollups(rollup_engine.add_session(
+        guild_id, user_id, topic, channel_id, start_ts, end_ts, topic_canon.canonical(guild_id, topic)
+    ))
+
+def publish_open(user_id, name, session, channel_name):
+    """即時動態：開始或接回 session（帶完整資料，訂閱端可直接覆蓋）"""
+    activity_hub.publish(
+        "open", session.guild_id, user_id, name=name, channel_id=session.channel_id,
+        channel_name=channel_name, topic=session.topic, join_ts=session.join_ts
+    )
+
+def reconcile_voice_state(guild, ended_at):
+    """
+    比對 Discord 上的即時語音狀態與追蹤中的 session，只處理不一致的部分：
+    不在語音的就結算、新出現的就開始追蹤（優先沿用重啟前的紀錄）、換了頻道的就更新。
+    """
+    live = {}
+    for voice_channel in guild.voice_channels:
+        for member in voice_channel.members:
+            if not member.bot:
+                live[member.id] = voice_channel
+                # info 等級、依事件取樣（LOG_SAMPLE 預設每 20 人留 1 行）
+                log.info(
+                    "voice.reconcile_member", f"👤 {member.display_name} 在 {voice_channel.name}",
+                    guild_id=guild.id, user_id=member.id, channel_id=voice_channel.id
+                )
     
-    # 檢查啟動時已在語音頻道的用戶（不發送訊息）
-    guild = bot.get_guild(GUILD_ID)
-    if guild:
-        print(f"🔍 檢查伺服器「{guild.name}」")
-        user_count = 0
-        for voice_channel in guild.voice_channels:
-            for member in voice_channel.members:
-                if not member.bot and member.id not in voice_sessions:
-                    voice_sessions[member.id] = {
-                        "join_time": datetime.datetime.utcnow(),
-                        "topic": None,
-                        "channel_name": voice_channel.name
-                    }
-                    print(f"   👤 {member.display_name} 在 {voice_channel.name}")
-                    user_count += 1
+    counts = {"opened": 0, "restored": 0, "moved": 0, "closed": 0}
+    
+    # 追蹤中但已不在語音：斷線期間離開，以斷線時間結算
+    gone = [key for key in voice_sessions if key[0] == guild.id and key[1] not in live]
+    for key in gone:
+        session = voice_sessions.close(key)
+        end_ts = max(session.join_ts, ended_at)
+        close_session(guild.id, key[1], session.topic, session.channel_id, session.join_ts, end_ts)
+        activity_hub.publish("close", guild.id, key[1])
+        counts["closed"] += 1
+    
+    for user_id, voice_channel in live.items():
+        key = (guild.id, user_id)
+        session = voice_sessions.get(key)
+        if session is not None:
+            if voice_sessions.move(key, voice_channel.id) is not None:
+                session_store.move(guild.id, user_id, voice_channel.id, voice_channel.name)
+                counts["moved"] += 1
+            continue
         
-        bot_status["active_sessions"] = len(voice_sessions)
+        pending = leave_timers.cancel(key)
+        if pending is not None:
+            # 斷線前剛離開、寬限期內又回來：接回原本的 session
+            moved = pending[0].channel_id != voice_channel.id
+            voice_sessions.reopen(key, pending[0], voice_channel.id)
+            if moved:
+                session_store.move(guild.id, user_id, voice_channel.id, voice_channel.name)
+            counts["restored"] += 1
+            continue
         
-        if user_count == 0:
-            print("   ℹ️  目前無人在語音頻道")
+        saved = restored_sessions.pop(key, None)
+        if saved:
+            # 重啟前就在的人：沿用原本的加入時間與主題
+            voice_sessions.open(key, voice_channel.id, join_ts=saved["join_ts"], topic=saved["topic"])
+            if saved["channel_id"] != voice_channel.id:
+                session_store.move(guild.id, user_id, voice_channel.id, voice_channel.name)
+            counts["restored"] += 1
         else:
-            print(f"   ✅ 追蹤 {user_count} 位用戶")
+            session = voice_sessions.open(key, voice_channel.id)
+            session_store.open_session(
+                guild.id, user_id, session.join_ts, voice_channel.id, voice_channel.name
+            )
+            counts["opened"] += 1
     
-    # 同步 Slash 指令
-    print("\n🔄 同步指令中...")
+    # 對帳後整份重新發布，斷線期間的變化一次補給訂閱端
+    for user_id, voice_channel in live.items():
+        member = guild.get_member(user_id)
+        name = member.display_name if member else str(user_id)
+        publish_open(user_id, name, voice_sessions.get((guild.id, user_id)), voice_channel.name)
+    
+    # 重啟期間已經離開的人：以上次存活時間結算（只處理這個伺服器的）
+    for key in [key for key in restored_sessions if key[0] == guild.id]:
+        saved = restored_sessions.pop(key)
+        end_ts = max(saved["join_ts"], restored_last_alive or time.time())
+        close_session(
+            guild.id, key[1], saved["topic"], saved["channel_id"], saved["join_ts"], end_ts
+        )
+        activity_hub.publish("close", guild.id, key[1])
+        counts["closed"] += 1
+    
+    status_board.publish(active_sessions=len(voice_sessions))
+    return len(live), counts
+
+def load_persisted_state():
+    """
+    從 SQLite 讀回啟動 / 接手需要的狀態：仍開著的 session、目前週期的統計、主題索引、已發過的摘要。
+    新的物件全部建好才換上，standby 接手時可以放在背景執行緒跑。
+    接手時 session_store 的寫入執行緒已經在寫心跳，讀取一律走另一條唯讀連線，不和它共用寫入連線。
+    """
+    global restored_last_alive, synced_command_hash, rollup_engine, topic_index, topic_canon, digest_posted
+    # standby 的 follow() 已經讀過大部分 journal，這裡只補最後一段
+    last_alive, sessions = session_store.follow() if elector is not None else session_store.load()
+    conn = open_readonly(SESSION_DB)
     try:
-        guild_obj = discord.Object(id=GUILD_ID)
-        synced = await bot.tree.sync(guild=guild_obj)
-        print(f"✅ 同步成功: {len(synced)} 個指令")
-        
-        if len(synced) == 0:
-            print("⚠️  伺服器同步失敗，嘗試全域同步...")
-            synced = await bot.tree.sync()
-            print(f"✅ 全域同步: {len(synced)} 個指令")
-            
-    except discord.HTTPException as e:
-        print(f"❌ HTTP錯誤: {e.status} - {e.text}")
+        rollups = RollupEngine()
+        rollups.load_rows(session_store.load_rollups(rollups.current_buckets(time.time()), conn))
+        topic_rows = session_store.load_topics(conn)
+        topics = TopicIndex(load_user_topics, user_capacity=TOPIC_USER_CACHE)
+        topics.load_guild_rows(topic_rows)
+        canon = TopicCanon()
+        canon.load(topic_rows, *session_store.load_topic_canon(conn))
+        posted = {}
+        for guild_id in guild_configs:
+            for period in DIGEST_PERIODS:
+                bucket = session_store.get_meta(f"digest:{guild_id}:{period}", conn)
+                if bucket:
+                    posted[(guild_id, period)] = bucket
+        synced_command_hash = session_store.get_meta("command_hash", conn)
+    finally:
+        conn.close()
+    restored_sessions.clear()
+    restored_sessions.update(sessions)
+    restored_last_alive = last_alive
+    rollup_engine, topic_index, topic_canon, digest_posted = rollups, topics, canon, posted
+
+async def take_over():
+    """
+    取得租約：讀回舊 leader 最後寫入的狀態，和 gateway 快取裡的語音狀態對帳
+    （standby 一直連著 gateway，快取是新的），完成後才開始處理事件。
+    舊 leader 停止後才離開的人以它的最後存活時間結算，期間加入的人直接開始追蹤，都不發通知。
+    """
+    await bot.wait_until_ready()
+    await asyncio.to_thread(load_persisted_state)
+    voice_sessions.clear()
+    room_tracker.clear()
+    for guild in bot.guilds:
+        if guild.id not in guild_configs:
+            continue
+        live_count, counts = reconcile_voice_state(guild, time.time())
+        log.info(
+            "voice.reconciled", f"🔍 接手伺服器「{guild.name}」: 語音中 {live_count} 人",
+            guild_id=guild.id, live=live_count, takeover=True, **counts
+        )
+    await sync_commands()
+    status_board.publish(role="leader", active_sessions=len(voice_sessions))
+
+async def step_down():
+    """失去租約：記憶體中的狀態全部丟掉（新 leader 以資料庫為準），回到 standby"""
+    leave_timers.pop_all()
+    voice_sessions.clear()
+    room_tracker.clear()
+    restored_sessions.clear()
+    # /live 不再列出舊的在線名單；重新接手時由對帳整份重新發布
+    activity_hub.reset()
+    status_board.publish(role="standby", active_sessions=0)
+
+async def follow_leader_loop():
+    """standby 定期讀 leader 寫入的 journal，接手時只需要補最後幾秒"""
+    while True:
+        await asyncio.sleep(STANDBY_FOLLOW_INTERVAL)
+        if elector.leader:
+            continue
         try:
-            synced = await bot.tree.sync()
-            print(f"✅ 全域同步成功: {len(synced)} 個指令")
-        except Exception as e2:
-            print(f"❌ 全域同步也失敗: {e2}")
+            _, sessions = await asyncio.to_thread(session_store.follow)
+        except Exception as e:
+            log.warning("standby.follow_failed", f"⚠️  讀取 leader 的 session journal 失敗: {e}")
+            continue
+        if not elector.leader:
+            status_board.publish(active_sessions=len(sessions))
+
+if LEASE_BACKEND != "none":
+    lease_name = "leader" if not SHARD_IDS else f"leader:{SHARD_COUNT}:{','.join(str(i) for i in SHARD_IDS)}"
+    try:
+        if LEASE_BACKEND == "sqlite":
+            lease_backend = SqliteLease(LEASE_PATH, lease_name, timeout=LEASE_TTL / 3)
+        else:
+            lease_backend = FileLease(LEASE_PATH, lease_name)
+    except (OSError, sqlite3.Error) as e:
+        log.error("config.invalid", f"❌ 無法建立租約 {LEASE_BACKEND}:{LEASE_PATH}: {e}")
+        exit(1)
+    elector = LeaderElector(
+        lease_backend, INSTANCE_ID, ttl=LEASE_TTL, retry=LEASE_RETRY, on_promote=take_over, on_demote=step_down
+    )
+
+def command_tree_hash():
+    """目前指令定義（全域 + 各伺服器專屬）的 hash"""
+    payload = {
+        "global": [c.to_dict(bot.tree) for c in bot.tree.get_commands()],
+        "guilds": {
+            str(guild_id): [c.to_dict(bot.tree) for c in bot.tree.get_commands(guild=discord.Object(id=guild_id))]
+            for guild_id in sorted(guild_configs)
+        }
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def sync_commands():
+    """指令定義有變才同步，避免每次啟動 / 重連都耗掉有速率限制的 API 呼叫"""
+    global synced_command_hash
+    current = command_tree_hash()
+    if current == synced_command_hash:
+        log.info("commands.sync_skipped", "✅ 指令定義未變更，略過同步")
+        return
+    
+    log.info("commands.sync", "🔄 同步指令中...")
+    try:
+        for guild_id in guild_configs:
+            guild_obj = discord.Object(id=guild_id)
+            if bot.tree.get_commands(guild=guild_obj):
+                synced = await bot.tree.sync(guild=guild_obj)
+                log.info(
+                    "commands.synced", f"✅ 伺服器同步: {len(synced)} 個指令",
+                    scope="guild", guild_id=guild_id, count=len(synced)
+                )
+        synced = await bot.tree.sync()
+        log.info("commands.synced", f"✅ 全域同步: {len(synced)} 個指令", scope="global", count=len(synced))
+    except discord.HTTPException as e:
+        log.error("commands.sync_failed", f"❌ HTTP錯誤: {e.status} - {e.text}", status=e.status)
+        return
     except Exception as e:
-        print(f"❌ 同步失敗: {e}")
+        log.error("commands.sync_failed", f"❌ 同步失敗: {e}")
+        return
     
-    bot_status["is_ready"] = True
-    print("✨ 機器人就緒！\n")
+    synced_command_hash = current
+    session_store.set_meta("command_hash", current)
+
+def guilds_on_shard(shard_id):
+    """這個分片上、有設定的伺服器"""
+    guilds = []
+    for guild_id in guild_configs:
+        guild = bot.get_guild(guild_id)
+        if guild is not None and guild.shard_id == shard_id:
+            guilds.append(guild)
+    return guilds
+
+def shard_status():
+    """/status 用：每個分片的連線狀態、延遲、伺服器數與 session 數"""
+    count = bot.shard_count or 1
+    sessions, guilds = {}, {}
+    for guild_id, _ in list(voice_sessions):
+        shard_id = shard_of(guild_id, count)
+        sessions[shard_id] = sessions.get(shard_id, 0) + 1
+    for guild_id in guild_configs:
+        shard_id = shard_of(guild_id, count)
+        guilds[shard_id] = guilds.get(shard_id, 0) + 1
+    result = {}
+    for shard_id, shard in list(bot.shards.items()):
+        latency = shard.latency
+        result[str(shard_id)] = {
+            "connected": not shard.is_closed(),
+            "latency_ms": round(latency * 1000, 1) if latency == latency and latency != float("inf") else None,
+            "guilds": guilds.get(shard_id, 0),
+            "sessions": sessions.get(shard_id, 0),
+            **shard_stats.get(shard_id, {})
+        }
+    return result
+
+# =========================
+# 學習摘要
+# =========================
+DIGEST_TITLES = {"day": "📅 每日學習摘要", "week": "🗓️ 每週學習摘要", "month": "📆 每月學習摘要"}
+# embed 最多 25 個欄位，頻道只列時間最多的幾個
+DIGEST_MAX_CHANNELS = 12
+
+def digest_job(timezone, guild_ids, windows, live, empty=False):
+    """在背景執行緒跑：自己開唯讀連線，彙總完就關掉"""
+    conn = open_readonly(SESSION_DB)
+    try:
+        return compute_digests(
+            conn, resolve_timezone(timezone), guild_ids, windows, live, empty, topic_canon.canonical
+        )
+    finally:
+        conn.close()
+
+def live_session_rows(guild_ids, now):
+    """還沒結束的 session 也算進摘要（到 now 為止的部分）"""
+    rows = []
+    for (guild_id, user_id), session in list(voice_sessions.items()):
+        if guild_id in guild_ids:
+            rows.append((
+                -len(rows) - 1, guild_id, user_id, session.channel_id, session.topic, session.join_ts, now
+            ))
+    return rows
+
+def digest_embed(digest):
+    embed = discord.Embed(
+        title=f"{DIGEST_TITLES[digest['period']]}　{digest['bucket']}",
+        description=(
+            f"⏱️ 總學習時間 **{format_duration(digest['seconds'])}**"
+            f"　👥 {digest['active_users']} 人"
+        ),
+        timestamp=datetime.datetime.fromtimestamp(digest["end_ts"], datetime.timezone.utc)
+    )
+    embed.add_field(name="🏆 學習之星", inline=False, value="\n".join(
+        f"`{i}.` <@{user_id}>　{format_duration(seconds)}"
+        for i, (user_id, seconds) in enumerate(digest["top_users"], start=1)
+    ))
+    if digest["top_topics"]:
+        embed.add_field(name="📚 熱門主題", inline=False, value="\n".join(
+            f"**{topic}**　{format_duration(seconds)}" for topic, seconds in digest["top_topics"]
+        ))
+    embed.add_field(name="🔥 最長的一次", inline=False, value="\n".join(
+        f"<@{s['user_id']}> 在 <#{s['channel_id']}> {format_duration(s['seconds'])}"
+        + (f"（{s['topic']}）" if s["topic"] else "")
+        for s in digest["longest"]
+    ))
+    for channel in digest["channels"][:DIGEST_MAX_CHANNELS]:
+        value = f"<#{channel['channel_id']}>\n{format_duration(channel['seconds'])}・{channel['active_users']} 人"
+        if channel["top_topics"]:
+            value += f"\n📚 {channel['top_topics'][0][0]}"
+        embed.add_field(name="🔊 頻道", value=value, inline=True)
+    embed.set_footer(text=f"時區 {digest['timezone']}")
+    return embed
+
+async def post_due_digests(now):
+    """
+    每個伺服器找出還沒發過的最近一期摘要。同時區的伺服器、同一輪的所有週期
+    在背景執行緒一次彙總完，event loop 只負責排版和送出。
+    """
+    ref = now - DIGEST_DELAY
+    groups = {}  # 時區 -> [(guild_id, window), ...]
+    for guild_id, config in guild_configs.items():
+        if bot.get_guild(guild_id) is None:
+            # 不在這個行程的分片上
+            continue
+        tz = resolve_timezone(config.timezone)
+        for period in DIGEST_PERIODS:
+            window = last_completed(tz, period, ref)
+            if digest_posted.get((guild_id, period)) != window.bucket:
+                groups.setdefault(config.timezone, []).append((guild_id, window))
+    
+    for timezone, due in groups.items():
+        start = time.perf_counter()
+        guild_ids = sorted({guild_id for guild_id, _ in due})
+        windows = list({(w.period, w.bucket): w for _, w in due}.values())
+        digests = await asyncio.to_thread(
+            digest_job, timezone, guild_ids, windows, live_session_rows(set(guild_ids), time.time())
+        )
+        digest_stats["runs"] += 1
+        digest_stats["last_run"] = utc_iso()
+        digest_stats["last_ms"] = elapsed_ms(start)
+        found = {(d["guild_id"], d["period"], d["bucket"]): d for d in digests}
+        
+        for guild_id, window in due:
+            digest = found.get((guild_id, window.period, window.bucket))
+            # 整期沒有任何紀錄就不發，但一樣標記為已處理
+            if digest is not None and not await log_senders.send_embed(guild_id, digest_embed(digest)):
+                continue
+            if digest is not None:
+                digest_stats["posted"] += 1
+            digest_posted[(guild_id, window.period)] = window.bucket
+            session_store.set_meta(f"digest:{guild_id}:{window.period}", window.bucket)
+            log.info(
+                "digest.posted", f"📊 {window.bucket} 學習摘要" + ("已發送" if digest else "：沒有紀錄"),
+                guild_id=guild_id, period=window.period, bucket=window.bucket, took_ms=digest_stats["last_ms"]
+            )
+
+async def digest_loop():
+    """每個時區的本地午夜過後 DIGEST_DELAY 秒跑一次；啟動時先補發錯過的最近一期"""
+    await bot.wait_until_ready()
+    timezones = {resolve_timezone(config.timezone) for config in guild_configs.values()}
+    while True:
+        if is_serving():
+            try:
+                await post_due_digests(time.time())
+            except Exception as e:
+                log.exception("digest.failed", f"❌ 產生學習摘要失敗: {e}")
+        now = time.time()
+        wake = min(next_midnight(tz, now - DIGEST_DELAY) for tz in timezones) + DIGEST_DELAY
+        # 最多睡一小時，系統校時或休眠後也能很快跟上；standby 每分鐘看一次，接手後不必等到下個午夜才補發
+        await asyncio.sleep(min(max(wake - now, 1.0), 3600 if is_serving() else 60))
+
+# =========================
+# Discord 事件處理
+# =========================
+@bot.event
+async def on_shard_ready(shard_id):
+    """每個分片（重新）就緒時只對帳自己負責的伺服器"""
+    stats = shard_stats.get(shard_id)
+    since = disconnected_at.pop(shard_id, None)
+    ended_at = since[0] if since else time.time()
+    
+    # 對帳目前在語音頻道的用戶（不發送訊息）；standby 不對帳，接手時由 take_over() 一次做
+    for guild in guilds_on_shard(shard_id) if is_serving() else ():
+        live_count, counts = reconcile_voice_state(guild, ended_at)
+        log.info(
+            "voice.reconciled", f"🔍 伺服器「{guild.name}」: 語音中 {live_count} 人",
+            guild_id=guild.id, shard_id=shard_id, live=live_count, **counts
+        )
+    
+    if stats is None:
+        shard_stats[shard_id] = {"ready_ms": elapsed_ms(), "reconnects": 0, "resumes": 0}
+        log.info("shard.ready", f"🧩 分片 {shard_id} 就緒", shard_id=shard_id)
+    else:
+        stats["reconnects"] += 1
+        runtime_stats["reconnects"] += 1
+        if since:
+            stats["reconnect_ready_ms"] = runtime_stats["reconnect_ready_ms"] = elapsed_ms(since[1])
+        log.info(
+            "shard.ready", f"✨ 分片 {shard_id} 重新連線就緒！",
+            shard_id=shard_id, reconnect_ms=stats.get("reconnect_ready_ms")
+        )
+
+@bot.event
+async def on_ready():
+    # 所有分片都就緒後觸發；單一分片重連時也可能再觸發，對帳已在 on_shard_ready 做過
+    if runtime_stats["bot_ready_ms"] is None:
+        log.info(
+            "bot.login", f"✅ 已登入：{bot.user}",
+            guilds=sorted(guild_configs), shard_ids=bot.shard_ids, shard_count=bot.shard_count
+        )
+    
+    # 同步 Slash 指令（定義有變才同步）；主備模式下由接手的 leader 同步
+    if elector is None:
+        await sync_commands()
+    
+    status_board.publish(is_ready=True, ready_at=time.time())
+    if runtime_stats["bot_ready_ms"] is None:
+        runtime_stats["bot_ready_ms"] = elapsed_ms()
+        log.info("bot.ready", "✨ 機器人就緒！", cold_start_ms=runtime_stats["bot_ready_ms"])
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    if shard_id not in disconnected_at:
+        disconnected_at[shard_id] = (time.time(), time.perf_counter())
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    # RESUME 成功時 Discord 會補送斷線期間的事件，不需要對帳
+    since = disconnected_at.pop(shard_id, None)
+    stats = shard_stats.setdefault(shard_id, {"ready_ms": None, "reconnects": 0, "resumes": 0})
+    stats["resumes"] += 1
+    runtime_stats["resumes"] += 1
+    if since:
+        stats["resume_ms"] = runtime_stats["resume_ms"] = elapsed_ms(since[1])
 
 @bot.tree.command(name="record", description="設定本次語音學習主題")
 @app_commands.describe(topic="你想紀錄的主題，例如：微積分")
@@ -171,124 +1208,385 @@ async def on_ready():
 async def record(interaction: discord.Interaction, topic: str):
     user_id = interaction.user.id
     
-    if user_id in voice_sessions:
-        voice_sessions[user_id]["topic"] = topic
-        channel_name = voice_sessions[user_id]["channel_name"]
+    session = voice_sessions.get((interaction.guild_id, user_id))
+    if session is not None:
+        # 原始寫法照存；統計與摘要用歸併後的標準主題
+        topics = topic_canon.guild(session.guild_id)
+        canonical, how, similar = topics.resolve(topic)
+        if how != "known":
+            topics.register(topic, canonical)
+            if canonical != topic:
+                session_store.map_topic(session.guild_id, topic, canonical)
+        session.topic = topic
+        session_store.set_topic(session.guild_id, user_id, topic)
+        await topic_index.record(session.guild_id, user_id, topic)
+        activity_hub.publish("topic", session.guild_id, user_id, topic=topic)
+        channel = bot.get_channel(session.channel_id)
+        channel_name = channel.name if channel else session.channel_id
+        message = f"✅ 已設定主題為：**{topic}**\n📍 頻道：{channel_name}"
+        if canonical != topic:
+            message += f"\n🗂️ 統計時歸入：**{canonical}**"
+        elif similar:
+            message += f"\n💡 類似的主題：{'、'.join(similar)}（要合併可以改用其中一個）"
+        await interaction.response.send_message(message, ephemeral=True)
+        log.info(
+            "record.topic", f"📝 {interaction.user.display_name} 設定主題: {topic}",
+            user_id=user_id, topic=topic, canonical=canonical, match=how
+        )
+    else:
         await interaction.response.send_message(
-            f"✅ 已設定主題為：**{topic}**\n📍 頻道：{channel_name}",
+            "⚠️ 偵測不到您在語音頻道中\n請先加入語音頻道再設定主題",
             ephemeral=True
         )
-        print(f"📝 {interaction.user.display_name} 設定主題: {topic}")
+
+@record.autocomplete("topic")
+async def record_topic_autocomplete(interaction: discord.Interaction, current: str):
+    topics = await topic_index.suggest(interaction.guild_id, interaction.user.id, current)
+    # 前綴比對不足時用 n-gram 模糊比對補上標準主題（打錯字、換個寫法也找得到）
+    if len(topics) < 25 and len(fold(current)) >= 2:
+        seen = set(topics)
+        topics += [
+            topic for topic in topic_canon.guild(interaction.guild_id).suggest(current, 25 - len(topics))
+            if topic not in seen
+        ]
+    return [app_commands.Choice(name=topic[:100], value=topic[:100]) for topic in topics]
+
+# 管理員維護的主題別名：/topic alias calc 微積分
+topic_admin = app_commands.Group(
+    name="topic", description="主題歸併設定", guild_only=True,
+    default_permissions=discord.Permissions(manage_guild=True)
+)
+
+def apply_topic_alias(guild_id, alias, canonical):
+    """設定（canonical=None 時移除）別名，受影響原始寫法的統計增量搬到新的標準主題"""
+    topics = topic_canon.guild(guild_id)
+    if canonical is None:
+        key, changes = topics.remove_alias(alias)
+        if changes is None:
+            return key, None
     else:
+        key, changes = topics.set_alias(alias, canonical)
+    rollup_engine.rebucket(guild_id, changes)
+    session_store.rebucket(guild_id, key, canonical, changes)
+    log.info(
+        "topic.alias", f"🗂️ 別名 {key} → {canonical}，{len(changes)} 個寫法改對應",
+        guild_id=guild_id, alias=key, canonical=canonical, moved=len(changes)
+    )
+    return key, changes
+
+@topic_admin.command(name="alias", description="把某個寫法（含它的變化寫法）歸到標準主題")
+@app_commands.describe(alias="要歸併的寫法，例如：calc", canonical="標準主題，例如：微積分")
+async def topic_alias(interaction: discord.Interaction, alias: str, canonical: str):
+    canonical = " ".join(canonical.split())[:100]
+    if not fold(alias) or not canonical:
+        await interaction.response.send_message("⚠️ 別名與標準主題都不能是空的", ephemeral=True)
+        return
+    key, changes = apply_topic_alias(interaction.guild_id, alias, canonical)
+    await interaction.response.send_message(
+        f"🗂️ 「{key}」之後都算成 **{canonical}**，已搬動 {len(changes)} 個寫法的歷史統計", ephemeral=True
+    )
+
+@topic_admin.command(name="unalias", description="移除主題別名")
+@app_commands.describe(alias="要移除的別名")
+async def topic_unalias(interaction: discord.Interaction, alias: str):
+    key, changes = apply_topic_alias(interaction.guild_id, alias, None)
+    if changes is None:
+        await interaction.response.send_message(f"⚠️ 沒有「{key}」這個別名", ephemeral=True)
+        return
+    await interaction.response.send_message(
+        f"🗑️ 已移除別名「{key}」，{len(changes)} 個寫法恢復原本的主題", ephemeral=True
+    )
+
+@topic_admin.command(name="aliases", description="列出這個伺服器的主題別名")
+async def topic_aliases(interaction: discord.Interaction):
+    aliases = topic_canon.guild(interaction.guild_id).aliases
+    if not aliases:
+        await interaction.response.send_message("目前沒有任何別名", ephemeral=True)
+        return
+    lines = [f"「{alias}」→ **{canonical}**" for alias, canonical in sorted(aliases.items())]
+    await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+bot.tree.add_command(topic_admin)
+
+PERIOD_LABELS = {"day": "今日", "week": "本週", "month": "本月"}
+# /who 最多列出幾人（Discord 訊息長度上限）
+WHO_LIMIT = 40
+
+@bot.tree.command(name="leaderboard", description="查看學習時間排行榜")
+@app_commands.describe(period="統計週期")
+@app_commands.choices(period=[
+    app_commands.Choice(name="今日", value="day"),
+    app_commands.Choice(name="本週", value="week"),
+    app_commands.Choice(name="本月", value="month")
+])
+@app_commands.guild_only()
+async def leaderboard(interaction: discord.Interaction, period: str = "week"):
+    rows = rollup_engine.leaderboard(interaction.guild_id, period, time.time())
+    
+    if not rows:
         await interaction.response.send_message(
-            "⚠️ 偵測不到您在語音頻道中\n請先加入語音頻道再設定主題",
+            f"📊 {PERIOD_LABELS[period]}還沒有任何學習紀錄",
             ephemeral=True
         )
+        return
+    
+    names = await display_names.resolve(interaction.guild, [user_id for user_id, _, _ in rows])
+    lines = [f"🏆 **{PERIOD_LABELS[period]}學習排行榜**"]
+    for i, (user_id, seconds, sessions) in enumerate(rows, start=1):
+        name = names.get(user_id) or f"<@{user_id}>"
+        lines.append(f"`{i:>2}.` {name}　{format_duration(seconds)}（{sessions} 次）")
+    
+    await interaction.response.send_message(
+        "\n".join(lines),
+        allowed_mentions=discord.AllowedMentions.none()
+    )
+
+@bot.tree.command(name="who", description="查看語音頻道裡有誰在學習")
+@app_commands.describe(channel="要查看的語音頻道（預設為你所在的頻道）")
+@app_commands.guild_only()
+async def who(interaction: discord.Interaction, channel: discord.VoiceChannel = None):
+    # 直接讀房間索引：只走訪這個頻道裡的人，名稱取自 gateway 快取
+    if channel is None:
+        session = voice_sessions.get((interaction.guild_id, interaction.user.id))
+        channel = interaction.guild.get_channel(session.channel_id) if session is not None else None
+        if channel is None:
+            await interaction.response.send_message(
+                "⚠️ 偵測不到您在語音頻道中\n請指定要查看的頻道", ephemeral=True
+            )
+            return
+    
+    members = voice_sessions.room(channel.id)
+    if not members:
+        await interaction.response.send_message(f"🔇 {channel.name} 目前沒有人", ephemeral=True)
+        return
+    
+    now_ns = time.monotonic_ns()
+    lines = [f"🎧 **{channel.name}**　{len(members)} 人"]
+    room = room_tracker.room(channel.id)
+    if room is not None and room["opened_at"] is not None:
+        lines[0] += f"（已有人 {format_duration(time.time() - room['opened_at'])}，最多 {room['peak']} 人）"
+    for user_id, session in list(members.items())[:WHO_LIMIT]:
+        member = interaction.guild.get_member(user_id)
+        name = member.display_name if member else f"<@{user_id}>"
+        topic = f"　**{session.topic}**" if session.topic else ""
+        lines.append(f"• {name}　{format_duration(session.elapsed(now_ns))}{topic}")
+    if len(members) > WHO_LIMIT:
+        lines.append(f"…還有 {len(members) - WHO_LIMIT} 人")
+    
+    await interaction.response.send_message(
+        "\n".join(lines)[:1900],
+        ephemeral=True,
+        allowed_mentions=discord.AllowedMentions.none()
+    )
+
+@bot.tree.command(name="mystats", description="查看自己的學習時間統計")
+@app_commands.guild_only()
+async def mystats(interaction: discord.Interaction):
+    stats = rollup_engine.user_stats(interaction.guild_id, interaction.user.id, time.time())
+    
+    lines = [f"📊 **{interaction.user.display_name} 的學習統計**"]
+    for period, (seconds, sessions, rank, ranked) in stats.items():
+        if sessions == 0:
+            lines.append(f"{PERIOD_LABELS[period]}：尚無紀錄")
+        else:
+            lines.append(
+                f"{PERIOD_LABELS[period]}：{format_duration(seconds)}（{sessions} 次）　第 {rank}/{ranked} 名"
+            )
+    
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    if member.bot:
+    start = time.perf_counter()
+    try:
+        await handle_voice_state_update(member, before, after)
+    finally:
+        took = elapsed_ms(start)
+        VOICE_HANDLER_SECONDS.observe(took / 1000)
+        runtime_stats["voice_events"] += 1
+        runtime_stats["voice_event_last_ms"] = took
+        runtime_stats["voice_event_max_ms"] = max(runtime_stats["voice_event_max_ms"], took)
+
+async def handle_voice_state_update(member, before, after):
+    if member.bot or not is_serving():
+        # standby 不處理：leader 寫入 journal，接手時再和 gateway 快取對帳
+        return
+    
+    guild_id = member.guild.id
+    config = guild_configs.get(guild_id)
+    if config is None:
+        # 沒有設定的伺服器（或不屬於這個行程的分片）不追蹤
         return
     
     user_id = member.id
-    log_channel = member.guild.get_channel(LOG_CHANNEL_ID)
+    key = (guild_id, user_id)
+    log_channel = member.guild.get_channel(config.log_channel_id)
     
     if not log_channel:
-        print(f"❌ 找不到記錄頻道")
+        log.error("voice.no_log_channel", "❌ 找不到記錄頻道", guild_id=guild_id)
         return
 
     # 加入語音頻道
     if before.channel is None and after.channel is not None:
-        voice_sessions[user_id] = {
-            "join_time": datetime.datetime.utcnow(),
-            "topic": None,
-            "channel_name": after.channel.name
-        }
-        bot_status["active_sessions"] = len(voice_sessions)
+        pending = leave_timers.cancel(key)
+        if pending is not None:
+            # 寬限期內重新加入：接回原本的 session，不再發加入通知
+            VOICE_EVENTS.inc("rejoin")
+            moved = pending[0].channel_id != after.channel.id
+            session = voice_sessions.reopen(key, pending[0], after.channel.id)
+            if moved:
+                session_store.move(guild_id, user_id, after.channel.id, after.channel.name)
+            status_board.publish(active_sessions=len(voice_sessions))
+            publish_open(user_id, member.display_name, session, after.channel.name)
+            log.info(
+                "voice.rejoin", f"🔁 {member.display_name} 重新加入 {after.channel.name}",
+                guild_id=guild_id, user_id=user_id, channel_id=after.channel.id
+            )
+            return
         
-        print(f"➕ {member.display_name} 加入 {after.channel.name}")
+        VOICE_EVENTS.inc("join")
+        # 先在背景載入這個人的主題索引，/record 的 autocomplete 不必等 SQLite
+        topic_index.prewarm(guild_id, user_id)
+        session = voice_sessions.open(key, after.channel.id)
+        session_store.open_session(
+            guild_id, user_id, session.join_ts, after.channel.id, after.channel.name
+        )
+        status_board.publish(active_sessions=len(voice_sessions))
+        publish_open(user_id, member.display_name, session, after.channel.name)
         
-        try:
-            await log_channel.send(
-                f"⚠️ 注意！ **{member.display_name}** 已加入語音室 `{after.channel.name}`",
-                silent=False
-            )
-        except Exception as e:
-            print(f"❌ 發送加入通知失敗: {e}")
+        log.info(
+            "voice.join", f"➕ {member.display_name} 加入 {after.channel.name}",
+            guild_id=guild_id, user_id=user_id, channel_id=after.channel.id
+        )
+        
+        log_senders.enqueue(
+            guild_id,
+            f"⚠️ 注意！ **{member.display_name}** 已加入語音室 `{after.channel.name}`",
+            silent=False
+        )
 
     # 離開語音頻道
     elif before.channel is not None and after.channel is None:
-        if user_id in voice_sessions:
-            join_time = voice_sessions[user_id]["join_time"]
-            topic = voice_sessions[user_id]["topic"]
-            channel_name = voice_sessions[user_id]["channel_name"]
-            
-            duration = datetime.datetime.utcnow() - join_time
-            total_seconds = int(duration.total_seconds())
-            hours, remainder = divmod(total_seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            
-            time_parts = []
-            if hours > 0:
-                time_parts.append(f"{hours}h")
-            if minutes > 0:
-                time_parts.append(f"{minutes}m")
-            if seconds > 0 or not time_parts:
-                time_parts.append(f"{seconds}s")
-            time_str = ''.join(time_parts)
-            
-            print(f"➖ {member.display_name} 離開 {channel_name} ({time_str})")
-            
-            try:
-                if topic:
-                    await log_channel.send(
-                        f"🕐 {member.display_name} 在 {channel_name} **{topic}** {time_str}    好耶 !",
-                        silent=True
-                    )
-                else:
-                    await log_channel.send(
-                        f"🕐 {member.display_name} 在 {channel_name} 獨自升級 {time_str}    好耶 !",
-                        silent=True
-                    )
-            except Exception as e:
-                print(f"❌ 發送離開紀錄失敗: {e}")
-            
-            del voice_sessions[user_id]
-            bot_status["active_sessions"] = len(voice_sessions)
+        VOICE_EVENTS.inc("leave")
+        session = voice_sessions.close(key)
+        if session is not None:
+            # 結束時間取離開當下；寬限期內回來就當作沒離開過
+            pending = (session, member.display_name, before.channel.name, session.end_ts())
+            status_board.publish(active_sessions=len(voice_sessions))
+            activity_hub.publish("close", guild_id, user_id)
+            if config.leave_grace > 0:
+                leave_timers.schedule(key, config.leave_grace, pending)
+                log.debug(
+                    "voice.leave_pending", f"⏳ {member.display_name} 離開 {before.channel.name}，等待重新加入",
+                    guild_id=guild_id, user_id=user_id, grace=config.leave_grace
+                )
+            else:
+                finish_leave(key, pending)
     
     # 切換語音頻道
     elif before.channel is not None and after.channel is not None and before.channel != after.channel:
-        print(f"🔄 {member.display_name}: {before.channel.name} → {after.channel.name}")
-        if user_id in voice_sessions:
-            voice_sessions[user_id]["channel_name"] = after.channel.name
+        VOICE_EVENTS.inc("move")
+        log.info(
+            "voice.move", f"🔄 {member.display_name}: {before.channel.name} → {after.channel.name}",
+            guild_id=guild_id, user_id=user_id,
+            from_channel_id=before.channel.id, to_channel_id=after.channel.id
+        )
+        # 房間索引：從舊頻道移到新頻道
+        if voice_sessions.move(key, after.channel.id) is not None:
+            session_store.move(guild_id, user_id, after.channel.id, after.channel.name)
+            activity_hub.publish(
+                "move", guild_id, user_id, channel_id=after.channel.id, channel_name=after.channel.name
+            )
+    
+    # 靜音、拒聽、開直播等其他狀態變化
+    else:
+        VOICE_EVENTS.inc("other")
+
+def finish_leave(key, pending):
+    """寬限期結束仍未回來：送出離開紀錄並結算"""
+    guild_id, user_id = key
+    session, display_name, channel_name, end_ts = pending
+    topic = session.topic
+    time_str = format_duration(end_ts - session.join_ts)
+    
+    log.info(
+        "voice.leave", f"➖ {display_name} 離開 {channel_name} ({time_str})",
+        guild_id=guild_id, user_id=user_id, channel_id=session.channel_id,
+        seconds=round(end_ts - session.join_ts, 1)
+    )
+    
+    if topic:
+        log_senders.enqueue(
+            guild_id,
+            f"🕐 {display_name} 在 {channel_name} **{topic}** {time_str}    好耶 !",
+            silent=True
+        )
+    else:
+        log_senders.enqueue(
+            guild_id,
+            f"🕐 {display_name} 在 {channel_name} 獨自升級 {time_str}    好耶 !",
+            silent=True
+        )
+    
+    close_session(guild_id, user_id, topic, session.channel_id, session.join_ts, end_ts)
+
+leave_timers = TimerHeap(finish_leave)
 
 @bot.event
 async def on_error(event, *args, **kwargs):
-    print(f"❌ 錯誤: {event}")
-    import traceback
-    traceback.print_exc()
+    log.exception("bot.error", f"❌ 錯誤: {event}")
 
 # =========================
 # 主程式啟動
 # =========================
-if __name__ == "__main__":
-    print("🚀 Inside_Curl Discord Bot 啟動中...\n")
+async def run_single_loop():
+    """uvicorn Server 與 bot.start() 跑在同一個 event loop，任一邊結束就一起收尾"""
+    discord.utils.setup_logging()
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="0.0.0.0", port=PORT, log_level="warning", timeout_graceful_shutdown=5
+    ))
+    log.info("web.start", f"🌐 FastAPI 啟動於 Port {PORT}", port=PORT)
     
-    # 啟動 FastAPI (背景執行)
-    web_thread = threading.Thread(target=run_web, daemon=True)
-    web_thread.start()
-    time.sleep(1.5)
+    async with bot:
+        web_task = asyncio.create_task(server.serve(), name="web")
+        bot_task = asyncio.create_task(bot.start(TOKEN), name="bot")
+        done, pending = await asyncio.wait({web_task, bot_task}, return_when=asyncio.FIRST_COMPLETED)
+        
+        # 協調關機：先停 web，再關 bot（close 會送完通知佇列）
+        server.should_exit = True
+        if not bot.is_closed():
+            await bot.close()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+
+if __name__ == "__main__":
+    log.info("bot.starting", "🚀 Inside_Curl Discord Bot 啟動中...", mode=RUNTIME_MODE)
     
-    # 啟動 Discord Bot (主執行緒)
-    try:
-        print("🤖 連接 Discord...\n")
-        bot.run(TOKEN)
-    except discord.LoginFailure:
-        print("❌ 登入失敗：TOKEN 無效")
-    except Exception as e:
-        print(f"❌ 啟動失敗: {e}")
-        import traceback
-        traceback.print_exc()
+    if RUNTIME_MODE == "single":
+        try:
+            log.info("bot.connecting", "🤖 連接 Discord（單一 event loop）...")
+            asyncio.run(run_single_loop())
+        except KeyboardInterrupt:
+            pass
+        except discord.LoginFailure:
+            log.error("bot.login_failed", "❌ 登入失敗：TOKEN 無效")
+        except Exception as e:
+            log.exception("bot.start_failed", f"❌ 啟動失敗: {e}")
+    else:
+        # 啟動 FastAPI (背景執行)
+        web_thread = threading.Thread(target=run_web, daemon=True)
+        web_thread.start()
+        time.sleep(1.5)
+        
+        # 啟動 Discord Bot (主執行緒)
+        try:
+            log.info("bot.connecting", "🤖 連接 Discord...")
+            bot.run(TOKEN)
+        except discord.LoginFailure:
+            log.error("bot.login_failed", "❌ 登入失敗：TOKEN 無效")
+        except Exception as e:
+            log.exception("bot.start_failed", f"❌ 啟動失敗: {e}")
 
 
 '''
@@ -0,0 +1,197 @@
+# =========================
+# benchmarks/bench_archive.py
+# 欄式封存的掃描耗時：合成一千萬筆已結束的 session（多年、數千人、數十個頻道與主題），
+# 量測區間加總、依 user / channel / topic 分組、單一使用者過濾，並和同資料量級的 SQLite GROUP BY 比較；
+# 最後量測背景合併把大量小 segment 合併起來要多久
+# 用法：python benchmarks/bench_archive.py [--rows 10000000] [--segment-rows 1000000] [--sqlite-rows 1000000] [--no-numpy]
+# =========================
+import argparse
+import array
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+if "--no-numpy" in sys.argv:
+    sys.modules["numpy"] = None
+import session_archive  # noqa: E402
+from session_archive import SessionArchive  # noqa: E402
+
+np = session_archive.np
+GUILD_ID = 1
+YEAR = 365 * 86400
+EPOCH = 1_600_000_000
+
+
+def synthetic_columns(rng, rows, start, span, users, channels, topics):
+    """依 start_ts 排好序的一段 session"""
+    if np is not None:
+        gen = np.random.default_rng(rng.randrange(1 << 32))
+        return {
+            "user_id": gen.integers(10 ** 17, 10 ** 17 + users, rows, dtype=np.uint64),
+            "start_ts": np.sort(gen.integers(start, start + span, rows, dtype=np.int64)),
+            "channel_id": gen.integers(10 ** 18, 10 ** 18 + channels, rows, dtype=np.uint64),
+            "duration": gen.integers(60, 4 * 3600, rows, dtype=np.uint32),
+            "topic_id": gen.integers(0, topics + 1, rows, dtype=np.uint32)
+        }
+    rand = rng.randrange
+    return {
+        "user_id": array.array("Q", [10 ** 17 + rand(users) for _ in range(rows)]),
+        "start_ts": array.array("q", sorted(start + rand(span) for _ in range(rows))),
+        "channel_id": array.array("Q", [10 ** 18 + rand(channels) for _ in range(rows)]),
+        "duration": array.array("I", [rand(60, 4 * 3600) for _ in range(rows)]),
+        "topic_id": array.array("I", [rand(topics + 1) for _ in range(rows)])
+    }
+
+
+def fill(archive, rng, rows, segment_rows, users, channels, topics, years):
+    archive.intern_topics(GUILD_ID, [f"topic {i}" for i in range(1, topics + 1)])
+    segments = max(1, -(-rows // segment_rows))
+    span = years * YEAR // segments
+    next_id = 1
+    for i in range(segments):
+        count = min(segment_rows, rows - i * segment_rows)
+        columns = synthetic_columns(rng, count, EPOCH + i * span, span, users, channels, topics)
+        archive.write_segment(GUILD_ID, columns, next_id, next_id + count - 1)
+        next_id += count
+    return span * segments
+
+
+def timed(fn, repeat=3):
+    """取最快的一次（第一次含 page cache 預熱）"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best * 1000, result
+
+
+def bench_sqlite(rows, users, channels, topics, years):
+    """同樣分佈的 rows 筆放進 sessions 表（含 repo 用的索引），量同樣的查詢"""
+    workdir = tempfile.mkdtemp(prefix="inside_curl_archive_sqlite_")
+    conn = sqlite3.connect(os.path.join(workdir, "sessions.db"))
+    conn.execute(
+        "CREATE TABLE sessions (id INTEGER PRIMARY KEY, guild_id INTEGER, user_id INTEGER, channel_id INTEGER, "
+        "topic TEXT, start_ts REAL, end_ts REAL)"
+    )
+    rng = random.Random(3)
+    batch = []
+    for _ in range(rows):
+        start = EPOCH + rng.randrange(years * YEAR)
+        topic = rng.randrange(topics + 1)
+        batch.append((
+            GUILD_ID, 10 ** 17 + rng.randrange(users), 10 ** 18 + rng.randrange(channels),
+            f"topic {topic}" if topic else None, start, start + rng.randrange(60, 4 * 3600)
+        ))
+        if len(batch) == 100_000:
+            conn.executemany(
+                "INSERT INTO sessions (guild_id, user_id, channel_id, topic, start_ts, end_ts) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO sessions (guild_id, user_id, channel_id, topic, start_ts, end_ts) VALUES (?, ?, ?, ?, ?, ?)",
+            batch
+        )
+    conn.execute("CREATE INDEX sessions_user_start ON sessions (user_id, start_ts)")
+    conn.execute("CREATE INDEX sessions_window ON sessions (start_ts, id, end_ts, guild_id, channel_id, user_id, topic)")
+    conn.commit()
+    since, until = EPOCH + YEAR, EPOCH + 2 * YEAR
+    queries = {
+        "區間加總（一年）": (
+            "SELECT SUM(end_ts - start_ts), COUNT(*) FROM sessions WHERE guild_id = ? AND start_ts >= ? AND start_ts < ?",
+            (GUILD_ID, since, until)
+        ),
+        "全部依 user 分組": (
+            "SELECT user_id, SUM(end_ts - start_ts), COUNT(*) FROM sessions WHERE guild_id = ? GROUP BY user_id",
+            (GUILD_ID,)
+        ),
+        "全部依 topic 分組": (
+            "SELECT topic, SUM(end_ts - start_ts), COUNT(*) FROM sessions WHERE guild_id = ? GROUP BY topic",
+            (GUILD_ID,)
+        )
+    }
+    results = {name: timed(lambda: conn.execute(sql, params).fetchall(), repeat=2)[0] for name, (sql, params) in queries.items()}
+    conn.close()
+    shutil.rmtree(workdir)
+    return results
+
+
+def bench_compact(rng, rows, segment_rows, users, channels, topics):
+    """seal 出來的大量小 segment：合併到 merge_rows 之後，分組查詢要開的檔案少很多"""
+    workdir = tempfile.mkdtemp(prefix="inside_curl_archive_compact_")
+    archive = SessionArchive(workdir, merge_min=8, merge_rows=1 << 20)
+    fill(archive, rng, rows, segment_rows, users, channels, topics, 1)
+    before = archive.stats()["segments"]
+    by_user_before, _ = timed(lambda: archive.scan(GUILD_ID, by="user"))
+    start = time.perf_counter()
+    merges = archive.compact()
+    compact_ms = (time.perf_counter() - start) * 1000
+    by_user_after, _ = timed(lambda: archive.scan(GUILD_ID, by="user"))
+    after = archive.stats()["segments"]
+    shutil.rmtree(workdir)
+    return before, after, merges, compact_ms, by_user_before, by_user_after
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--segment-rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=40)
+    parser.add_argument("--topics", type=int, default=300)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--sqlite-rows", type=int, default=1_000_000)
+    parser.add_argument("--compact-rows", type=int, default=1_000_000)
+    parser.add_argument("--no-numpy", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="inside_curl_archive_")
+    archive = SessionArchive(workdir)
+    start = time.perf_counter()
+    fill(archive, rng, args.rows, args.segment_rows, args.users, args.channels, args.topics, args.years)
+    fill_s = time.perf_counter() - start
+    stats = archive.stats()
+    print(f"🗄️  {stats['rows']:,} 筆 session、{stats['segments']} 個 segment、{stats['bytes'] / 2 ** 20:,.0f} MiB"
+          f"（產生 {fill_s:.1f} s，{'numpy' if np is not None else '純 Python（memoryview）'}）\n")
+
+    since, until = EPOCH + YEAR, EPOCH + 2 * YEAR
+    user_id = 10 ** 17 + 42
+    queries = {
+        "區間加總（一年）": lambda: archive.scan(GUILD_ID, since=since, until=until),
+        "區間加總（全部）": lambda: archive.scan(GUILD_ID),
+        "全部依 user 分組": lambda: archive.scan(GUILD_ID, by="user"),
+        "全部依 channel 分組": lambda: archive.scan(GUILD_ID, by="channel"),
+        "全部依 topic 分組": lambda: archive.scan(GUILD_ID, by="topic"),
+        "一年內單一使用者依 topic": lambda: archive.scan(GUILD_ID, by="topic", since=since, until=until, user_id=user_id)
+    }
+    for name, query in queries.items():
+        took, result = timed(query)
+        size = f"{result['sessions']:,} 筆" if "sessions" in result else f"{len(result):,} 組"
+        print(f"   {name:<20} {took:9.1f} ms   {size}")
+
+    if args.sqlite_rows:
+        print(f"\n🐢 SQLite sessions 表 {args.sqlite_rows:,} 筆（同樣的分佈與索引）")
+        for name, took in bench_sqlite(args.sqlite_rows, args.users, args.channels, args.topics, args.years).items():
+            print(f"   {name:<20} {took:9.1f} ms")
+
+    if args.compact_rows:
+        before, after, merges, compact_ms, by_user_before, by_user_after = bench_compact(
+            rng, args.compact_rows, 4096, args.users, args.channels, args.topics
+        )
+        print(f"\n🗜️  合併：{args.compact_rows:,} 筆的 {before} 個小 segment → {after} 個（{merges} 次合併，{compact_ms:,.0f} ms）")
+        print(f"   依 user 分組 {by_user_before:,.1f} ms → {by_user_after:,.1f} ms")
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# =========================
+# benchmarks/bench_cache.py
+# 比較預設快取與精簡快取（LEAN_CACHE）在大型伺服器的記憶體與就緒耗時
+# 不連 Discord：用合成的 GUILD_CREATE / GUILD_MEMBERS_CHUNK 餵給 discord.py 的 ConnectionState
+# 每種模式在獨立的子行程量測，RSS 才不會互相影響
+#
+# 用法：python benchmarks/bench_cache.py [--members 100000] [--voice 300]
+#
+# 就緒耗時只含 discord.py 解析與建立快取的 CPU 時間；
+# 實際上 chunk 還要從 gateway 傳過來，所以另外列出 chunk 的 payload 大小
+# =========================
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GUILD_ID = 1
+LOG_CHANNEL_ID = 2
+VOICE_CHANNEL_BASE = 1000
+VOICE_CHANNELS = 20
+ROLES = 50
+CHUNK_SIZE = 1000
+
+
+# =========================
+# 合成 payload
+# =========================
+def member_payload(i):
+    user_id = 10_000_000 + i
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"user{i}",
+            "global_name": f"同學 {i}",
+            "discriminator": "0",
+            "avatar": f"{i:032x}"
+        },
+        "nick": f"暱稱{i}" if i % 3 == 0 else None,
+        "roles": [str(100 + (i + k) % ROLES) for k in range(i % 4)],
+        "joined_at": "2024-01-01T00:00:00.000000+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0
+    }
+
+
+def guild_payload(members, voice):
+    channels = [{"id": str(LOG_CHANNEL_ID), "type": 0, "name": "log", "position": 0, "permission_overwrites": []}]
+    channels += [
+        {"id": str(VOICE_CHANNEL_BASE + c), "type": 2, "name": f"📚 自習室 {c}", "position": c + 1,
+         "permission_overwrites": [], "bitrate": 64000, "user_limit": 0}
+        for c in range(VOICE_CHANNELS)
+    ]
+    roles = [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+              "hoist": False, "managed": False, "mentionable": False}]
+    roles += [
+        {"id": str(100 + r), "name": f"role{r}", "permissions": "0", "position": r + 1, "color": 0,
+         "hoist": False, "managed": False, "mentionable": False}
+        for r in range(ROLES)
+    ]
+    voice_members = [member_payload(i) for i in range(voice)]
+    voice_states = [
+        {"user_id": m["user"]["id"], "channel_id": str(VOICE_CHANNEL_BASE + i % VOICE_CHANNELS),
+         "session_id": f"s{i}", "deaf": False, "mute": False, "self_deaf": False, "self_mute": i % 2 == 0,
+         "self_video": False, "suppress": False, "request_to_speak_timestamp": None}
+        for i, m in enumerate(voice_members)
+    ]
+    return {
+        "id": str(GUILD_ID),
+        "name": "Synthetic Guild",
+        "owner_id": "1",
+        "member_count": members,
+        "large": True,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": roles,
+        "channels": channels,
+        "threads": [],
+        "members": voice_members,
+        "voice_states": voice_states,
+        "presences": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "soundboard_sounds": [],
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "nsfw_level": 0,
+        "premium_tier": 0,
+        "preferred_locale": "zh-TW"
+    }
+
+
+# =========================
+# 子行程：量測單一模式
+# =========================
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def measure(args):
+    from discord.state import ChunkRequest
+    import Inside_Curl as bot_module
+
+    state = bot_module.bot._connection
+    guild_data = guild_payload(args.members, args.voice)
+    chunks = []
+    if state._chunk_guilds:
+        for start in range(0, args.members, CHUNK_SIZE):
+            chunks.append({
+                "guild_id": str(GUILD_ID),
+                "members": [member_payload(i) for i in range(start, min(args.members, start + CHUNK_SIZE))],
+                "chunk_index": len(chunks),
+                "chunk_count": (args.members + CHUNK_SIZE - 1) // CHUNK_SIZE
+            })
+    chunk_bytes = sum(len(json.dumps(chunk)) for chunk in chunks)
+
+    gc.collect()
+    baseline = rss_bytes()
+    start = time.perf_counter()
+    guild = state._add_guild_from_data(guild_data)
+    if chunks:
+        # 與 chunk_guild() 相同：註冊一個要快取成員的請求，再依序處理 gateway 送來的 chunk
+        request = ChunkRequest(guild.id, guild.shard_id, asyncio.get_running_loop(), state._get_guild, cache=True)
+        state._chunk_requests[guild.id] = request
+        members = request.get_future()
+        for chunk in chunks:
+            chunk["nonce"] = request.nonce
+            state.parse_guild_members_chunk(chunk)
+        await members
+    ready_ms = (time.perf_counter() - start) * 1000
+
+    del chunks, guild_data
+    gc.collect()
+    voice_cached = sum(len(channel.members) for channel in guild.voice_channels)
+    print(json.dumps({
+        "lean": bot_module.LEAN_CACHE,
+        "ready_ms": ready_ms,
+        "rss_delta": rss_bytes() - baseline,
+        "cached_members": len(guild.members),
+        "voice_members": voice_cached,
+        "chunk_bytes": chunk_bytes
+    }))
+
+
+def run_mode(lean, args):
+    env = {
+        **os.environ,
+        "DISCORD_BOT_TOKEN": "bench",
+        "GUILD_ID": str(GUILD_ID),
+        "LOG_CHANNEL_ID": str(LOG_CHANNEL_ID),
+        "SESSION_DB": os.path.join(tempfile.mkdtemp(prefix="inside_curl_cache_"), "bench.db"),
+        "LOG_LEVEL": "warning",
+        "LEAN_CACHE": "true" if lean else "false"
+    }
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker",
+         "--members", str(args.members), "--voice", str(args.voice)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--voice", type=int, default=300)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, ROOT)
+        asyncio.run(measure(args))
+        return
+
+    print(f"🏰 合成伺服器：{args.members:,} 位成員 / {args.voice} 人在語音\n")
+    for lean in (False, True):
+        r = run_mode(lean, args)
+        label = "精簡快取" if lean else "預設快取"
+        print(f"[{label}]")
+        print(f"   就緒耗時（CPU）  : {r['ready_ms']:.1f} ms")
+        print(f"   快取 RSS 增量    : {r['rss_delta'] / 1048576:.1f} MiB")
+        print(f"   快取成員數       : {r['cached_members']:,}（語音中 {r['voice_members']}）")
+        print(f"   chunk payload    : {r['chunk_bytes'] / 1048576:.1f} MiB\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# =========================
+# benchmarks/bench_digest.py
+# 學習摘要的彙總耗時：合成一個月的歷史 session，比較在 SQLite 內切窗彙總與逐列 Python 切日
+# 用法：python benchmarks/bench_digest.py [--guilds 5] [--per-day 3000] [--timezone Asia/Taipei]
+# =========================
+import argparse
+import bisect
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from digest import compute_digests, local_midnight, resolve_timezone, window_for  # noqa: E402
+from history import open_readonly  # noqa: E402
+from session_store import connect  # noqa: E402
+
+TOPICS = ["微積分", "線性代數", "物理", "英文", "程式設計", "統計", "化學", "經濟學"]
+
+
+def build_db(path, args, tz, month):
+    rng = random.Random(args.seed)
+    # 每個人有習慣的自習室與一兩個常用主題
+    habits = {}
+    for guild_id in range(1, args.guilds + 1):
+        for user in range(args.users):
+            habits[(guild_id, user)] = (
+                guild_id * 1000 + rng.randrange(args.channels),
+                rng.sample(TOPICS, 2)
+            )
+    first = local_midnight(tz, month.first_day)
+    rows = []
+    for day in range(month.days):
+        day_start = first + day * 86400
+        for _ in range(args.per_day):
+            guild_id = 1 + rng.randrange(args.guilds)
+            user = rng.randrange(args.users)
+            channel_id, topics = habits[(guild_id, user)]
+            if rng.random() < 0.2:
+                channel_id = guild_id * 1000 + rng.randrange(args.channels)
+            start = day_start + rng.uniform(0, 86400)
+            # 大多數 30 分鐘 ~ 2 小時，少數通宵
+            length = rng.expovariate(1 / 3600) + 300
+            rows.append((
+                guild_id,
+                guild_id * 100_000 + user,
+                channel_id,
+                rng.choice(topics) if rng.random() < 0.7 else None,
+                start,
+                start + length
+            ))
+    conn = connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions (guild_id, user_id, channel_id, topic, start_ts, end_ts) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    conn.close()
+    return len(rows)
+
+
+def python_digest(conn, tz, guild_ids, window):
+    """對照組：把整段 session 讀進 Python，逐列依本地日切開再累加"""
+    bounds = [local_midnight(tz, window.first_day + datetime.timedelta(days=i)) for i in range(window.days + 1)]
+    guilds = set(guild_ids)
+    totals = {}
+    for guild_id, channel_id, user_id, topic, start_ts, end_ts in conn.execute(
+        "SELECT guild_id, channel_id, user_id, topic, start_ts, end_ts FROM sessions "
+        "WHERE start_ts >= ? AND start_ts < ?",
+        (bounds[0] - 2 * 86400, bounds[-1])
+    ):
+        if guild_id not in guilds:
+            continue
+        i = max(0, bisect.bisect_right(bounds, start_ts) - 1)
+        while i < window.days and bounds[i] < end_ts:
+            seconds = min(end_ts, bounds[i + 1]) - max(start_ts, bounds[i])
+            if seconds > 0:
+                for key in ((guild_id, None), (guild_id, channel_id)):
+                    entry = totals.setdefault(key, [0.0, {}, {}])
+                    entry[0] += seconds
+                    entry[1][user_id] = entry[1].get(user_id, 0.0) + seconds
+                    if topic:
+                        entry[2][topic] = entry[2].get(topic, 0.0) + seconds
+            i += 1
+    return totals
+
+
+def best_of(fn, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--per-day", type=int, default=3000)
+    parser.add_argument("--timezone", default="Asia/Taipei")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tz = resolve_timezone(args.timezone)
+    month = window_for("month", datetime.date(2026, 9, 1))
+    path = os.path.join(tempfile.mkdtemp(prefix="inside_curl_digest_"), "digest.db")
+    total = build_db(path, args, tz, month)
+    conn = open_readonly(path)
+    guild_ids = list(range(1, args.guilds + 1))
+    last_day = month.end_day - datetime.timedelta(days=1)
+    scheduled = [window_for("day", last_day), window_for("week", last_day)]
+
+    month_ms = best_of(lambda: compute_digests(conn, tz, guild_ids, [month]))
+    scheduled_ms = best_of(lambda: compute_digests(conn, tz, guild_ids, scheduled))
+    python_ms = best_of(lambda: python_digest(conn, tz, guild_ids, month))
+    digests = compute_digests(conn, tz, guild_ids, [month])
+
+    print(f"🗓️  {month.bucket}：{total:,} 筆 session / {args.guilds} 個伺服器（{args.timezone}）\n")
+    print(f"   一個月（SQLite 彙總）    : {month_ms:8.1f} ms")
+    print(f"   昨天 + 上週（一次查詢）  : {scheduled_ms:8.1f} ms")
+    print(f"   一個月（逐列 Python 切日）: {python_ms:8.1f} ms")
+    print(f"\n   每份摘要：{len(digests[0]['channels'])} 個頻道、{digests[0]['active_users']} 位活躍用戶")
+
+
+if __name__ == "__main__":
+    main()
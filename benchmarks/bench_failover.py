@@ -0,0 +1,168 @@
+# =========================
+# benchmarks/bench_failover.py
+# 主備切換：兩個獨立行程競爭同一份租約，leader 每 20ms「發一則通知」並寫一筆 journal（都以租約為閘門），
+# 量測 leader 被 kill -9 / 正常關機 / 卡住（SIGSTOP）後 standby 多久開始接手，並檢查沒有重複發送、舊 leader 的寫入被擋下
+# 不需要 Discord token
+# 用法：python benchmarks/bench_failover.py [--backends sqlite,file] [--ttl 6] [--retry 1] [--journal 20000]
+# =========================
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lease import FileLease, LeaderElector, SqliteLease  # noqa: E402
+from session_store import SessionStore  # noqa: E402
+
+TICK = 0.02
+
+
+def make_backend(kind, path):
+    return SqliteLease(path, timeout=1.0) if kind == "sqlite" else FileLease(path)
+
+
+def instance(kind, db, posts, name, ttl, retry):
+    """一個實例：serving 時每個 tick 發一則（寫一行到 posts）並記一筆 journal；SIGTERM 時正常關機、釋放租約"""
+
+    async def main():
+        elector = None
+        store = SessionStore(db, flush_interval=0.2, fence=lambda: elector.is_leader)
+
+        async def promote():
+            await asyncio.to_thread(store.follow)
+
+        elector = LeaderElector(make_backend(kind, db), name, ttl=ttl, retry=retry, on_promote=promote)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        store.start()
+        elector.start()
+        fd = os.open(posts, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        user = 0
+        while not stop.is_set():
+            await asyncio.sleep(TICK)
+            if elector.serving:
+                now = time.time()
+                user += 1
+                store.open_session(1, user, now, 1, name)
+                # 和 LogSender 一樣：真的送出前一刻再確認一次租約
+                if elector.is_leader:
+                    os.write(fd, f"{now:.4f} {name}\n".encode())
+        os.close(fd)
+        await asyncio.to_thread(store.close)
+        await elector.close()
+
+    asyncio.run(main())
+
+
+def read_posts(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [(float(ts), name) for ts, name in (line.split() for line in f if line.strip())]
+
+
+def wait_first_post(path, name, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        mine = [ts for ts, who in read_posts(path) if who == name]
+        if mine:
+            return mine[0]
+        time.sleep(0.01)
+    return None
+
+
+def scenario(kind, action, ttl, retry):
+    workdir = tempfile.mkdtemp(prefix="inside_curl_failover_")
+    db, posts = os.path.join(workdir, "sessions.db"), os.path.join(workdir, "posts.log")
+    SessionStore(db).close()
+    ctx = multiprocessing.get_context("spawn")
+    a = ctx.Process(target=instance, args=(kind, db, posts, "A", ttl, retry))
+    a.start()
+    if wait_first_post(posts, "A", 30) is None:
+        raise RuntimeError("A 沒有成為 leader")
+    b = ctx.Process(target=instance, args=(kind, db, posts, "B", ttl, retry))
+    b.start()
+    time.sleep(max(2.0, retry * 2))
+
+    t0 = time.time()
+    if action == "kill":
+        os.kill(a.pid, signal.SIGKILL)
+    elif action == "term":
+        os.kill(a.pid, signal.SIGTERM)
+    else:
+        os.kill(a.pid, signal.SIGSTOP)
+    first_b = wait_first_post(posts, "B", ttl * 3 + 10)
+    if action == "stop":
+        # 舊 leader 醒來：它以為自己還是 leader 的那一刻，不能再發通知或寫入
+        os.kill(a.pid, signal.SIGCONT)
+        time.sleep(ttl)
+        a.terminate()
+    a.join()
+    time.sleep(0.5)
+    b.terminate()
+    b.join()
+
+    entries = read_posts(posts)
+    late_posts = sum(1 for ts, who in entries if who == "A" and first_b is not None and ts >= first_b)
+    switches = sum(1 for (_, x), (_, y) in zip(entries, entries[1:]) if x != y)
+    conn = sqlite3.connect(db)
+    late_rows = conn.execute(
+        "SELECT COUNT(*) FROM journal WHERE channel_name = 'A' AND ts >= ?", (first_b or 0,)
+    ).fetchone()[0]
+    conn.close()
+    return (first_b - t0) if first_b else None, late_posts, late_rows, switches
+
+
+def bench_follow(rows):
+    """standby 的 follow()：第一次（快照 + 全部 journal）與之後每輪只讀新增的部分"""
+    db = os.path.join(tempfile.mkdtemp(prefix="inside_curl_follow_"), "sessions.db")
+    leader = SessionStore(db, compact_every=rows * 10)
+    for user in range(rows):
+        leader.open_session(1, user, time.time(), 1, "study")
+    leader._write_pending()
+    standby = SessionStore(db)
+    start = time.perf_counter()
+    standby.follow()
+    full_ms = (time.perf_counter() - start) * 1000
+    for user in range(0, rows, 50):
+        leader.close_session(1, user)
+    leader._write_pending()
+    start = time.perf_counter()
+    _, sessions = standby.follow()
+    tail_ms = (time.perf_counter() - start) * 1000
+    leader.close()
+    standby.close()
+    return full_ms, tail_ms, len(sessions)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="sqlite,file")
+    parser.add_argument("--ttl", type=float, default=6.0)
+    parser.add_argument("--retry", type=float, default=1.0)
+    parser.add_argument("--journal", type=int, default=20000)
+    args = parser.parse_args()
+
+    full_ms, tail_ms, open_sessions = bench_follow(args.journal)
+    print(f"📖 follow()：{args.journal:,} 筆 journal 第一次 {full_ms:.1f} ms，"
+          f"之後新增 {args.journal // 50:,} 筆只要 {tail_ms:.1f} ms（{open_sessions:,} 個開著的 session）\n")
+    print(f"🔁 TTL {args.ttl:g}s、standby 每 {args.retry:g}s 嘗試一次")
+    actions = {"kill": "kill -9", "term": "正常關機", "stop": "卡住 (SIGSTOP)"}
+    for kind in args.backends.split(","):
+        for action, label in actions.items():
+            if kind == "file" and action == "stop":
+                # flock 沒有到期時間：卡住但沒死的 leader 不會被接手
+                continue
+            took, late_posts, late_rows, switches = scenario(kind, action, args.ttl, args.retry)
+            took_str = f"{took:6.2f} s" if took is not None else "  未接手"
+            print(f"   {kind:<6} {label:<14} 接手 {took_str}   舊 leader 之後的通知 {late_posts}、"
+                  f"寫入 {late_rows}，leader 切換 {switches} 次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# =========================
+# benchmarks/bench_runtime.py
+# 比較 threaded / single 兩種執行模式的啟動耗時與延遲
+# 需要真正的 DISCORD_BOT_TOKEN、GUILD_ID、LOG_CHANNEL_ID 環境變數
+# 用法：python benchmarks/bench_runtime.py [--probes 500] [--observe 30]
+# =========================
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def get_json(url, timeout=2.0):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def wait_ready(base, timeout):
+    """等到 /status 回報 bot 就緒，回傳 runtime 區塊"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            runtime = get_json(f"{base}/status")["runtime"]
+            if runtime["bot_ready_ms"] is not None:
+                return runtime
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError("bot 未在時限內就緒")
+
+
+def probe_latency(base, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{base}/ping", timeout=2.0) as resp:
+            resp.read()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def run_mode(mode, port, probes, observe):
+    env = dict(os.environ, RUNTIME_MODE=mode, PORT=str(port))
+    proc = subprocess.Popen(
+        [sys.executable, "Inside_Curl.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base, timeout=120)
+        p50, p99 = probe_latency(base, probes)
+        # 觀察一段時間，讓 loop lag 與語音事件延遲有資料
+        time.sleep(observe)
+        runtime = get_json(f"{base}/status")["runtime"]
+        return runtime, p50, p99
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--probes", type=int, default=500)
+    parser.add_argument("--observe", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    for mode in ("threaded", "single"):
+        runtime, p50, p99 = run_mode(mode, args.port, args.probes, args.observe)
+        print(f"⚙️  {mode}")
+        print(f"   web 就緒       : {runtime['web_ready_ms']:.0f} ms")
+        print(f"   bot 就緒       : {runtime['bot_ready_ms']:.0f} ms")
+        print(f"   /ping p50/p99  : {p50:.2f} / {p99:.2f} ms")
+        print(f"   loop lag 最大  : {runtime['loop_lag_max_ms']:.2f} ms")
+        print(
+            f"   語音事件       : {runtime['voice_events']} 次，"
+            f"最慢 {runtime['voice_event_max_ms']:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
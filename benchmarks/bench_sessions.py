@@ -0,0 +1,86 @@
+# =========================
+# benchmarks/bench_sessions.py
+# 比較舊的 dict session 與 SessionTable：每 1 萬個 session 的記憶體、加入/離開的單次成本
+# 用法：python benchmarks/bench_sessions.py
+# =========================
+import datetime
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sessions import SessionTable  # noqa: E402
+
+N = 10_000
+CHANNEL_NAMES = [f"📚 自習室 {i}" for i in range(20)]
+
+
+def build_dicts(n):
+    # 舊寫法：每個 session 一個 dict + utcnow() 的 datetime + 頻道名稱
+    sessions = {}
+    for user_id in range(n):
+        sessions[user_id] = {
+            "join_time": datetime.datetime.utcnow(),
+            "topic": None,
+            "channel_name": CHANNEL_NAMES[user_id % 20]
+        }
+    return sessions
+
+
+def build_table(n):
+    sessions = SessionTable()
+    for user_id in range(n):
+        sessions.open((1, user_id), 1000 + user_id % 20)
+    return sessions
+
+
+def measure_memory(builder):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = builder(N)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sessions
+    return after - before
+
+
+def dict_cycle(sessions, user_id):
+    sessions[user_id] = {
+        "join_time": datetime.datetime.utcnow(),
+        "topic": None,
+        "channel_name": CHANNEL_NAMES[user_id % 20]
+    }
+    join_time = sessions[user_id]["join_time"]
+    duration = datetime.datetime.utcnow() - join_time
+    int(duration.total_seconds())
+    del sessions[user_id]
+
+
+def table_cycle(sessions, user_id):
+    session = sessions.open((1, user_id), 1000 + user_id % 20)
+    session = sessions.close((1, user_id))
+    int(session.end_ts() - session.join_ts)
+
+
+def measure_cycle(cycle, sessions, rounds=200_000):
+    seconds = timeit.timeit(lambda: cycle(sessions, 42), number=rounds)
+    return seconds / rounds * 1e9
+
+
+def main():
+    dict_bytes = measure_memory(build_dicts)
+    table_bytes = measure_memory(build_table)
+    dict_ns = measure_cycle(dict_cycle, {})
+    table_ns = measure_cycle(table_cycle, SessionTable())
+
+    print(f"📦 記憶體 / {N:,} sessions")
+    print(f"   dict         : {dict_bytes / 1024:8.1f} KiB ({dict_bytes / N:.0f} B/session)")
+    print(f"   SessionTable : {table_bytes / 1024:8.1f} KiB ({table_bytes / N:.0f} B/session)")
+    print("⏱️  加入 + 離開 單次成本")
+    print(f"   dict         : {dict_ns:8.0f} ns")
+    print(f"   SessionTable : {table_ns:8.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
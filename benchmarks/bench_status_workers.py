@@ -0,0 +1,157 @@
+# =========================
+# benchmarks/bench_status_workers.py
+# 共享快照 + 多個狀態 worker 的吞吐量：同一份快照分別用 1 個與 N 個 uvicorn worker 服務 /health 與 /status
+# 不需要 Discord token：本腳本扮演 bot，每秒發布一份合成的狀態快照
+# 用法：python benchmarks/bench_status_workers.py [--workers 1,4] [--connections 64] [--seconds 5] [--clients 2]
+# =========================
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import run  # noqa: E402
+from status_snapshot import SnapshotReader, SnapshotWriter, StatusBoard, dumps  # noqa: E402
+
+
+def synthetic_board(guilds):
+    """和 Inside_Curl 的四個端點同樣形狀的 StatusBoard，/status 帶 guilds 個伺服器設定"""
+    board = StatusBoard(is_ready=True, ready_at=time.time(), active_sessions=42)
+    configs = {
+        str(guild_id): {"log_channel_id": guild_id * 10, "leave_grace": 30.0, "timezone": "Asia/Taipei"}
+        for guild_id in range(1, guilds + 1)
+    }
+    board.route("/")(lambda state: (
+        {"status": "ok", "bot_ready": True, "active_voice_sessions": state["active_sessions"]},
+        {"uptime_seconds": int(time.time() - state["ready_at"])}
+    ))
+    board.route("/health")(lambda state: (
+        {"status": "healthy", "bot_ready": True, "active_voice_sessions": state["active_sessions"]},
+        {"uptime_seconds": int(time.time() - state["ready_at"]), "timestamp": time.time()}
+    ))
+    board.route("/ping")(lambda state: ({"ping": "pong"}, {"timestamp": time.time()}))
+    board.route("/status")(lambda state: (
+        {"bot_status": "online", "active_voice_sessions": state["active_sessions"], "guilds": configs},
+        {
+            "uptime_seconds": int(time.time() - state["ready_at"]),
+            "log_queue": {str(g): {"depth": 0, "sent_messages": g} for g in range(1, guilds + 1)},
+            "runtime": {"loop_lag_ms": 0.4, "voice_events": 123456}
+        }
+    ))
+    return board
+
+
+def publisher(writer, board, interval, stop):
+    while not stop.wait(interval):
+        board.publish(active_sessions=board.state["active_sessions"] + 1)
+        writer.publish(dumps(board.export()))
+
+
+def bench_reader(path, rounds=200_000):
+    """worker 每個請求都要做的 read()：快照沒變時只讀序號"""
+    reader = SnapshotReader(path)
+    reader.read()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        reader.read()
+    unchanged = (time.perf_counter() - start) / rounds
+    reader.seq = -1
+    start = time.perf_counter()
+    reader.read()
+    changed = time.perf_counter() - start
+    return unchanged * 1e6, changed * 1e6, len(reader.data)
+
+
+def wait_healthy(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except (OSError, urllib.error.HTTPError):
+            pass
+        time.sleep(0.1)
+    raise TimeoutError("狀態 worker 未在時限內就緒")
+
+
+def client(args):
+    url, path, connections, seconds = args
+    return asyncio.run(run(url, "GET", path, connections, seconds))
+
+
+def drive(url, path, connections, seconds, clients):
+    """clients 個壓測行程一起打，避免壓測端自己先用滿一顆 CPU"""
+    per_client = max(1, connections // clients)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client, [(url, path, per_client, seconds)] * clients)
+    counts = {}
+    for _, part in results:
+        for code, n in part.items():
+            counts[code] = counts.get(code, 0) + n
+    return sum(rps for rps, _ in results), counts
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=f"1,{max(2, cpus)}")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=max(1, cpus // 2))
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="inside_curl_status_"), "status.shm")
+    writer = SnapshotWriter(path)
+    board = synthetic_board(args.guilds)
+    writer.publish(dumps(board.export()))
+    stop = threading.Event()
+    thread = threading.Thread(target=publisher, args=(writer, board, args.interval, stop), daemon=True)
+    thread.start()
+
+    unchanged_us, changed_us, size = bench_reader(path)
+    print(f"📦 快照 {size:,} bytes，每 {args.interval:g}s 發布一次（{cpus} 顆 CPU）")
+    print(f"   read() 快照沒變 : {unchanged_us:6.2f} µs")
+    print(f"   read() 剛發布   : {changed_us:6.2f} µs\n")
+    print(f"🎯 {args.connections} 連線 / {args.clients} 個壓測行程，每項 {args.seconds:g}s")
+
+    url = f"http://127.0.0.1:{args.port}"
+    for workers in (int(n) for n in args.workers.split(",")):
+        proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "status_worker:app", "--port", str(args.port),
+                "--workers", str(workers), "--log-level", "warning"
+            ],
+            cwd=ROOT,
+            env={**os.environ, "STATUS_SHM": path}
+        )
+        try:
+            wait_healthy(url)
+            for route in ("/health", "/status"):
+                rps, counts = drive(url, route, args.connections, args.seconds, args.clients)
+                codes = ", ".join(f"{code}×{n}" for code, n in sorted(counts.items()))
+                print(f"   {workers:>2} worker  GET {route:<8} {rps:10.0f} req/s   ({codes})")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    stop.set()
+    thread.join()
+    writer.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# =========================
+# benchmarks/load_test.py
+# 健康檢查端點壓力測試：多條 keep-alive 連線對 / /health /ping /status 發 GET 與 HEAD
+# 用法：python benchmarks/load_test.py http://127.0.0.1:10000 [--connections 32] [--seconds 5]
+# 改版前後各跑一次比較 requests/s
+# =========================
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+ROUTES = ("/", "/health", "/ping", "/status")
+
+
+async def _read_response(reader, method):
+    """讀一個 HTTP/1.1 回應（只支援 Content-Length，健康檢查端點都有）"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("連線被關閉")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value.strip())
+    if method != "HEAD" and length:
+        await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def worker(host, port, method, path, deadline, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+    try:
+        while time.perf_counter() < deadline:
+            writer.write(request)
+            status = await _read_response(reader, method)
+            counts[status] = counts.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(url, method, path, connections, seconds):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    counts = {}
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*(worker(host, port, method, path, deadline, counts) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    return sum(counts.values()) / elapsed, counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:10000")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"🎯 {args.url}（{args.connections} 連線，每項 {args.seconds:.0f}s）")
+    for path in ROUTES:
+        for method in ("GET", "HEAD"):
+            rps, counts = asyncio.run(run(args.url, method, path, args.connections, args.seconds))
+            codes = ", ".join(f"{code}×{n}" for code, n in sorted(counts.items()))
+            print(f"   {method:<4} {path:<8} {rps:10.0f} req/s   ({codes})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# =========================
+# benchmarks/replay.py
+# 離線事件重播：用假的 Member / VoiceState / 頻道 / Interaction 驅動真正的事件處理器
+# 不需要連上 Discord，記錄頻道換成本地的假 send()
+#
+# 用法：
+#   python benchmarks/replay.py                       # 合成的加入/離開/切換風暴
+#   python benchmarks/replay.py --events 50000 --members 2000 --preload 300
+#   python benchmarks/replay.py --replay events.jsonl  # 重播錄下來的事件
+#
+# events.jsonl 每行一筆：{"user": 1, "name": "小明", "before": 10, "after": null}
+#   before/after 是語音頻道 ID（null 代表不在語音）；{"user": 1, "topic": "微積分"} 代表 /record
+# =========================
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GUILD_ID = 1
+LOG_CHANNEL_ID = 2
+VOICE_CHANNEL_BASE = 1000
+
+_tmp = tempfile.mkdtemp(prefix="inside_curl_replay_")
+os.environ.setdefault("DISCORD_BOT_TOKEN", "replay")
+os.environ["GUILD_ID"] = str(GUILD_ID)
+os.environ["LOG_CHANNEL_ID"] = str(LOG_CHANNEL_ID)
+os.environ["SESSION_DB"] = os.path.join(_tmp, "replay.db")
+os.environ.setdefault("LOG_BATCH_WINDOW", "0.2")
+# JSON lines 日誌會干擾量測，重播時只留警告以上
+os.environ.setdefault("LOG_LEVEL", "warning")
+# 重播沒有真實時間間隔，寬限期會把所有進出合併；要測合併時自行設定 VOICE_LEAVE_GRACE
+os.environ.setdefault("VOICE_LEAVE_GRACE", "0")
+sys.path.insert(0, ROOT)
+
+import Inside_Curl as bot_module  # noqa: E402
+
+
+# =========================
+# 假物件
+# =========================
+class FakeVoiceChannel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+        self.members = []
+
+    def __eq__(self, other):
+        return isinstance(other, FakeVoiceChannel) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeLogChannel:
+    """記錄頻道的本地替身：模擬 API 延遲並計數"""
+
+    def __init__(self, channel_id, latency):
+        self.id = channel_id
+        self.name = "log"
+        self.latency = latency
+        self.messages = 0
+        self.lines = 0
+
+    async def send(self, content, silent=False, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages += 1
+        self.lines += content.count("\n") + 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id, voice_channels, log_channel):
+        self.id = guild_id
+        self.name = "Replay Guild"
+        self.shard_id = 0
+        self.voice_channels = voice_channels
+        self.members = {}
+        self._channels = {c.id: c for c in voice_channels}
+        self._channels[log_channel.id] = log_channel
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+
+class FakeMember:
+    def __init__(self, user_id, name, guild):
+        self.id = user_id
+        self.display_name = name
+        self.name = name
+        self.bot = False
+        self.guild = guild
+
+
+class FakeVoiceState:
+    __slots__ = ("channel",)
+
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.messages.append(content)
+
+    async def autocomplete(self, choices):
+        self.messages.append(choices)
+
+
+class FakeInteraction:
+    def __init__(self, member, guild, name, options=None):
+        self.user = member
+        self.guild = guild
+        self.guild_id = guild.id
+        self.response = FakeResponse()
+        self.data = {"name": name, "options": options or []}
+
+
+# =========================
+# 事件來源
+# =========================
+def synthetic_events(members, channels, count, record_ratio, seed, where):
+    """隨機產生加入/離開/切換事件，維持每個人的目前頻道讓事件合理"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        member = rng.choice(members)
+        current = where.get(member.id)
+        if rng.random() < record_ratio and current is not None:
+            yield ("record", member, rng.choice(("微積分", "線性代數", "英文", "物理")))
+            continue
+        if current is None:
+            after = rng.choice(channels)
+        elif rng.random() < 0.3 and len(channels) > 1:
+            after = rng.choice([c for c in channels if c is not current])
+        else:
+            after = None
+        where[member.id] = after
+        yield ("voice", member, current, after)
+
+
+def recorded_events(path, guild, members_by_id, channels_by_id):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            member = members_by_id.get(row["user"])
+            if member is None:
+                member = members_by_id[row["user"]] = FakeMember(
+                    row["user"], row.get("name", str(row["user"])), guild
+                )
+                guild.members[member.id] = member
+            if "topic" in row:
+                yield ("record", member, row["topic"])
+                continue
+            before = channels_by_id.get(row.get("before"))
+            after = channels_by_id.get(row.get("after"))
+            yield ("voice", member, before, after)
+
+
+# =========================
+# 重播
+# =========================
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def replay(args):
+    log_channel = FakeLogChannel(LOG_CHANNEL_ID, args.send_latency)
+    channels = [
+        FakeVoiceChannel(VOICE_CHANNEL_BASE + i, f"📚 自習室 {i}") for i in range(args.channels)
+    ]
+    guild = FakeGuild(GUILD_ID, channels, log_channel)
+    members = [FakeMember(10_000 + i, f"user{i}", guild) for i in range(args.members)]
+    guild.members = {m.id: m for m in members}
+    channels_by_id = {c.id: c for c in channels}
+
+    bot = bot_module.bot
+    bot.get_guild = lambda guild_id: guild if guild_id == GUILD_ID else None
+    bot.get_channel = guild.get_channel
+
+    async def no_sync(*a, **kw):
+        return []
+    bot.tree.sync = no_sync
+
+    await bot.setup_hook()
+
+    # 啟動前已在語音頻道的人，交給 on_ready 對帳
+    where = {}
+    for i, member in enumerate(members[:args.preload]):
+        channels[i % len(channels)].members.append(member)
+        where[member.id] = channels[i % len(channels)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        await bot_module.on_shard_ready(0)
+        await bot_module.on_ready()
+        ready_ms = (time.perf_counter() - start) * 1000
+    for channel in channels:
+        channel.members.clear()
+
+    if args.replay:
+        events = list(recorded_events(args.replay, guild, guild.members, channels_by_id))
+    else:
+        events = list(synthetic_events(
+            members, channels, args.events, args.record_ratio, args.seed, where
+        ))
+
+    voice_latency, record_latency = [], []
+    sink = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for event in events:
+            t0 = time.perf_counter()
+            if event[0] == "voice":
+                _, member, before, after = event
+                await bot_module.on_voice_state_update(member, FakeVoiceState(before), FakeVoiceState(after))
+                voice_latency.append(time.perf_counter() - t0)
+            else:
+                _, member, topic = event
+                interaction = FakeInteraction(member, guild, "record")
+                await bot_module.record.callback(interaction, topic)
+                record_latency.append(time.perf_counter() - t0)
+            # 讓背景發送 task 有機會執行，模擬真實的 event loop 交錯
+            sink.seek(0)
+            sink.truncate()
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        await bot_module.log_senders.close()
+    await asyncio.to_thread(bot_module.session_store.close)
+
+    voice_latency.sort()
+    record_latency.sort()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"🎬 重播 {len(events):,} 筆事件（{args.members} 人 / {args.channels} 個頻道）")
+    print(f"   on_ready 對帳     : {ready_ms:.1f} ms（{args.preload} 人已在語音）")
+    print(f"   吞吐量            : {len(events) / elapsed:,.0f} events/s")
+    if voice_latency:
+        print(
+            f"   語音事件 p50/p99  : {percentile(voice_latency, 0.5) * 1e6:.0f} / "
+            f"{percentile(voice_latency, 0.99) * 1e6:.0f} µs（平均 {statistics.mean(voice_latency) * 1e6:.0f} µs）"
+        )
+    if record_latency:
+        print(
+            f"   /record p50/p99   : {percentile(record_latency, 0.5) * 1e6:.0f} / "
+            f"{percentile(record_latency, 0.99) * 1e6:.0f} µs"
+        )
+    print(f"   記錄頻道          : {log_channel.messages} 則訊息 / {log_channel.lines} 行通知")
+    print(f"   峰值 RSS          : {peak_rss:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--preload", type=int, default=100)
+    parser.add_argument("--record-ratio", type=float, default=0.05)
+    parser.add_argument("--send-latency", type=float, default=0.05, help="假 send() 的延遲（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replay", help="錄下來的 events.jsonl")
+    args = parser.parse_args()
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# =========================
+# broadcast.py
+# 語音動態的廣播中心：bot 發布一次、序列化一次，扇出給所有 SSE 訂閱者
+# 發布端在 bot 的 event loop，訂閱端在 web 的 event loop（可能是不同執行緒）
+# =========================
+import asyncio
+import threading
+import time
+from collections import deque
+
+from status_snapshot import dumps
+
+
+def sse_frame(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    """
+    每個連線一個有上限的緩衝區。塞滿代表客戶端跟不上：
+    清空緩衝區並標記 lagged，串流端下次改送一份最新快照，
+    所以慢客戶端只會少看到中間過程，不會讓發布端等待。
+    """
+
+    __slots__ = ("loop", "buffer", "maxlen", "wakeup", "signaled", "lagged")
+
+    def __init__(self, loop, maxlen):
+        self.loop = loop
+        self.buffer = deque()
+        self.maxlen = maxlen
+        self.wakeup = asyncio.Event()
+        self.signaled = False
+        self.lagged = False
+
+    def _wake(self):
+        self.wakeup.set()
+
+    def push(self, frame):
+        """回傳 False 代表溢位（由發布端在鎖內呼叫）"""
+        overflow = len(self.buffer) >= self.maxlen
+        if overflow:
+            self.buffer.clear()
+            self.lagged = True
+        else:
+            self.buffer.append(frame)
+        # 同一批事件只叫醒一次，避免每筆都 call_soon_threadsafe
+        if not self.signaled:
+            self.signaled = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass
+        return not overflow
+
+    def resync(self):
+        """丟掉尚未送出的事件，下次改送最新快照（由發布端在鎖內呼叫）"""
+        self.buffer.clear()
+        self.lagged = True
+        if not self.signaled:
+            self.signaled = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass
+
+
+class BroadcastHub:
+    """
+    publish() 在鎖內更新目前在線名單、序列化一次、放進每個訂閱者的緩衝區，
+    不做任何 await。subscribe() 也在同一把鎖內取快照，
+    所以新訂閱者的「快照 + 之後的事件」不會漏也不會重複。
+    """
+
+    def __init__(self, buffer_size=256, heartbeat=15.0):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.live = {}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.closed = False
+        self.published = 0
+        self.lag_resets = 0
+
+    def publish(self, kind, guild_id, user_id, **fields):
+        event = {"type": kind, "guild_id": guild_id, "user_id": user_id, "ts": round(time.time(), 3), **fields}
+        key = (guild_id, user_id)
+        with self._lock:
+            if kind == "close":
+                self.live.pop(key, None)
+            else:
+                self.live[key] = {**self.live.get(key, {}), **fields, "guild_id": guild_id, "user_id": user_id}
+            self.published += 1
+            if not self._subscribers:
+                return
+            frame = sse_frame("session", event)
+            for sub in self._subscribers:
+                if not sub.push(frame):
+                    self.lag_resets += 1
+
+    def publish_room(self, kind, guild_id, channel_id, **fields):
+        """房間層級事件（第一個人進來、最後一個人離開、人數新高）：只轉送，不影響在線名單"""
+        event = {"type": kind, "guild_id": guild_id, "channel_id": channel_id, "ts": round(time.time(), 3), **fields}
+        with self._lock:
+            self.published += 1
+            if not self._subscribers:
+                return
+            frame = sse_frame("room", event)
+            for sub in self._subscribers:
+                if not sub.push(frame):
+                    self.lag_resets += 1
+
+    def reset(self):
+        """清空在線名單（失去 leader 身分時），所有訂閱者改收一份新的快照"""
+        with self._lock:
+            self.live.clear()
+            for sub in self._subscribers:
+                sub.resync()
+
+    def close(self):
+        """關機時結束所有串流，web server 才不會卡在長連線上"""
+        with self._lock:
+            self.closed = True
+            for sub in self._subscribers:
+                sub.push(b"")
+
+    def _snapshot_frame(self):
+        return sse_frame("snapshot", {"ts": round(time.time(), 3), "sessions": list(self.live.values())})
+
+    def subscribe(self):
+        sub = Subscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            snapshot = self._snapshot_frame()
+            self._subscribers.add(sub)
+        return sub, snapshot
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _take(self, sub):
+        with self._lock:
+            sub.signaled = False
+            sub.wakeup.clear()
+            if sub.lagged:
+                sub.lagged = False
+                sub.buffer.clear()
+                return self._snapshot_frame()
+            frames = b"".join(sub.buffer)
+            sub.buffer.clear()
+            return frames
+
+    async def stream(self):
+        """SSE 產生器：先送快照，之後送事件；閒置時送註解當心跳"""
+        sub, snapshot = self.subscribe()
+        try:
+            yield b"retry: 3000\n" + snapshot
+            while not self.closed:
+                try:
+                    await asyncio.wait_for(sub.wakeup.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                frames = self._take(sub)
+                if frames:
+                    yield frames
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "live": len(self.live),
+            "published": self.published,
+            "lag_resets": self.lag_resets
+        }
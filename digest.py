@@ -0,0 +1,224 @@
+# =========================
+# digest.py
+# 每日 / 每週學習摘要：一次 SQL 彙總已結束的 session，依伺服器設定的時區切日
+# compute_digests() 只碰呼叫端給的連線，在背景執行緒跑；排版與發送留給 event loop
+# =========================
+import datetime
+import heapq
+from operator import itemgetter
+
+import pytz
+
+PERIODS = ("day", "week", "month")
+# 只掃描視窗開始前這麼久以內開始的 session（走 start_ts 索引）；更長的 session 跨進視窗的部分不計
+MAX_SESSION_SECONDS = 2 * 86400
+TOP_N = 5
+TOP_LONGEST = 3
+
+# 切窗在 SQLite 裡做：每個 session 與「視窗表」（昨天、上週…）join，
+# 一次算出它落在各視窗內的秒數（跨午夜的只算重疊的部分），再依 (視窗, 伺服器, 頻道, 用戶, 主題) 彙總。
+# CROSS JOIN 固定 session 在外層，只掃描一次 start_ts 涵蓋索引；視窗表只有幾列。
+# GROUP BY 把最分散的 user_id 放第一個，排序比較大多在第一欄就分出大小。
+# MAX() 是唯一的聚合 min/max，SQLite 會讓 s.id 取自最長的那一筆 session。
+AGGREGATE_SQL = """
+WITH windows(idx, window_start, window_end) AS (VALUES {windows}),
+src AS (
+    SELECT id, guild_id, user_id, channel_id, topic, start_ts, end_ts FROM sessions
+    WHERE start_ts >= ? AND start_ts < ? AND guild_id IN ({guilds}){live}
+)
+SELECT w.idx, s.guild_id, s.channel_id, s.user_id, s.topic,
+       SUM(MIN(s.end_ts, w.window_end) - MAX(s.start_ts, w.window_start)),
+       MAX(s.end_ts - s.start_ts), s.id
+FROM src AS s CROSS JOIN windows AS w
+WHERE s.start_ts < w.window_end AND s.end_ts > w.window_start
+GROUP BY s.user_id, s.channel_id, s.topic, s.guild_id, w.idx
+"""
+
+# 還沒結束的 session 放在連線自己的 TEMP 表，不受 SQL 變數數量上限（舊版 999）影響
+LIVE_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS digest_live (
+    id INTEGER, guild_id INTEGER, user_id INTEGER, channel_id INTEGER, topic TEXT, start_ts REAL, end_ts REAL
+)
+"""
+LIVE_SQL = " UNION ALL SELECT id, guild_id, user_id, channel_id, topic, start_ts, end_ts FROM temp.digest_live"
+
+
+def resolve_timezone(name):
+    """時區名稱 -> pytz 時區；名稱錯誤丟 ValueError"""
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"未知的時區：{name}")
+
+
+def local_midnight(tz, day):
+    """本地某天 00:00 的 epoch（日光節約切換那天不是 86400 秒）"""
+    return tz.localize(datetime.datetime.combine(day, datetime.time())).timestamp()
+
+
+class Window:
+    """一份摘要涵蓋的本地日期：first_day 起連續 days 天；bucket 與 rollups 的命名一致"""
+
+    __slots__ = ("period", "bucket", "first_day", "days")
+
+    def __init__(self, period, bucket, first_day, days):
+        self.period = period
+        self.bucket = bucket
+        self.first_day = first_day
+        self.days = days
+
+    @property
+    def end_day(self):
+        return self.first_day + datetime.timedelta(days=self.days)
+
+
+def window_for(period, day):
+    """包含本地日期 day 的 日 / 週 / 月 視窗"""
+    if period == "day":
+        return Window(period, day.isoformat(), day, 1)
+    if period == "week":
+        first = day - datetime.timedelta(days=day.weekday())
+        year, week, _ = first.isocalendar()
+        return Window(period, f"{year}-W{week:02d}", first, 7)
+    if period == "month":
+        first = day.replace(day=1)
+        following = (first + datetime.timedelta(days=32)).replace(day=1)
+        return Window(period, f"{first.year}-{first.month:02d}", first, (following - first).days)
+    raise ValueError(f"未知的週期：{period}")
+
+
+def last_completed(tz, period, now):
+    """now 之前最近一個已經結束的週期"""
+    today = datetime.datetime.fromtimestamp(now, tz).date()
+    return window_for(period, window_for(period, today).first_day - datetime.timedelta(days=1))
+
+
+def next_midnight(tz, now):
+    today = datetime.datetime.fromtimestamp(now, tz).date()
+    return local_midnight(tz, today + datetime.timedelta(days=1))
+
+
+def _load_live(conn, live):
+    """
+    live 寫進 TEMP 表。唯讀連線（history.open_readonly）開了 query_only，連 TEMP 表也不能寫，
+    暫時關掉；主資料庫仍以 mode=ro 開啟，寫不進去。
+    """
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    conn.execute("PRAGMA query_only=OFF")
+    try:
+        conn.execute(LIVE_TABLE)
+        conn.execute("DELETE FROM temp.digest_live")
+        conn.executemany("INSERT INTO temp.digest_live VALUES (?, ?, ?, ?, ?, ?, ?)", live)
+        conn.commit()
+    finally:
+        conn.execute(f"PRAGMA query_only={int(query_only)}")
+
+
+def aggregate(conn, guild_ids, bounds, live=()):
+    """
+    bounds 是各視窗的 (起點, 終點) epoch。
+    live 是還沒結束的 session (id, guild_id, user_id, channel_id, topic, start_ts, 目前時間)，
+    id 用負數避免和歷史表撞號。
+    回傳 (第幾個視窗, guild_id, channel_id, user_id, topic, 秒數, 最長 session 秒數, 最長 session id)。
+    """
+    params = []
+    for i, (start, end) in enumerate(bounds):
+        params.extend((i, start, end))
+    params.extend((min(start for start, _ in bounds) - MAX_SESSION_SECONDS, max(end for _, end in bounds)))
+    params.extend(guild_ids)
+    if live:
+        _load_live(conn, live)
+    sql = AGGREGATE_SQL.format(
+        windows=", ".join("(?, ?, ?)" for _ in bounds),
+        guilds=", ".join("?" for _ in guild_ids),
+        live=LIVE_SQL if live else ""
+    )
+    return conn.execute(sql, params).fetchall()
+
+
+class Tally:
+    """一個伺服器或一個頻道在一份摘要裡的累計"""
+
+    __slots__ = ("seconds", "users", "topics", "longest")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.users = {}
+        self.topics = {}
+        self.longest = {}  # session id -> (秒數, user_id, channel_id, topic)
+
+    def add(self, channel_id, user_id, topic, seconds, longest, session_id):
+        self.seconds += seconds
+        self.users[user_id] = self.users.get(user_id, 0.0) + seconds
+        if topic:
+            self.topics[topic] = self.topics.get(topic, 0.0) + seconds
+        self.longest[session_id] = (longest, user_id, channel_id, topic)
+
+    def summary(self, top=TOP_N):
+        return {
+            "seconds": round(self.seconds),
+            "active_users": len(self.users),
+            "top_users": [
+                [user_id, round(seconds)]
+                for user_id, seconds in heapq.nlargest(top, self.users.items(), key=itemgetter(1))
+            ],
+            "top_topics": [
+                [topic, round(seconds)]
+                for topic, seconds in heapq.nlargest(top, self.topics.items(), key=itemgetter(1))
+            ],
+            "longest": [
+                {"user_id": user_id, "channel_id": channel_id, "topic": topic, "seconds": round(seconds)}
+                for seconds, user_id, channel_id, topic in heapq.nlargest(
+                    TOP_LONGEST, self.longest.values(), key=itemgetter(0)
+                )
+            ]
+        }
+
+
+def compute_digests(conn, tz, guild_ids, windows, live=(), empty=False, canonical=None):
+    """
+    所有視窗（例如昨天 + 上週）一起查一次，彙總列帶著視窗索引分給各視窗。
+    回傳每個 (伺服器, 視窗) 一份摘要，沒有紀錄的伺服器除非 empty=True 否則不回傳。
+    canonical(guild_id, topic) 把原始寫法換成標準主題，熱門主題依標準主題合計。
+    """
+    if not guild_ids or not windows:
+        return []
+    bounds = [(local_midnight(tz, w.first_day), local_midnight(tz, w.end_day)) for w in windows]
+    tallies = [{} for _ in windows]
+    for idx, guild_id, channel_id, user_id, topic, seconds, longest, session_id in aggregate(
+        conn, guild_ids, bounds, live
+    ):
+        if canonical is not None and topic:
+            topic = canonical(guild_id, topic)
+        guild = tallies[idx].get(guild_id)
+        if guild is None:
+            guild = tallies[idx][guild_id] = (Tally(), {})
+        channel = guild[1].get(channel_id)
+        if channel is None:
+            channel = guild[1][channel_id] = Tally()
+        guild[0].add(channel_id, user_id, topic, seconds, longest, session_id)
+        channel.add(channel_id, user_id, topic, seconds, longest, session_id)
+
+    digests = []
+    for window, (start, end), guilds in zip(windows, bounds, tallies):
+        for guild_id in guild_ids:
+            guild = guilds.get(guild_id)
+            if guild is None:
+                if not empty:
+                    continue
+                guild = (Tally(), {})
+            total, channels = guild
+            digests.append({
+                "guild_id": guild_id,
+                "period": window.period,
+                "bucket": window.bucket,
+                "timezone": tz.zone,
+                "start_ts": start,
+                "end_ts": end,
+                **total.summary(),
+                "channels": [
+                    {"channel_id": channel_id, **tally.summary(3)}
+                    for channel_id, tally in sorted(channels.items(), key=lambda item: -item[1].seconds)
+                ]
+            })
+    return digests
@@ -0,0 +1,74 @@
+# =========================
+# guild_config.py
+# 多伺服器設定：每個伺服器的記錄頻道、門檻與時區
+# =========================
+import json
+
+from digest import resolve_timezone
+
+
+class GuildConfig:
+    __slots__ = ("guild_id", "log_channel_id", "leave_grace", "timezone")
+
+    def __init__(self, guild_id, log_channel_id, leave_grace, timezone="UTC"):
+        self.guild_id = guild_id
+        self.log_channel_id = log_channel_id
+        self.leave_grace = leave_grace
+        self.timezone = timezone
+
+    def as_dict(self):
+        return {
+            "log_channel_id": self.log_channel_id,
+            "leave_grace": self.leave_grace,
+            "timezone": self.timezone
+        }
+
+
+def load_guild_configs(spec, legacy_guild_id=0, legacy_log_channel_id=0, default_leave_grace=30.0,
+                       default_timezone="UTC"):
+    """
+    spec 是 JSON 字串或 JSON 檔路徑：
+        {"123456": {"log_channel_id": 789, "leave_grace": 60, "timezone": "Asia/Taipei"}, ...}
+    舊的 GUILD_ID + LOG_CHANNEL_ID 仍然有效，視為只有一個伺服器的設定。
+    回傳 {guild_id: GuildConfig}；格式錯誤時丟 ValueError。
+    """
+    raw = {}
+    if spec:
+        text = spec
+        if not spec.lstrip().startswith("{"):
+            with open(spec, encoding="utf-8") as f:
+                text = f.read()
+        try:
+            raw = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"GUILD_CONFIG 不是合法的 JSON：{e}")
+    if legacy_guild_id and legacy_log_channel_id:
+        raw.setdefault(str(legacy_guild_id), {"log_channel_id": legacy_log_channel_id})
+
+    configs = {}
+    for guild_id, options in raw.items():
+        try:
+            configs[int(guild_id)] = GuildConfig(
+                int(guild_id),
+                int(options["log_channel_id"]),
+                float(options.get("leave_grace", default_leave_grace)),
+                options.get("timezone", default_timezone)
+            )
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"伺服器 {guild_id} 的設定需要 log_channel_id")
+        # 摘要依這個時區切日；名稱錯誤在啟動時就擋下
+        resolve_timezone(configs[int(guild_id)].timezone)
+    return configs
+
+
+def parse_shard_ids(value):
+    """SHARD_IDS="0,1,2" -> [0, 1, 2]；未設定回傳 None（由 discord.py 自動決定）"""
+    if not value:
+        return None
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def shard_of(guild_id, shard_count):
+    """Discord 的分片公式"""
+    return (guild_id >> 22) % shard_count if shard_count else 0
+
@@ -0,0 +1,176 @@
+# =========================
+# history.py
+# 已結束 session 的歷史查詢：索引範圍掃描 + cursor 分頁 + NDJSON / CSV 串流
+# =========================
+import base64
+import csv
+import datetime
+import io
+import sqlite3
+import zlib
+
+from status_snapshot import dumps
+
+COLUMNS = ("id", "guild_id", "user_id", "channel_id", "topic", "start_ts", "end_ts")
+CSV_HEADER = COLUMNS + ("duration_seconds",)
+# 每次從 SQLite 取多少列、合併成一個 chunk 送出
+CHUNK_ROWS = 500
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_time(value):
+    """epoch 秒數或 ISO 8601（沒有時區視為 UTC）-> epoch 秒數"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"無法解析時間：{value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def encode_cursor(start_ts, row_id):
+    raw = f"{start_ts!r}:{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start_ts, row_id = raw.split(":")
+        return float(start_ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise QueryError("cursor 格式錯誤")
+
+
+class SessionQuery:
+    """
+    查詢條件。(start_ts, id) 是排序鍵也是 cursor：下一頁從 cursor 指到的那一列開始，
+    所以翻到第幾頁都只掃描該頁的索引範圍，不需要 OFFSET 跳過前面的頁。
+    有 user_id 時走 (user_id, start_ts) 索引，否則走 (start_ts) 索引。
+    """
+
+    def __init__(self, user_id=None, topic=None, channel_id=None, since=None, until=None,
+                 cursor=None, limit=1000, guild_id=None):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.topic = topic
+        self.channel_id = channel_id
+        self.since = parse_time(since)
+        self.until = parse_time(until)
+        self.cursor = decode_cursor(cursor) if cursor else None
+        self.limit = limit
+
+    def _where(self):
+        clauses, params = [], []
+        if self.user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(self.user_id)
+        if self.since is not None:
+            clauses.append("start_ts >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append("start_ts < ?")
+            params.append(self.until)
+        if self.cursor is not None:
+            clauses.append("(start_ts, id) >= (?, ?)")
+            params.extend(self.cursor)
+        if self.topic is not None:
+            clauses.append("topic = ?")
+            params.append(self.topic)
+        if self.channel_id is not None:
+            clauses.append("channel_id = ?")
+            params.append(self.channel_id)
+        if self.guild_id is not None:
+            clauses.append("guild_id = ?")
+            params.append(self.guild_id)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params
+
+    def next_cursor(self, conn):
+        """下一頁第一列的鍵；沒有下一頁回傳 None（OFFSET 只跳過本頁的 limit 列）"""
+        if not self.limit:
+            return None
+        where, params = self._where()
+        row = conn.execute(
+            f"SELECT start_ts, id FROM sessions{where} ORDER BY start_ts, id LIMIT 1 OFFSET ?",
+            params + [self.limit]
+        ).fetchone()
+        return encode_cursor(*row) if row else None
+
+    def rows(self, conn):
+        where, params = self._where()
+        sql = f"SELECT {', '.join(COLUMNS)} FROM sessions{where} ORDER BY start_ts, id"
+        if self.limit:
+            sql += " LIMIT ?"
+            params.append(self.limit)
+        cur = conn.execute(sql, params)
+        while True:
+            batch = cur.fetchmany(CHUNK_ROWS)
+            if not batch:
+                return
+            yield batch
+
+
+def open_readonly(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def user_topics(conn, guild_id, user_id):
+    """某用戶在某伺服器用過的主題 (topic, 次數, 最後使用時間)，走 (user_id, start_ts) 索引"""
+    return conn.execute(
+        "SELECT topic, COUNT(*), MAX(end_ts) FROM sessions "
+        "WHERE user_id = ? AND guild_id = ? AND topic IS NOT NULL GROUP BY topic",
+        (user_id, guild_id)
+    ).fetchall()
+
+
+def stream_ndjson(conn, query):
+    try:
+        for batch in query.rows(conn):
+            yield b"".join(
+                dumps({**dict(zip(COLUMNS, row)), "duration_seconds": row[6] - row[5]}) + b"\n"
+                for row in batch
+            )
+    finally:
+        conn.close()
+
+
+def gzip_stream(chunks):
+    """逐塊 gzip 壓縮串流；中途斷線時關閉原本的產生器（連帶關閉連線）"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
+
+def stream_csv(conn, query):
+    try:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(CSV_HEADER)
+        for batch in query.rows(conn):
+            writer.writerows(row + (row[6] - row[5],) for row in batch)
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode("utf-8")
+    finally:
+        conn.close()
@@ -0,0 +1,153 @@
+# =========================
+# jsonlog.py
+# 非阻塞的結構化日誌：event loop 只把紀錄放進環形緩衝區，
+# 背景執行緒負責序列化成 JSON lines 並寫到 stdout
+# =========================
+import atexit
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from status_snapshot import dumps
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+def parse_sampling(spec):
+    """
+    LOG_SAMPLE="voice.reconcile_member=20,debug=5" -> {"voice.reconcile_member": 20, "debug": 5}（每 N 筆留 1 筆）。
+    key 是事件名稱或等級，事件名稱優先
+    """
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, every = part.partition("=")
+        key = key.strip()
+        rates[key.lower() if key.lower() in LEVELS else key] = max(1, int(every))
+    return rates
+
+
+class LogPipeline:
+    """
+    emit() 只做等級判斷、取樣計數（依事件名稱，沒設定再依等級）和一次 deque.append，不碰 I/O。
+    緩衝區滿了就丟棄新紀錄並計數，絕不阻塞呼叫端；
+    stdout 被慢速的 log shipper 卡住時，只會拖慢背景寫入執行緒。
+    """
+
+    def __init__(self, stream=None, level="info", capacity=10000, sampling=None, flush_interval=0.1):
+        self.stream = stream or sys.stdout
+        self.threshold = LEVELS.get(level.lower(), 20)
+        self.capacity = capacity
+        self.sampling = sampling or {}
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._seen = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.emitted = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="jsonlog", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def emit(self, level, event, msg, **fields):
+        if LEVELS[level] < self.threshold:
+            return
+        key = event if event in self.sampling else level
+        every = self.sampling.get(key)
+        if every and every > 1:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            if seen % every:
+                self.sampled_out += 1
+                return
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append((time.time(), level, event, msg, fields))
+        self.emitted += 1
+
+    def debug(self, event, msg, **fields):
+        self.emit("debug", event, msg, **fields)
+
+    def info(self, event, msg, **fields):
+        self.emit("info", event, msg, **fields)
+
+    def warning(self, event, msg, **fields):
+        self.emit("warning", event, msg, **fields)
+
+    def error(self, event, msg, **fields):
+        self.emit("error", event, msg, **fields)
+
+    def exception(self, event, msg, **fields):
+        """在 except 區塊裡呼叫，附上 traceback"""
+        self.emit("error", event, msg, traceback=traceback.format_exc(), **fields)
+
+    # ---------- 背景寫入 ----------
+    def _serialize(self, record):
+        ts, level, event, msg, fields = record
+        return dumps({"ts": round(ts, 3), "level": level, "event": event, "msg": msg, **fields})
+
+    def _drain(self):
+        lines = []
+        buffer = self._buffer
+        while buffer:
+            try:
+                record = buffer.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(self._serialize(record))
+            except TypeError:
+                ts, level, event, msg, fields = record
+                lines.append(self._serialize((ts, level, event, msg, {k: str(v) for k, v in fields.items()})))
+        if not lines:
+            return
+        data = b"\n".join(lines) + b"\n"
+        try:
+            out = getattr(self.stream, "buffer", None)
+            if out is not None:
+                out.write(data)
+            else:
+                self.stream.write(data.decode("utf-8"))
+            self.stream.flush()
+            self.written += len(lines)
+        except (OSError, ValueError):
+            self.dropped += len(lines)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._drain()
+
+    def stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "emitted": self.emitted,
+            "written": self.written,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped
+        }
+
+
+# 全程式共用的 logger，設定來自環境變數；
+# 取樣在等級判斷之後，預設 info 等級下要有效果就得以事件名稱指定（對帳時每位成員一行的紀錄）
+log = LogPipeline(
+    level=os.getenv("LOG_LEVEL", "info"),
+    capacity=int(os.getenv("LOG_BUFFER", 10000)),
+    sampling=parse_sampling(os.getenv("LOG_SAMPLE", "voice.reconcile_member=20,debug=20"))
+)
+log.start()
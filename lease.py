@@ -0,0 +1,272 @@
+# =========================
+# lease.py
+# 主備切換：多個實例競爭同一份租約，只有持有者（leader）處理語音事件、寫入資料庫、發記錄頻道通知
+# 租約後端可替換：SqliteLease（有到期時間，卡住的 leader 也會被接手）、FileLease（flock，行程結束就釋放）
+# =========================
+import asyncio
+import os
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 flock，只能用 SqliteLease
+    fcntl = None
+
+from jsonlog import log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    epoch INTEGER NOT NULL
+)
+"""
+
+# 自己持有就續約；別人持有但已過期就接手並把 epoch 加一；否則不變
+_ACQUIRE = """
+INSERT INTO leases (name, holder, expires_at, epoch) VALUES (?, ?, ?, 1)
+ON CONFLICT (name) DO UPDATE SET
+    epoch = CASE WHEN leases.holder = excluded.holder THEN leases.epoch ELSE leases.epoch + 1 END,
+    holder = excluded.holder,
+    expires_at = excluded.expires_at
+WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+"""
+
+
+class SqliteLease:
+    """
+    租約存在 SQLite 的 leases 表（預設和 SESSION_DB 同一個檔案）。
+    到期時間用牆上時間比較，所以共用這個檔案的實例必須在同一台機器上（SQLite 本來就不該放網路磁碟）。
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path, name="leader", timeout=2.0):
+        self.path = path
+        self.name = name
+        # 自動提交：每次續約各自是一個很短的寫入交易；鎖等太久就當作這輪續約失敗
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+
+    def acquire(self, holder, ttl):
+        """取得或續約，回傳目前的 (持有者, epoch)"""
+        now = time.time()
+        self._conn.execute(_ACQUIRE, (self.name, holder, now + ttl, now))
+        return self._conn.execute("SELECT holder, epoch FROM leases WHERE name = ?", (self.name,)).fetchone()
+
+    def release(self, holder):
+        """正常關機時讓租約立刻到期，standby 下一輪就能接手"""
+        self._conn.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?", (self.name, holder))
+
+    def close(self):
+        self._conn.close()
+
+
+class FileLease:
+    """
+    對鎖定檔 flock：行程結束（含 crash、kill -9）時 kernel 立刻釋放，standby 下一輪就能接手。
+    沒有到期時間：leader 卡住但沒死時不會被接手，需要處理這種情況請用 SqliteLease。
+    epoch 與持有者寫在鎖定檔內容裡，只供顯示。
+    """
+
+    kind = "file"
+
+    def __init__(self, path, name="leader"):
+        if fcntl is None:
+            raise OSError("這個平台不支援 flock，請改用 LEASE_BACKEND=sqlite")
+        self.path = f"{path}.{''.join(c if c.isalnum() else '_' for c in name)}"
+        self._fd = None
+        self._epoch = None
+
+    def _read(self, fd):
+        raw = os.pread(fd, 256, 0).decode("utf-8", "replace").split(" ", 1)
+        try:
+            return raw[1].strip(), int(raw[0])
+        except (IndexError, ValueError):
+            return None, 0
+
+    def acquire(self, holder, ttl):
+        if self._fd is not None:
+            return holder, self._epoch
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            current = self._read(fd)
+            os.close(fd)
+            return current
+        _, epoch = self._read(fd)
+        self._epoch = epoch + 1
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{self._epoch} {holder}\n".encode("utf-8"), 0)
+        self._fd = fd
+        return holder, self._epoch
+
+    def release(self, holder):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        self.release(None)
+
+
+class LeaderElector:
+    """
+    leader 每 ttl/3 秒續約，standby 每 retry 秒嘗試取得。
+    is_leader 以本機 monotonic 時間判斷：上次續約「開始」時間 + ttl - margin 之前才算數，
+    所以續約卡住（資料庫被鎖、event loop 卡住）時，本實例會在租約真正到期、別人能接手之前就先停手；
+    資料庫寫入與記錄頻道發送都以 is_leader 當閘門，不會有兩個實例同時寫或重複發通知。
+
+    取得租約後在背景執行 on_promote()（從共享資料庫重新載入狀態、和 Discord 對帳），完成後 serving 才為真；
+    失去租約時呼叫 on_demote()。
+    """
+
+    def __init__(self, backend, holder, ttl=6.0, retry=1.0, on_promote=None, on_demote=None):
+        self.backend = backend
+        self.holder = holder
+        self.ttl = ttl
+        self.retry = retry
+        self.margin = ttl / 5
+        self.on_promote = on_promote
+        self.on_demote = on_demote
+        self.leader = False
+        self.active = False
+        self.epoch = None
+        self.current_holder = None
+        self._deadline = 0.0
+        self._task = None
+        self._promoting = None
+        self.leader_since = None
+        self.promotions = 0
+        self.demotions = 0
+        self.renew_failures = 0
+        self.last_renew_ms = None
+        self.last_promote_ms = None
+
+    @property
+    def is_leader(self):
+        return self.leader and time.monotonic() < self._deadline
+
+    @property
+    def serving(self):
+        """持有租約且已載入完狀態：可以處理事件"""
+        return self.active and self.is_leader
+
+    @property
+    def role(self):
+        if self.serving:
+            return "leader"
+        return "promoting" if self.is_leader else "standby"
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="lease")
+
+    async def _run(self):
+        while True:
+            await self._tick()
+            await asyncio.sleep(self.ttl / 3 if self.leader else self.retry)
+
+    async def _tick(self):
+        start = time.monotonic()
+        # 上一輪續約後超過期限才回來（event loop 卡住）：期間的寫入已被擋掉，狀態要重新載入
+        lapsed = self.leader and not self.is_leader
+        try:
+            holder, epoch = await asyncio.to_thread(self.backend.acquire, self.holder, self.ttl)
+        except Exception as e:
+            # 暫時連不到後端：在期限內維持現狀，超過期限就降級
+            self.renew_failures += 1
+            log.warning("lease.renew_failed", f"⚠️  租約續約失敗: {e}", holder=self.holder)
+            if self.leader and not self.is_leader:
+                await self._demote("expired")
+            return
+        self.last_renew_ms = round((time.monotonic() - start) * 1000, 2)
+        self.current_holder = holder
+        if holder == self.holder:
+            if self.leader and (lapsed or epoch != self.epoch):
+                await self._demote("expired")
+            self._deadline = start + self.ttl - self.margin
+            self.epoch = epoch
+            if not self.leader:
+                self._promote()
+        elif self.leader:
+            await self._demote("taken")
+
+    def _promote(self):
+        self.leader = True
+        self.leader_since = time.time()
+        self.promotions += 1
+        log.info("lease.acquired", f"👑 取得租約，成為 leader（epoch {self.epoch}）", holder=self.holder, epoch=self.epoch)
+        self._promoting = asyncio.create_task(self._activate(), name="lease-promote")
+
+    async def _activate(self):
+        start = time.perf_counter()
+        try:
+            if self.on_promote is not None:
+                await self.on_promote()
+        except Exception:
+            log.exception("lease.promote_failed", "❌ 接手失敗，釋放租約")
+            await self._demote("promote_failed")
+            await asyncio.to_thread(self.backend.release, self.holder)
+            return
+        self.active = True
+        self.last_promote_ms = round((time.perf_counter() - start) * 1000, 2)
+        log.info(
+            "lease.promoted", f"✅ 接手完成（{self.last_promote_ms} ms）",
+            holder=self.holder, epoch=self.epoch, took_ms=self.last_promote_ms
+        )
+
+    async def _demote(self, reason):
+        promoting, self._promoting = self._promoting, None
+        if promoting is not None and promoting is not asyncio.current_task():
+            promoting.cancel()
+        self.leader = False
+        self.active = False
+        self.leader_since = None
+        self.demotions += 1
+        log.warning(
+            "lease.lost", f"⚠️  失去租約，改為 standby（{reason}）",
+            holder=self.holder, current_holder=self.current_holder, reason=reason
+        )
+        if self.on_demote is not None:
+            await self.on_demote()
+
+    async def close(self):
+        """停止續約；持有中就主動釋放，standby 不必等租約到期"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._promoting is not None:
+            self._promoting.cancel()
+            self._promoting = None
+        was_leader = self.leader
+        self.leader = False
+        self.active = False
+        try:
+            if was_leader:
+                await asyncio.to_thread(self.backend.release, self.holder)
+                log.info("lease.released", "👋 已釋放租約", holder=self.holder)
+            self.backend.close()
+        except Exception as e:
+            log.warning("lease.release_failed", f"⚠️  釋放租約失敗: {e}", holder=self.holder)
+
+    def stats(self):
+        return {
+            "backend": self.backend.kind,
+            "role": self.role,
+            "instance": self.holder,
+            "holder": self.current_holder,
+            "epoch": self.epoch,
+            "ttl": self.ttl,
+            "leader_since": self.leader_since,
+            "promotions": self.promotions,
+            "demotions": self.demotions,
+            "renew_failures": self.renew_failures,
+            "last_renew_ms": self.last_renew_ms,
+            "last_promote_ms": self.last_promote_ms
+        }
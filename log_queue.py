@@ -0,0 +1,296 @@
+# =========================
+# log_queue.py
+# 記錄頻道的背景發送佇列：合併短時間內的加入/離開通知、追蹤速率限制
+# =========================
+import asyncio
+import contextlib
+import time
+from collections import deque
+
+import discord
+
+from jsonlog import log
+
+# Discord 單一頻道發訊息的限制約為 5 則 / 5 秒
+DEFAULT_BUCKET_CAPACITY = 5
+DEFAULT_BUCKET_PERIOD = 5.0
+# 單則訊息上限 2000 字，保留一點空間
+MAX_MESSAGE_CHARS = 1900
+# 關機逾時後，送到一半的那一則最多再等幾秒
+CLOSE_SEND_GRACE = 5.0
+
+
+class RateBucket:
+    """單一頻道的 token bucket，429 時依 Retry-After 暫停"""
+
+    def __init__(self, capacity=DEFAULT_BUCKET_CAPACITY, period=DEFAULT_BUCKET_PERIOD):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.hits = 0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / self.period)
+
+    def delay(self):
+        """距離可以送出下一則訊息還要等幾秒"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) * self.period / self.capacity)
+        return wait
+
+    async def acquire(self):
+        wait = self.delay()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.delay()
+        self.tokens -= 1
+
+    def penalize(self, retry_after):
+        self.hits += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        return {
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "rate_limited": self.hits,
+        }
+
+
+def _chunk_lines(lines, limit=MAX_MESSAGE_CHARS):
+    """把多行通知合併成不超過字數上限的訊息：(訊息, 合併了幾行)"""
+    chunk, size = [], 0
+    for line in lines:
+        if chunk and size + len(line) + 1 > limit:
+            yield "\n".join(chunk), len(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield "\n".join(chunk), len(chunk)
+
+
+class LogSender:
+    """
+    有上限的背景發送佇列。
+    事件處理器只呼叫 enqueue()，不會 await Discord API；
+    背景 task 在 window 秒內收集通知，合併後依序送出（加入提醒優先於離開紀錄）。
+    can_send() 為假時（主備切換中已不是 leader）不送、直接丟棄：寧可少一則，也不和新 leader 重複發。
+    """
+
+    def __init__(self, resolve_channel, window=1.5, maxsize=500, send_latency=None, can_send=None):
+        self._resolve_channel = resolve_channel
+        # 可選：有 observe(秒數) 的直方圖，記錄每次 channel.send 的耗時
+        self._send_latency = send_latency
+        self._can_send = can_send
+        self.window = window
+        self.maxsize = maxsize
+        # 非靜音的加入提醒 / 靜音的離開紀錄
+        self._alerts = deque()
+        self._summaries = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._abandon = False
+        self.buckets = {}
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent_messages = 0
+        self.failed = 0
+        self.fenced = 0
+
+    @property
+    def depth(self):
+        return len(self._alerts) + len(self._summaries)
+
+    def enqueue(self, text, silent):
+        """放入一則通知（不阻塞）；佇列滿時先丟最舊的離開紀錄"""
+        if self.depth >= self.maxsize:
+            if self._summaries:
+                self._summaries.popleft()
+            elif silent:
+                self.dropped += 1
+                return False
+            else:
+                self._alerts.popleft()
+            self.dropped += 1
+        (self._summaries if silent else self._alerts).append(text)
+        self.enqueued += 1
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="log-sender")
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            # 等待合併視窗，把這段時間內的通知一起送出
+            if not self._closing and self.window > 0:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self):
+        channel = self._resolve_channel()
+        if channel is None:
+            if self.depth:
+                log.error("log_queue.no_channel", f"❌ 找不到記錄頻道，丟棄 {self.depth} 則通知", dropped=self.depth)
+                self.dropped += self.depth
+                self._alerts.clear()
+                self._summaries.clear()
+            return
+
+        bucket = self._bucket(channel)
+        for queue, silent in ((self._alerts, False), (self._summaries, True)):
+            if not queue:
+                continue
+            lines = list(queue)
+            queue.clear()
+            done = 0
+            try:
+                for content, count in _chunk_lines(lines):
+                    if self._abandon:
+                        break
+                    await self._send(channel, bucket, content, silent)
+                    done += count
+            finally:
+                # 關機逾時放棄（或被取消）：還沒送出的放回佇列前端，由 close() 計入 dropped
+                if done < len(lines):
+                    queue.extendleft(reversed(lines[done:]))
+
+    def _bucket(self, channel):
+        bucket = self.buckets.get(channel.id)
+        if bucket is None:
+            bucket = self.buckets[channel.id] = RateBucket()
+        return bucket
+
+    async def send_embed(self, embed):
+        """直接送出一則 embed（例如學習摘要），和通知共用同一個速率限制；回傳是否成功"""
+        channel = self._resolve_channel()
+        if channel is None:
+            log.error("log_queue.no_channel", "❌ 找不到記錄頻道，無法發送摘要")
+            self.failed += 1
+            return False
+        return await self._send(channel, self._bucket(channel), None, True, embed)
+
+    async def _send(self, channel, bucket, content, silent, embed=None):
+        for _ in range(3):
+            await bucket.acquire()
+            # 等速率限制的期間可能失去租約，送出前一刻再確認
+            if self._can_send is not None and not self._can_send():
+                self.fenced += 1
+                log.warning("log_queue.fenced", "⚠️  已不是 leader，丟棄一則記錄頻道訊息", channel_id=channel.id)
+                return False
+            start = time.perf_counter()
+            try:
+                await channel.send(content, embed=embed, silent=silent)
+                self.sent_messages += 1
+                return True
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    log.error("log_queue.send_failed", f"❌ 發送記錄失敗: {e.status} - {e.text}", status=e.status)
+                    break
+                retry_after = float(e.response.headers.get("Retry-After", 1.0))
+                bucket.penalize(retry_after)
+                log.warning(
+                    "log_queue.rate_limited", f"⏳ 記錄頻道被限速，{retry_after:.1f}s 後重試",
+                    channel_id=channel.id, retry_after=retry_after
+                )
+            except Exception as e:
+                log.error("log_queue.send_failed", f"❌ 發送記錄失敗: {e}")
+                break
+            finally:
+                if self._send_latency is not None:
+                    self._send_latency.observe(time.perf_counter() - start)
+        self.failed += 1
+        return False
+
+    async def close(self, timeout=10.0):
+        """
+        關機前把剩下的通知送完。逾時不會打斷送到一半的那一則（shield），只是不再送下一則；
+        沒送出的通知計入 dropped
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            task, self._task = self._task, None
+            await self._finish(task, timeout)
+        if self.depth:
+            # 背景 task 結束後才放進來的、或逾時被放回佇列的，再給一次 timeout
+            self._abandon = False
+            await self._finish(asyncio.create_task(self._flush()), timeout)
+        if self.depth:
+            log.warning("log_queue.unsent", f"⚠️  關機時仍有 {self.depth} 則通知未送出", pending=self.depth)
+            self.dropped += self.depth
+            self._alerts.clear()
+            self._summaries.clear()
+
+    async def _finish(self, task, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+            return
+        except asyncio.TimeoutError:
+            self._abandon = True
+        # 送到一半的那一則再等一下；還是卡住才取消（沒送出的行一樣會放回佇列）
+        with contextlib.suppress(asyncio.TimeoutError, asyncio.CancelledError):
+            await asyncio.wait_for(task, CLOSE_SEND_GRACE)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "pending_alerts": len(self._alerts),
+            "pending_summaries": len(self._summaries),
+            "enqueued": self.enqueued,
+            "sent_messages": self.sent_messages,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "fenced": self.fenced,
+            # web 執行緒呼叫（/status）：bot 端可能同時加入新的頻道
+            "buckets": {str(cid): b.stats() for cid, b in list(self.buckets.items())},
+        }
+
+
+class LogSenderPool:
+    """
+    每個伺服器一個 LogSender（各自的記錄頻道、各自的速率限制），第一次用到才建立。
+    resolve_channel(guild_id) 回傳該伺服器的記錄頻道。
+    """
+
+    def __init__(self, resolve_channel, **options):
+        self._resolve_channel = resolve_channel
+        self._options = options
+        self.senders = {}
+
+    def get(self, guild_id):
+        sender = self.senders.get(guild_id)
+        if sender is None:
+            sender = self.senders[guild_id] = LogSender(
+                lambda: self._resolve_channel(guild_id), **self._options
+            )
+            sender.start()
+        return sender
+
+    def enqueue(self, guild_id, text, silent):
+        return self.get(guild_id).enqueue(text, silent)
+
+    async def send_embed(self, guild_id, embed):
+        return await self.get(guild_id).send_embed(embed)
+
+    @property
+    def depth(self):
+        return sum(sender.depth for sender in list(self.senders.values()))
+
+    async def close(self, timeout=10.0):
+        await asyncio.gather(*(sender.close(timeout) for sender in list(self.senders.values())))
+
+    def stats(self):
+        return {str(guild_id): sender.stats() for guild_id, sender in list(self.senders.items())}
@@ -0,0 +1,153 @@
+# =========================
+# metrics.py
+# Prometheus 文字格式的計數器 / 直方圖 / 量表
+# 只在 bot 的 event loop 上寫入，不加鎖；web 端讀到的是近似值即可
+# =========================
+import bisect
+import math
+import os
+
+# 秒為單位，涵蓋 0.5ms ~ 10s
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Counter:
+    """單一 label（可省略）的累加計數器"""
+
+    type_name = "counter"
+
+    def __init__(self, name, doc, label=None):
+        self.name = name
+        self.doc = doc
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value=None, amount=1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        for label_value, value in list(self.values.items()):
+            labels = [(self.label, label_value)] if self.label else []
+            yield self.name, labels, value
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """固定 bucket 的直方圖，observe() 只做一次 bisect 與三個加法"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, doc, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.label = label
+        self.bounds = tuple(buckets)
+        self.children = {}
+
+    def observe(self, value, label_value=None):
+        child = self.children.get(label_value)
+        if child is None:
+            child = self.children[label_value] = _HistogramChild(len(self.bounds) + 1)
+        child.counts[bisect.bisect_left(self.bounds, value)] += 1
+        child.sum += value
+        child.count += 1
+
+    def samples(self):
+        for label_value, child in list(self.children.items()):
+            base = [(self.label, label_value)] if self.label else []
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), list(child.counts)):
+                cumulative += count
+                yield self.name + "_bucket", base + [("le", _format_value(bound))], cumulative
+            yield self.name + "_sum", base, child.sum
+            yield self.name + "_count", base, child.count
+
+
+class Gauge:
+    """讀取時才呼叫 func() 取值的量表"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, doc, func):
+        self.name = name
+        self.doc = doc
+        self.func = func
+
+    def samples(self):
+        try:
+            value = self.func()
+        except Exception:
+            value = None
+        yield self.name, [], value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, label=None):
+        return self.register(Counter(name, doc, label))
+
+    def histogram(self, name, doc, label=None, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, doc, label, buckets))
+
+    def gauge(self, name, doc, func):
+        return self.register(Gauge(name, doc, func))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.doc}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory_bytes():
+    """目前 RSS；沒有 /proc 時退回 ru_maxrss（峰值）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
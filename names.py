@@ -0,0 +1,79 @@
+# =========================
+# names.py
+# 精簡快取模式下的顯示名稱：先查 discord.py 快取，沒有才用 HTTP 取，結果短暫快取
+# =========================
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+
+class DisplayNameCache:
+    """
+    user_id -> (顯示名稱, 到期時間)。查不到的成員（已離開伺服器）也快取 None，
+    避免排行榜每次都重打一次 API。超過 maxsize 時丟掉最久沒用的。
+    """
+
+    def __init__(self, ttl=600.0, maxsize=5000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._names = OrderedDict()
+        self.hits = 0
+        self.fetches = 0
+
+    def _get(self, user_id, now):
+        entry = self._names.get(user_id)
+        if entry is None or entry[1] < now:
+            return False, None
+        self._names.move_to_end(user_id)
+        return True, entry[0]
+
+    def _put(self, user_id, name, now):
+        self._names[user_id] = (name, now + self.ttl)
+        self._names.move_to_end(user_id)
+        if len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    async def _fetch(self, guild, user_id):
+        self.fetches += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+        return member.display_name
+
+    async def resolve(self, guild, user_ids, timeout=2.0):
+        """回傳 {user_id: 顯示名稱或 None}；逾時沒取到的也是 None（呼叫端自行退回 mention）"""
+        now = time.monotonic()
+        names, missing = {}, []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member is not None:
+                names[user_id] = member.display_name
+                continue
+            found, name = self._get(user_id, now)
+            if found:
+                self.hits += 1
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        if not missing:
+            return names
+
+        tasks = {user_id: asyncio.ensure_future(self._fetch(guild, user_id)) for user_id in missing}
+        await asyncio.wait(tasks.values(), timeout=timeout)
+        now = time.monotonic()
+        for user_id, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                names[user_id] = None
+            elif task.exception() is not None:
+                names[user_id] = None
+            else:
+                names[user_id] = task.result()
+                self._put(user_id, names[user_id], now)
+        return names
+
+    def stats(self):
+        return {"cached": len(self._names), "hits": self.hits, "fetches": self.fetches}
@@ -0,0 +1,238 @@
+# =========================
+# profiler.py
+# 事件處理器 / slash 指令的計時與慢處理偵測，以及輸出火焰圖 collapsed 格式的取樣分析器
+# =========================
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from jsonlog import log
+
+# 堆疊最多保留幾層
+STACK_LIMIT = 64
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _format_frames(frames):
+    return [
+        f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        for frame in frames
+    ]
+
+
+def thread_frames(thread_id):
+    """某個執行緒目前的堆疊（由外到內）"""
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None and len(frames) < STACK_LIMIT:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def await_frames(coro):
+    """沿著 cr_await 往下走：協程目前停在哪一串 await 上（由外到內）"""
+    frames = []
+    while coro is not None and len(frames) < STACK_LIMIT:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class _Invocation:
+    __slots__ = ("name", "coro", "start", "started_at", "kind", "stack")
+
+    def __init__(self, name, coro):
+        self.name = name
+        self.coro = coro
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.kind = None
+        self.stack = None
+
+
+class HandlerMonitor:
+    """
+    track(name, coro) 包住一次處理器呼叫，結束時累計次數 / 總耗時 / 最大耗時，
+    超過 threshold 秒就記一筆慢處理（最近 keep 筆放在環形緩衝區）並寫 warning。
+
+    結束時才抓堆疊只看得到呼叫端，所以另有監看執行緒每 threshold / 4 秒檢查還在跑的呼叫，
+    超過門檻的當下就取樣：協程正在 event loop 上執行（卡住整個 loop）時抓 loop 執行緒的堆疊，
+    否則沿著 await 鏈找出它正在等什麼。
+    """
+
+    def __init__(self, threshold=0.25, keep=50):
+        self.threshold = threshold
+        self.slow = deque(maxlen=keep)
+        self.handlers = {}  # name -> [次數, 總秒數, 最大秒數, 慢處理次數]
+        self._inflight = {}
+        self._tokens = itertools.count()
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    def start(self):
+        """在 event loop 的執行緒上呼叫"""
+        if self._thread is None:
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._watch, name="handler-watchdog", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def track(self, name, coro, histogram=None):
+        invocation = _Invocation(name, coro)
+        token = next(self._tokens)
+        self._inflight[token] = invocation
+        try:
+            return await coro
+        finally:
+            del self._inflight[token]
+            self._finish(invocation, histogram)
+
+    def _finish(self, invocation, histogram):
+        elapsed = time.perf_counter() - invocation.start
+        if histogram is not None:
+            histogram.observe(elapsed, invocation.name)
+        entry = self.handlers.get(invocation.name)
+        if entry is None:
+            entry = self.handlers[invocation.name] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        if elapsed < self.threshold:
+            return
+        entry[3] += 1
+        self.slow.append({
+            "handler": invocation.name,
+            "ms": round(elapsed * 1000, 3),
+            "started_at": invocation.started_at,
+            # blocking = 卡住 event loop；awaiting = 在等 I/O；None = 在兩次取樣之間就結束了
+            "kind": invocation.kind,
+            "stack": invocation.stack or []
+        })
+        log.warning(
+            "handler.slow", f"🐢 {invocation.name} 耗時 {elapsed * 1000:.0f} ms",
+            handler=invocation.name, ms=round(elapsed * 1000, 3), kind=invocation.kind
+        )
+
+    # ---------- 監看執行緒 ----------
+    def _watch(self):
+        interval = max(0.01, self.threshold / 4)
+        while not self._stop.wait(interval):
+            now = time.perf_counter()
+            for invocation in list(self._inflight.values()):
+                if now - invocation.start < self.threshold or invocation.kind == "blocking":
+                    continue
+                self._sample(invocation)
+
+    def _sample(self, invocation):
+        coro = invocation.coro
+        if getattr(coro, "cr_running", False):
+            frames = thread_frames(self._loop_thread)
+            # 從處理器自己的那一層開始，略過 asyncio 的排程框架
+            own = getattr(coro, "cr_frame", None)
+            for i, frame in enumerate(frames):
+                if frame is own:
+                    frames = frames[i:]
+                    break
+            kind = "blocking"
+        else:
+            frames = await_frames(coro)
+            kind = "awaiting"
+        invocation.stack = _format_frames(frames)
+        invocation.kind = kind
+        self.samples += 1
+
+    def report(self):
+        """/debug/slow 用：各處理器的統計與最近的慢處理（最慢的在前）"""
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "handlers": {
+                name: {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000, 3),
+                    "max_ms": round(longest * 1000, 3),
+                    "slow": slow
+                }
+                for name, (count, total, longest, slow) in list(self.handlers.items())
+            },
+            "slow": sorted(list(self.slow), key=lambda event: -event["ms"])
+        }
+
+    def stats(self):
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "in_flight": len(self._inflight),
+            "slow_recorded": sum(entry[3] for entry in list(self.handlers.values())),
+            "samples": self.samples
+        }
+
+
+class SamplingProfiler:
+    """
+    取樣式分析器：背景執行緒每 interval 秒抓一次所有執行緒的堆疊（sys._current_frames），
+    累計成 flamegraph.pl / speedscope 吃的 collapsed 格式：「執行緒;外層;...;內層 次數」。
+    不需要事先插樁，量測期間每次取樣只拿一下 GIL。同一時間只允許一個分析。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    @property
+    def busy(self):
+        return self._lock.locked()
+
+    def run(self, seconds, interval=0.005):
+        """阻塞 seconds 秒（在自己的執行緒呼叫），回傳 (取樣次數, {collapsed 堆疊: 次數})"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有分析在進行中")
+        try:
+            me = threading.get_ident()
+            names = {}
+            counts = {}
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me:
+                        continue
+                    labels = []
+                    while frame is not None and len(labels) < STACK_LIMIT:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    name = names.get(thread_id)
+                    if name is None:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                        name = names.setdefault(thread_id, f"thread-{thread_id}")
+                    labels.append(name)
+                    stack = ";".join(reversed(labels))
+                    counts[stack] = counts.get(stack, 0) + 1
+                samples += 1
+                time.sleep(interval)
+            self.runs += 1
+            return samples, counts
+        finally:
+            self._lock.release()
+
+
+def collapsed(counts):
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
@@ -0,0 +1,196 @@
+# =========================
+# rollups.py
+# 學習時間的增量統計：每個 session 結束時累加到 日/週/月 × 用戶/主題/頻道/標準主題
+# topic 是原始寫法，subject 是歸併後的標準主題（topic_canon.py）；兩者並存，別名改變時才能只搬動受影響的部分
+# =========================
+import bisect
+import datetime
+import time
+
+PERIODS = ("day", "week", "month")
+SCOPES = ("user", "topic", "channel", "subject")
+
+
+def bucket_keys(ts):
+    """UTC 時間戳 -> 各週期的 bucket 名稱"""
+    d = datetime.datetime.utcfromtimestamp(ts).date()
+    year, week, _ = d.isocalendar()
+    return {
+        "day": d.isoformat(),
+        "week": f"{year}-W{week:02d}",
+        "month": f"{d.year}-{d.month:02d}"
+    }
+
+
+def previous_bucket_keys(ts):
+    """上一個 日/週/月 的 bucket 名稱（用來保留跨日排行）"""
+    d = datetime.datetime.utcfromtimestamp(ts).date()
+    prev_month = d.replace(day=1) - datetime.timedelta(days=1)
+    day = d - datetime.timedelta(days=1)
+    week = d - datetime.timedelta(days=7)
+    return {
+        "day": bucket_keys(_epoch(day))["day"],
+        "week": bucket_keys(_epoch(week))["week"],
+        "month": bucket_keys(_epoch(prev_month))["month"]
+    }
+
+
+def _epoch(d):
+    return datetime.datetime(d.year, d.month, d.day, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def split_by_day(start_ts, end_ts):
+    """把跨日的 session 切成每天一段：[(該段起點, 秒數), ...]"""
+    segments = []
+    t = start_ts
+    while t < end_ts:
+        d = datetime.datetime.utcfromtimestamp(t).date() + datetime.timedelta(days=1)
+        next_day = _epoch(d)
+        seg_end = min(end_ts, next_day)
+        segments.append((t, seg_end - t))
+        t = seg_end
+    return segments
+
+
+class RankIndex:
+    """依秒數排序的名次索引：更新 O(log n) 搜尋、查名次 O(log n)"""
+
+    def __init__(self):
+        self._entries = []  # (-seconds, key)，由大到小
+        self._values = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, key, seconds):
+        old = self._values.get(key)
+        if old is not None:
+            i = bisect.bisect_left(self._entries, (-old, key))
+            del self._entries[i]
+        self._values[key] = seconds
+        bisect.insort(self._entries, (-seconds, key))
+
+    def rank(self, key):
+        seconds = self._values.get(key)
+        if seconds is None:
+            return None
+        # 同秒數並列：名次取第一個同分者的位置
+        return bisect.bisect_left(self._entries, (-seconds,)) + 1
+
+    def top(self, n):
+        return [(key, -neg) for neg, key in self._entries[:n]]
+
+
+class RollupEngine:
+    """
+    只保存目前與上一個 日/週/月 bucket 的統計（完整的歷史 bucket 存在 SQLite），
+    排行與個人統計都直接從這裡回答，不需要重新掃描歷史 session。
+    每個伺服器各自一份統計與排行。
+    """
+
+    def __init__(self):
+        self.totals = {}  # (guild_id, scope, period, bucket) -> {key: [seconds, sessions]}
+        self.ranks = {}   # (guild_id, period, bucket) -> RankIndex（用戶）
+        self._current_day = None
+
+    def _apply(self, guild_id, scope, period, bucket, key, seconds, sessions):
+        table = self.totals.setdefault((guild_id, scope, period, bucket), {})
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = [0, 0]
+        entry[0] += seconds
+        entry[1] += sessions
+        if scope == "user":
+            rank = self.ranks.get((guild_id, period, bucket))
+            if rank is None:
+                rank = self.ranks[(guild_id, period, bucket)] = RankIndex()
+            rank.update(key, entry[0])
+
+    def add_session(self, guild_id, user_id, topic, channel_id, start_ts, end_ts, subject=None, now=None):
+        """
+        累加一個結束的 session，回傳要寫入資料庫的增量；subject 預設就是 topic。
+        換日看的是現在時間（now，預設 time.time()），不是 end_ts：補結算停機前的舊 session 不能把今天的 bucket 丟掉
+        """
+        self._roll(time.time() if now is None else now)
+        per_bucket = {}
+        for seg_start, seconds in split_by_day(start_ts, end_ts):
+            for period, bucket in bucket_keys(seg_start).items():
+                per_bucket[(period, bucket)] = per_bucket.get((period, bucket), 0) + seconds
+
+        deltas = []
+        keys = {"user": user_id, "topic": topic or "", "channel": channel_id, "subject": subject or topic or ""}
+        for (period, bucket), seconds in per_bucket.items():
+            seconds = int(seconds)
+            for scope in SCOPES:
+                self._apply(guild_id, scope, period, bucket, keys[scope], seconds, 1)
+                deltas.append((guild_id, scope, period, bucket, str(keys[scope]), seconds, 1))
+        return deltas
+
+    def load_rows(self, rows):
+        """啟動時載入資料庫中目前 bucket 的統計"""
+        for guild_id, scope, period, bucket, key, seconds, sessions in rows:
+            if scope in ("user", "channel"):
+                key = int(key)
+            self._apply(guild_id, scope, period, bucket, key, seconds, sessions)
+
+    def rebucket(self, guild_id, changes):
+        """原始寫法改對應到別的標準主題：把記憶體裡各 bucket 的 topic 統計從舊 subject 搬到新 subject"""
+        for (g, scope, period, bucket), table in list(self.totals.items()):
+            if g != guild_id or scope != "topic":
+                continue
+            subjects = self.totals.get((guild_id, "subject", period, bucket))
+            if subjects is None:
+                continue
+            for topic, old, new in changes:
+                entry = table.get(topic)
+                if entry is None:
+                    continue
+                previous = subjects.get(old)
+                if previous is not None:
+                    previous[0] -= entry[0]
+                    previous[1] -= entry[1]
+                    if previous[1] <= 0:
+                        del subjects[old]
+                self._apply(guild_id, "subject", period, bucket, new, entry[0], entry[1])
+
+    def top(self, guild_id, scope, period, now, n=10):
+        """目前 bucket 某個維度的前 n 名 [(key, 秒數, session 數)]"""
+        table = self.totals.get((guild_id, scope, period, bucket_keys(now)[period]), {})
+        return sorted(((key, s, c) for key, (s, c) in table.items() if key != ""), key=lambda r: -r[1])[:n]
+
+    def _roll(self, now):
+        """換日時丟掉過期的 bucket，記憶體只跟最近兩個週期的活躍人數有關"""
+        today = bucket_keys(now)["day"]
+        # 只往前換日（日期字串可直接比較）：時鐘倒退也不會丟掉目前週期的 bucket
+        if self._current_day is not None and today <= self._current_day:
+            return
+        self._current_day = today
+        keep = set(bucket_keys(now).items()) | set(previous_bucket_keys(now).items())
+        for k in [k for k in self.totals if (k[2], k[3]) not in keep]:
+            del self.totals[k]
+        for k in [k for k in self.ranks if (k[1], k[2]) not in keep]:
+            del self.ranks[k]
+
+    def leaderboard(self, guild_id, period, now, n=10):
+        bucket = bucket_keys(now)[period]
+        rank = self.ranks.get((guild_id, period, bucket))
+        if rank is None:
+            return []
+        table = self.totals[(guild_id, "user", period, bucket)]
+        return [(user_id, seconds, table[user_id][1]) for user_id, seconds in rank.top(n)]
+
+    def user_stats(self, guild_id, user_id, now):
+        """回傳 {period: (秒數, session 數, 名次, 上榜人數)}"""
+        stats = {}
+        for period, bucket in bucket_keys(now).items():
+            entry = self.totals.get((guild_id, "user", period, bucket), {}).get(user_id)
+            rank = self.ranks.get((guild_id, period, bucket))
+            if entry is None:
+                stats[period] = (0, 0, None, len(rank) if rank else 0)
+            else:
+                stats[period] = (entry[0], entry[1], rank.rank(user_id), len(rank))
+        return stats
+
+    def current_buckets(self, now):
+        """目前與上一個週期的 (period, bucket)，啟動時用來挑要載入的資料"""
+        return sorted(set(bucket_keys(now).items()) | set(previous_bucket_keys(now).items()))
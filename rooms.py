@@ -0,0 +1,156 @@
+# =========================
+# rooms.py
+# 房間層級的事件與佔用時間序列：由 SessionTable 的房間索引在人數變化時通知，不需要額外呼叫 Discord API
+# 事件：第一個人進房（open）、最後一個人離開（empty）、這次有人期間的同時在線新高（peak）
+# =========================
+import time
+
+
+class RoomState:
+    """一個頻道目前的人數，以及這次有人（從第一個人進來到最後一個人離開）期間的資料"""
+
+    __slots__ = ("guild_id", "count", "opened_at", "peak", "peak_at", "last_ts", "buckets")
+
+    def __init__(self, guild_id, now):
+        self.guild_id = guild_id
+        self.count = 0
+        self.opened_at = None
+        self.peak = 0
+        self.peak_at = None
+        self.last_ts = now
+        self.buckets = {}  # bucket 起點 -> [有人的秒數, 人 × 秒, 最高人數]
+
+
+def _accumulate(buckets, bucket_seconds, start, end, count):
+    """把 [start, end) 期間維持 count 人的時間分攤到各個時間桶；沒人的期間不建桶（讀取端視為 0）"""
+    if not count:
+        return
+    while start < end:
+        bucket = start - start % bucket_seconds
+        chunk = min(end, bucket + bucket_seconds) - start
+        entry = buckets.get(bucket)
+        if entry is None:
+            entry = buckets[bucket] = [0.0, 0.0, count]
+        entry[0] += chunk
+        entry[1] += chunk * count
+        entry[2] = max(entry[2], count)
+        start += chunk
+
+
+class RoomTracker:
+    """
+    每個頻道一條佔用時間序列：每 bucket_seconds 一個時間桶，記有人的秒數、人 × 秒（除以桶長就是平均人數）與最高人數，
+    只保留最近 keep 個桶。update() 只在 bot 的 event loop 上呼叫；web 端讀到的是近似值即可（和 metrics 一樣不加鎖）。
+    on_event(kind, guild_id, channel_id, **fields) 收到 open / empty / peak 三種房間事件。
+    """
+
+    def __init__(self, bucket_seconds=3600, keep=168, on_event=None):
+        self.bucket_seconds = bucket_seconds
+        self.keep = keep
+        self.on_event = on_event
+        self._rooms = {}
+        self.events = {"open": 0, "empty": 0, "peak": 0}
+
+    def update(self, guild_id, channel_id, count, now=None):
+        """SessionTable 的 listener：channel_id 的人數變成 count"""
+        if now is None:
+            now = time.time()
+        room = self._rooms.get(channel_id)
+        if room is None:
+            room = self._rooms[channel_id] = RoomState(guild_id, now)
+        _accumulate(room.buckets, self.bucket_seconds, room.last_ts, now, room.count)
+        bucket = now - now % self.bucket_seconds
+        entry = room.buckets.get(bucket)
+        if entry is None:
+            room.buckets[bucket] = [0.0, 0.0, count]
+        else:
+            entry[2] = max(entry[2], count)
+        previous, room.count, room.last_ts = room.count, count, now
+        self._trim(room, now)
+
+        if previous == 0 and count > 0:
+            room.opened_at, room.peak, room.peak_at = now, count, now
+            self._emit("open", room, channel_id, count=count)
+        elif count > room.peak:
+            room.peak, room.peak_at = count, now
+            self._emit("peak", room, channel_id, count=count)
+        if count == 0 and previous > 0:
+            self._emit(
+                "empty", room, channel_id, count=0, opened_at=room.opened_at,
+                seconds=round(now - room.opened_at, 1), peak=room.peak
+            )
+            room.opened_at, room.peak, room.peak_at = None, 0, None
+
+    def _emit(self, kind, room, channel_id, **fields):
+        self.events[kind] += 1
+        if self.on_event is not None:
+            self.on_event(kind, room.guild_id, channel_id, **fields)
+
+    def _trim(self, room, now):
+        # 時間桶依時間順序加入，第一個就是最舊的
+        oldest = now - now % self.bucket_seconds - (self.keep - 1) * self.bucket_seconds
+        while room.buckets and next(iter(room.buckets)) < oldest:
+            del room.buckets[next(iter(room.buckets))]
+
+    def clear(self, now=None):
+        """失去 leader 身分：有人的房間結算到現在、歸零，不發事件（時間序列保留）"""
+        if now is None:
+            now = time.time()
+        for room in self._rooms.values():
+            _accumulate(room.buckets, self.bucket_seconds, room.last_ts, now, room.count)
+            room.count, room.last_ts = 0, now
+            room.opened_at, room.peak, room.peak_at = None, 0, None
+
+    def _describe(self, channel_id, room):
+        return {
+            "channel_id": channel_id, "count": room.count, "opened_at": room.opened_at,
+            "peak": room.peak, "peak_at": room.peak_at
+        }
+
+    def room(self, channel_id):
+        """頻道目前的人數、這次從什麼時候開始有人、期間最高人數（沒紀錄過則回傳 None）"""
+        room = self._rooms.get(channel_id)
+        return self._describe(channel_id, room) if room is not None else None
+
+    def occupied(self, guild_id=None):
+        """目前有人的房間：[{channel_id, count, opened_at, peak, peak_at}]"""
+        return [
+            self._describe(channel_id, room)
+            for channel_id, room in list(self._rooms.items())
+            if room.count and (guild_id is None or room.guild_id == guild_id)
+        ]
+
+    def series(self, channel_id, now=None):
+        """
+        頻道的佔用時間序列（舊到新），最後一個桶含到現在為止仍在進行中的部分。
+        每個桶：start、occupied_seconds、average（平均人數）、peak；整段沒人的桶不列出
+        """
+        room = self._rooms.get(channel_id)
+        if room is None:
+            return []
+        if now is None:
+            now = time.time()
+        # 很久沒有變化的房間還沒被 _trim 過，讀取時一樣只回傳最近 keep 個桶
+        oldest = now - now % self.bucket_seconds - (self.keep - 1) * self.bucket_seconds
+        buckets = {bucket: list(entry) for bucket, entry in list(room.buckets.items()) if bucket >= oldest}
+        _accumulate(buckets, self.bucket_seconds, max(room.last_ts, oldest), now, room.count)
+        return [
+            {
+                "start": int(bucket),
+                "occupied_seconds": round(occupied, 1),
+                "average": round(person_seconds / self.bucket_seconds, 3),
+                "peak": peak
+            }
+            for bucket, (occupied, person_seconds, peak) in sorted(buckets.items())
+        ]
+
+    def guild_of(self, channel_id):
+        room = self._rooms.get(channel_id)
+        return room.guild_id if room is not None else None
+
+    def stats(self):
+        return {
+            "rooms": len(self._rooms),
+            "occupied": sum(1 for room in list(self._rooms.values()) if room.count),
+            "events": dict(self.events)
+        }
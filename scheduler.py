@@ -0,0 +1,104 @@
+# =========================
+# scheduler.py
+# 單一 heap + 單一 task 的計時器：幾千個延遲動作共用一個等待點
+# =========================
+import asyncio
+import heapq
+import itertools
+import time
+
+from jsonlog import log
+
+
+class TimerHeap:
+    """
+    schedule(key, delay, payload) 安排 delay 秒後呼叫 callback(key, payload)。
+    同一個 key 重新安排或取消時不去 heap 裡找舊項目，
+    只在 _pending 換掉 token，過期的 heap 項目彈出時比對 token 不符就略過（lazy deletion）。
+    callback 在 event loop 上同步執行，不應阻塞。
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._heap = []
+        self._pending = {}
+        self._tokens = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.fired = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def schedule(self, key, delay, payload=None):
+        deadline = time.monotonic() + delay
+        token = next(self._tokens)
+        self._pending[key] = (token, payload)
+        # 新的期限比目前等待的還早才需要叫醒
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (deadline, token, key))
+
+    def cancel(self, key):
+        """取消並回傳 payload；沒有排程則回傳 None"""
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        self.cancelled += 1
+        return entry[1]
+
+    def pop_all(self):
+        """取出所有尚未觸發的 (key, payload)，用於關機前立即處理"""
+        items = [(key, payload) for key, (_, payload) in self._pending.items()]
+        self._pending.clear()
+        self._heap.clear()
+        return items
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="timer-heap")
+
+    async def _run(self):
+        heap = self._heap
+        while True:
+            self._wakeup.clear()
+            timeout = heap[0][0] - time.monotonic() if heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = time.monotonic()
+            while heap and heap[0][0] <= now:
+                _, token, key = heapq.heappop(heap)
+                entry = self._pending.get(key)
+                if entry is None or entry[0] != token:
+                    continue
+                del self._pending[key]
+                self.fired += 1
+                try:
+                    self.callback(key, entry[1])
+                except Exception:
+                    log.exception("timer.callback_failed", "❌ 計時器回呼失敗", key=key)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "cancelled": self.cancelled
+        }
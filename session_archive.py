@@ -0,0 +1,607 @@
+# =========================
+# session_archive.py
+# 已結束 session 的欄式封存：固定寬度欄位、只追加的 segment 檔、mmap 零複製讀取
+# 多年歷史的區間加總 / 分組統計直接在欄位陣列上算，不必一列一列解析 SQLite 的列；
+# 裝了 numpy 時用 np.frombuffer 的零複製陣列向量化計算，沒有時用 memoryview.cast 的型別視圖 + C 實作的內建函式
+# =========================
+import array
+import bisect
+import json
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import compress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from jsonlog import log
+
+MAGIC = b"ICSA"
+VERSION = 1
+# magic、版本、是否 little endian、列數、最早 / 最晚的開始時間、涵蓋的第一個 / 最後一個 session id
+HEADER = struct.Struct("<4sHHQqqQQ")
+HEADER_SIZE = 64
+# 欄位依寬度由大到小排，每一欄的起點都自然對齊
+COLUMNS = (("user_id", "Q"), ("start_ts", "q"), ("channel_id", "Q"), ("duration", "I"), ("topic_id", "I"))
+ROW_BYTES = sum(struct.calcsize(code) for _, code in COLUMNS)
+GROUP_COLUMNS = {"user": "user_id", "channel": "channel_id", "topic": "topic_id"}
+SEGMENT_SUFFIX = ".seg"
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _file_rows(path):
+    """從檔案大小推算 segment 列數（不開檔）；檔案已被刪掉時算 0"""
+    try:
+        return (os.stat(path).st_size - HEADER_SIZE) // ROW_BYTES
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path):
+    """刪檔；已經被別的實例（重新取得寫入權時的清理）刪掉也沒關係"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Segment:
+    """
+    一個不可變的 segment 檔，列依 start_ts 排序。
+    mmap 之後每一欄都是指向檔案內容的型別視圖（沒有複製），時間區間用二分搜尋找列範圍。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER_SIZE:
+            raise ArchiveError(f"{path} 不是 segment 檔")
+        magic, version, little, rows, self.min_start, self.max_start, self.first_id, self.last_id = (
+            HEADER.unpack_from(self._mm)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ArchiveError(f"{path} 不是 segment 檔")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ArchiveError(f"{path} 的位元組順序和本機不同")
+        if len(self._mm) != HEADER_SIZE + rows * ROW_BYTES:
+            raise ArchiveError(f"{path} 長度不符，檔案不完整")
+        self.rows = rows
+        self.columns = {}
+        self._arrays = None
+        view = memoryview(self._mm)
+        offset = HEADER_SIZE
+        for name, code in COLUMNS:
+            size = rows * struct.calcsize(code)
+            self.columns[name] = view[offset:offset + size].cast(code)
+            offset += size
+
+    def arrays(self):
+        """numpy 版的欄位（同樣指向 mmap，不複製）"""
+        if self._arrays is None:
+            arrays, offset = {}, HEADER_SIZE
+            for name, code in COLUMNS:
+                arrays[name] = np.frombuffer(self._mm, dtype=np.dtype(code), count=self.rows, offset=offset)
+                offset += self.rows * struct.calcsize(code)
+            self._arrays = arrays
+        return self._arrays
+
+    def bounds(self, since, until):
+        """start_ts 落在 [since, until) 的列範圍"""
+        starts = self.columns["start_ts"]
+        lo = 0 if since is None else bisect.bisect_left(starts, since)
+        hi = self.rows if until is None else bisect.bisect_left(starts, until)
+        return lo, hi
+
+
+def _scan_python(segment, lo, hi, filters, column, totals):
+    """
+    沒有 numpy：過濾用 map(值.__eq__, 欄位) 產生遮罩、compress 取列、sum 加總，都在 C 裡跑；
+    只有分組時的秒數累加是 Python 迴圈（次數是符合條件的列數）。
+    """
+    cols = segment.columns
+    durations = cols["duration"][lo:hi]
+    mask = None
+    for name, value in filters:
+        hits = map(value.__eq__, cols[name][lo:hi])
+        mask = hits if mask is None else map(operator.and_, mask, hits)
+    if mask is not None:
+        mask = bytes(mask)
+        durations = list(compress(durations, mask))
+    if column is None:
+        totals[0] += sum(durations)
+        totals[1] += len(durations)
+        return
+    keys = cols[column][lo:hi]
+    if mask is not None:
+        keys = list(compress(keys, mask))
+    seconds = dict.fromkeys(keys, 0)
+    for key, duration in zip(keys, durations):
+        seconds[key] += duration
+    for key, count in Counter(keys).items():
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [seconds[key], count]
+        else:
+            entry[0] += seconds[key]
+            entry[1] += count
+
+
+def _scan_numpy(segment, lo, hi, filters, column, totals):
+    """numpy：遮罩、加總、分組（bincount）都是整欄的向量運算"""
+    arrays = segment.arrays()
+    durations = arrays["duration"][lo:hi]
+    mask = None
+    for name, value in filters:
+        hits = arrays[name][lo:hi] == value
+        mask = hits if mask is None else mask & hits
+    if mask is not None:
+        durations = durations[mask]
+    if column is None:
+        totals[0] += int(durations.sum(dtype=np.uint64))
+        totals[1] += len(durations)
+        return
+    keys = arrays[column][lo:hi]
+    if mask is not None:
+        keys = keys[mask]
+    if column == "topic_id":
+        # 主題 id 是連續的小整數，直接當 bincount 的索引
+        counts = np.bincount(keys)
+        seconds = np.bincount(keys, weights=durations)
+        present = np.flatnonzero(counts)
+        pairs = zip(present.tolist(), seconds[present].tolist(), counts[present].tolist())
+    else:
+        unique, inverse = np.unique(keys, return_inverse=True)
+        pairs = zip(
+            unique.tolist(), np.bincount(inverse, weights=durations).tolist(), np.bincount(inverse).tolist()
+        )
+    for key, seconds, count in pairs:
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [int(seconds), count]
+        else:
+            entry[0] += int(seconds)
+            entry[1] += count
+
+
+def _concat(segments, name, code):
+    if np is not None:
+        return np.concatenate([segment.arrays()[name] for segment in segments])
+    column = array.array(code)
+    for segment in segments:
+        column.frombytes(segment.columns[name].cast("B"))
+    return column
+
+
+class SessionArchive:
+    """
+    目錄結構：
+    - <root>/<guild_id>/<第一個 id>-<最後一個 id>.seg：不可變的 segment，依 session id 範圍命名
+    - <root>/<guild_id>/topics.jsonl：主題字串的流水號，第 n 行是 id n（0 代表沒有主題）
+    - <root>/<manifest>：目前有效的 segment 清單與已封存到哪個 session id，整檔原子替換
+
+    寫入：SessionStore 的背景執行緒呼叫 ingest() 把 sessions 表的新列讀進緩衝，
+    滿 segment_rows 列或超過 seal_interval 秒就依 start_ts 排序寫成新的 segment。
+    manifest 只記到已封存的 id，crash 時緩衝中的列下次從 SQLite 重讀，不會漏也不會重複。
+    合併：背景執行緒把相鄰的小 segment 合併成大的，先換 manifest 再刪舊檔，讀取端不會重複計算。
+
+    主備切換：fence() 為假時不寫入；重新取得寫入權時先重讀 manifest，接上舊 leader 封存到的位置。
+    """
+
+    def __init__(self, root, manifest="MANIFEST", segment_rows=65536, seal_interval=60.0,
+                 merge_min=8, merge_rows=1 << 20, compact_interval=300.0, ingest_batch=100_000, fence=None):
+        self.root = root
+        self.segment_rows = segment_rows
+        self.seal_interval = seal_interval
+        self.merge_min = merge_min
+        self.merge_rows = merge_rows
+        self.compact_interval = compact_interval
+        self.ingest_batch = ingest_batch
+        self._fence = fence
+        self._manifest_path = os.path.join(root, manifest)
+        # manifest、segment 清單與開啟中的 segment（寫入執行緒、合併執行緒、查詢三方共用）
+        self._lock = threading.Lock()
+        self._segments = {}  # guild_id -> [segment 檔名]（依 id 排序）
+        self._open = {}  # 路徑 -> Segment
+        self._topic_ids = {}  # guild_id -> {主題: id}
+        self._topic_names = {}  # guild_id -> [None, 主題 1, ...]
+        self._rows = 0  # manifest 裡所有 segment 的列數合計（stats() 不開檔）
+        self._generation = 0
+        self._fresh = False
+        self._manifest_mtime = None
+        self.ingested = 0
+        self._read_id = 0
+        self._buffer = {}
+        self._buffered = 0
+        self._buffer_since = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.sealed = 0
+        self.merges = 0
+        self.merged_rows = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    # ---------- manifest ----------
+    def _load(self, cleanup=False):
+        """呼叫端持有 _lock（建構時除外）；cleanup 只有取得寫入權的一方才做"""
+        try:
+            self._manifest_mtime = os.stat(self._manifest_path).st_mtime_ns
+            with open(self._manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"ingested": 0, "segments": {}}
+        self._segments = {int(g): sorted(names) for g, names in manifest["segments"].items()}
+        self.ingested = self._read_id = manifest["ingested"]
+        self._rows = manifest.get("rows")
+        if self._rows is None:
+            # 沒有記列數的 manifest：從檔案大小補算一次
+            self._rows = sum(
+                _file_rows(os.path.join(self.root, str(g), name)) for g, names in self._segments.items() for name in names
+            )
+        self._topic_ids.clear()
+        self._topic_names.clear()
+        self._open.clear()
+        for guild_id, names in self._segments.items() if cleanup else ():
+            # 上次 crash 留下的暫存檔與沒列進 manifest 的 segment
+            live = set(names)
+            for name in os.listdir(self._guild_dir(guild_id)):
+                if name.endswith(".tmp") or (name.endswith(SEGMENT_SUFFIX) and name not in live):
+                    _remove(os.path.join(self._guild_dir(guild_id), name))
+
+    def _save(self):
+        """呼叫端持有 _lock"""
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "ingested": self.ingested,
+                "rows": self._rows,
+                "segments": {str(g): names for g, names in self._segments.items() if names}
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._manifest_path)
+        self._manifest_mtime = os.stat(self._manifest_path).st_mtime_ns
+
+    def _refresh(self):
+        """沒有寫入權的一方（standby）查詢前看 manifest 有沒有被 leader 換過"""
+        if self._fresh:
+            return
+        try:
+            mtime = os.stat(self._manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                self._load()
+
+    def _still_writable(self, generation):
+        """呼叫端持有 _lock：寫檔期間沒有失去寫入權、也沒有重讀過 manifest"""
+        return generation == self._generation and (self._fence is None or self._fence())
+
+    def _writable(self):
+        """有寫入權才寫；剛取得（或重新取得）寫入權時先重讀 manifest 與主題表，丟掉舊的緩衝"""
+        if self._fence is not None and not self._fence():
+            self._fresh = False
+            return False
+        if not self._fresh:
+            with self._lock:
+                self._load(cleanup=True)
+                self._generation += 1
+                self._buffer, self._buffered, self._buffer_since = {}, 0, None
+                self._fresh = True
+        return True
+
+    def _guild_dir(self, guild_id):
+        path = os.path.join(self.root, str(guild_id))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # ---------- 主題流水號 ----------
+    def _topics(self, guild_id):
+        names = self._topic_names.get(guild_id)
+        if names is not None:
+            return names
+        names, path = [None], os.path.join(self._guild_dir(guild_id), "topics.jsonl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                raw = f.read()
+            # 寫到一半的最後一行（crash）截掉，之後的主題接在完整的行後面
+            complete = raw[:raw.rfind(b"\n") + 1]
+            if len(complete) != len(raw):
+                with open(path, "r+b") as f:
+                    f.truncate(len(complete))
+            names.extend(json.loads(line) for line in complete.decode("utf-8").splitlines())
+        self._topic_ids[guild_id] = {topic: i for i, topic in enumerate(names) if i}
+        self._topic_names[guild_id] = names
+        return names
+
+    def _intern(self, guild_id, topic, pending):
+        if not topic:
+            return 0
+        names = self._topics(guild_id)
+        ids = self._topic_ids[guild_id]
+        topic_id = ids.get(topic)
+        if topic_id is None:
+            topic_id = ids[topic] = len(names)
+            names.append(topic)
+            pending.setdefault(guild_id, []).append(topic)
+        return topic_id
+
+    def _append_topics(self, pending):
+        for guild_id, topics in pending.items():
+            with open(os.path.join(self._guild_dir(guild_id), "topics.jsonl"), "ab") as f:
+                f.write("".join(json.dumps(topic, ensure_ascii=False) + "\n" for topic in topics).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+
+    # ---------- 寫入 ----------
+    def ingest(self, conn, owned="1"):
+        """讀 sessions 表裡還沒封存的列（最多 ingest_batch 列）進緩衝，該封存時封存；回傳讀了幾列"""
+        if not self._writable():
+            return 0
+        rows = conn.execute(
+            "SELECT id, guild_id, user_id, channel_id, topic, start_ts, end_ts FROM sessions "
+            f"WHERE id > ? AND {owned} ORDER BY id LIMIT ?",
+            (self._read_id, self.ingest_batch)
+        ).fetchall()
+        pending = {}
+        for session_id, guild_id, user_id, channel_id, topic, start_ts, end_ts in rows:
+            guild_id = guild_id or 0
+            buffer = self._buffer.get(guild_id)
+            if buffer is None:
+                buffer = self._buffer[guild_id] = []
+            buffer.append((
+                int(start_ts), user_id, channel_id or 0, max(0, round(end_ts - start_ts)),
+                self._intern(guild_id, topic, pending), session_id
+            ))
+        # 主題表先落地，segment 裡的 id 一定查得到
+        self._append_topics(pending)
+        if rows:
+            self._read_id = rows[-1][0]
+            self._buffered += len(rows)
+            if self._buffer_since is None:
+                self._buffer_since = time.monotonic()
+        if self._buffered >= self.segment_rows or (
+            self._buffer_since is not None and time.monotonic() - self._buffer_since >= self.seal_interval
+        ):
+            self.seal()
+        return len(rows)
+
+    def seal(self):
+        """緩衝寫成 segment（每個伺服器一個檔），再原子更新 manifest"""
+        if not self._buffered or not self._writable():
+            return
+        generation = self._generation
+        written = []
+        for guild_id, rows in self._buffer.items():
+            rows.sort()
+            columns = {
+                "user_id": array.array("Q", [r[1] for r in rows]),
+                "start_ts": array.array("q", [r[0] for r in rows]),
+                "channel_id": array.array("Q", [r[2] for r in rows]),
+                "duration": array.array("I", [r[3] for r in rows]),
+                "topic_id": array.array("I", [r[4] for r in rows])
+            }
+            ids = [r[5] for r in rows]
+            written.append((guild_id, self._write(guild_id, columns, min(ids), max(ids)), len(rows)))
+        with self._lock:
+            # 寫檔期間租約換過手：新的 leader 清理時可能已經把這些檔當孤兒刪掉，不能列進 manifest；
+            # 這批列之後由拿到寫入權的一方從 SQLite 重讀
+            paths = [os.path.join(self._guild_dir(guild_id), name) for guild_id, name, _ in written]
+            if not self._still_writable(generation) or not all(os.path.exists(path) for path in paths):
+                for path in paths:
+                    _remove(path)
+                self._fresh = False
+                log.warning("archive.seal_aborted", "⚠️  封存期間失去寫入權，這批 segment 作廢", segments=len(paths))
+                return
+            for guild_id, name, rows in written:
+                self._segments[guild_id] = sorted(self._segments.get(guild_id, []) + [name])
+                self._rows += rows
+            self.ingested = self._read_id
+            self._save()
+        self.sealed += len(written)
+        self._buffer, self._buffered, self._buffer_since = {}, 0, None
+
+    def _write(self, guild_id, columns, first_id, last_id):
+        rows = len(columns["start_ts"])
+        name = f"{first_id:012d}-{last_id:012d}{SEGMENT_SUFFIX}"
+        path = os.path.join(self._guild_dir(guild_id), name)
+        starts = columns["start_ts"]
+        with open(path + ".tmp", "wb") as f:
+            f.write(HEADER.pack(
+                MAGIC, VERSION, sys.byteorder == "little", rows, int(starts[0]), int(starts[-1]), first_id, last_id
+            ).ljust(HEADER_SIZE, b"\0"))
+            for column, _ in COLUMNS:
+                f.write(columns[column])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return name
+
+    def write_segment(self, guild_id, columns, first_id, last_id):
+        """直接寫入一個已依 start_ts 排序的 segment（匯入 / 測試用），columns 是欄名 -> 陣列"""
+        name = self._write(guild_id, columns, first_id, last_id)
+        with self._lock:
+            self._segments[guild_id] = sorted(self._segments.get(guild_id, []) + [name])
+            self._rows += len(columns["start_ts"])
+            self.ingested = max(self.ingested, last_id)
+            self._read_id = max(self._read_id, last_id)
+            self._save()
+
+    def intern_topics(self, guild_id, topics):
+        """直接寫入時先登記主題，回傳對應的 id"""
+        pending = {}
+        ids = [self._intern(guild_id, topic, pending) for topic in topics]
+        self._append_topics(pending)
+        return ids
+
+    # ---------- 合併 ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="archive-compactor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except (OSError, ArchiveError) as e:
+                log.error("archive.compact_failed", f"❌ 合併 session 封存失敗: {e}")
+
+    def compact(self):
+        """
+        某個伺服器小於 merge_rows 列的 segment 累積到 merge_min 個以上時，把相鄰的小 segment
+        合併到接近 merge_rows 列；每次合併讀兩次、寫一次，大 segment 不再被重寫。回傳合併了幾次。
+        """
+        if not self._writable():
+            return 0
+        with self._lock:
+            generation = self._generation
+            plan = {guild_id: list(names) for guild_id, names in self._segments.items()}
+        merged = 0
+        for guild_id, names in plan.items():
+            segments = [self._segment(guild_id, name) for name in names]
+            if sum(1 for s in segments if s.rows < self.merge_rows) < self.merge_min:
+                continue
+            runs, run, total = [], [], 0
+            for name, segment in zip(names, segments):
+                if segment.rows >= self.merge_rows or (run and total + segment.rows > self.merge_rows):
+                    runs.append(run)
+                    run, total = [], 0
+                if segment.rows < self.merge_rows:
+                    run.append((name, segment))
+                    total += segment.rows
+            runs.append(run)
+            for run in runs:
+                if len(run) < 2:
+                    continue
+                if not self._merge(guild_id, run, generation):
+                    return merged
+                merged += 1
+        return merged
+
+    def _merge(self, guild_id, run, generation):
+        start = time.perf_counter()
+        segments = [segment for _, segment in run]
+        starts = _concat(segments, "start_ts", "q")
+        if np is not None:
+            order = np.argsort(starts, kind="stable")
+            columns = {name: _concat(segments, name, code)[order] for name, code in COLUMNS}
+        else:
+            # 每個 segment 本來就排好序，timsort 只需要歸併這幾段
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+            columns = {
+                name: array.array(code, map(_concat(segments, name, code).__getitem__, order))
+                for name, code in COLUMNS
+            }
+        first_id = min(s.first_id for s in segments)
+        last_id = max(s.last_id for s in segments)
+        names = {name for name, _ in run}
+        new = self._write(guild_id, columns, first_id, last_id)
+        with self._lock:
+            # 合併期間失去寫入權或重讀過 manifest（新檔可能已被別人清掉）：這次的結果作廢
+            path = os.path.join(self._guild_dir(guild_id), new)
+            if not self._still_writable(generation) or not os.path.exists(path):
+                _remove(path)
+                return False
+            self._segments[guild_id] = sorted([n for n in self._segments[guild_id] if n not in names] + [new])
+            # 合併前後列數相同；照算一次，manifest 的合計和 segment 清單保持一致
+            self._rows += len(columns["start_ts"]) - sum(segment.rows for segment in segments)
+            self._save()
+            for name in names:
+                self._open.pop(os.path.join(self._guild_dir(guild_id), name), None)
+        # 查詢中的執行緒仍持有舊檔的 mmap，刪檔不影響它們
+        for name in names:
+            _remove(os.path.join(self._guild_dir(guild_id), name))
+        rows = len(columns["start_ts"])
+        self.merges += 1
+        self.merged_rows += rows
+        log.info(
+            "archive.merged", f"🗜️ 合併 {len(run)} 個 segment（{rows} 列）",
+            guild_id=guild_id, segments=len(run), rows=rows, took_ms=round((time.perf_counter() - start) * 1000, 1)
+        )
+        return True
+
+    # ---------- 查詢 ----------
+    def _segment(self, guild_id, name):
+        path = os.path.join(self.root, str(guild_id), name)
+        segment = self._open.get(path)
+        if segment is None:
+            segment = self._open[path] = Segment(path)
+        return segment
+
+    def scan(self, guild_id, by=None, since=None, until=None, user_id=None, channel_id=None, topic=None):
+        """
+        start_ts 落在 [since, until) 的已封存 session。
+        by=None 回傳 {"seconds", "sessions"}；by 為 user / channel / topic 時回傳 {key: [秒數, session 數]}。
+        整個 segment 都在區間外的直接跳過，區間內的用二分搜尋切出列範圍再整欄計算。
+        """
+        if by is not None and by not in GROUP_COLUMNS:
+            raise ArchiveError(f"by 只支援 {', '.join(GROUP_COLUMNS)}")
+        self._refresh()
+        with self._lock:
+            names = list(self._segments.get(guild_id, ()))
+            topic_names = self._topics(guild_id) if names else [None]
+            segments = [self._segment(guild_id, name) for name in names]
+        filters = []
+        if user_id is not None:
+            filters.append(("user_id", user_id))
+        if channel_id is not None:
+            filters.append(("channel_id", channel_id))
+        column = GROUP_COLUMNS[by] if by is not None else None
+        totals = [0, 0] if column is None else {}
+        if topic is not None:
+            topic_id = self._topic_ids.get(guild_id, {}).get(topic)
+            if topic_id is None:
+                segments = []
+            filters.append(("topic_id", topic_id))
+        scan = _scan_numpy if np is not None else _scan_python
+        for segment in segments:
+            if since is not None and segment.max_start < since:
+                continue
+            if until is not None and segment.min_start >= until:
+                continue
+            lo, hi = segment.bounds(since, until)
+            if lo < hi:
+                scan(segment, lo, hi, filters, column, totals)
+        if column is None:
+            return {"seconds": totals[0], "sessions": totals[1]}
+        if by == "topic":
+            return {topic_names[key] or "": entry for key, entry in totals.items()}
+        return totals
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """/status 每秒呼叫：只讀計數，不開 segment 檔（standby 的 manifest 可能已經過期、檔案已被 leader 合併刪除）"""
+        self._refresh()
+        with self._lock:
+            segments = sum(len(names) for names in self._segments.values())
+            rows = self._rows
+        return {
+            "segments": segments,
+            "rows": rows,
+            "bytes": segments * HEADER_SIZE + rows * ROW_BYTES,
+            "ingested": self.ingested,
+            "buffered": self._buffered,
+            "sealed": self.sealed,
+            "merges": self.merges,
+            "merged_rows": self.merged_rows,
+            "numpy": np is not None
+        }
@@ -0,0 +1,576 @@
+# =========================
+# session_store.py
+# 語音 session 的持久化：SQLite 追加式 journal + 定期快照
+# =========================
+import queue
+import sqlite3
+import threading
+import time
+
+from jsonlog import log
+from session_archive import ArchiveError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    guild_id INTEGER,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    channel_name TEXT,
+    topic TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    join_ts REAL NOT NULL,
+    topic TEXT,
+    channel_id INTEGER,
+    channel_name TEXT,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    guild_id INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, guild_id, scope, key)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    topic TEXT,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL
+);
+-- 管理員設定的主題別名（fold 後的寫法 -> 標準主題），以及不是對應到自己的原始寫法
+CREATE TABLE IF NOT EXISTS topic_aliases (
+    guild_id INTEGER NOT NULL,
+    alias TEXT NOT NULL,
+    canonical TEXT NOT NULL,
+    PRIMARY KEY (guild_id, alias)
+);
+CREATE TABLE IF NOT EXISTS topic_map (
+    guild_id INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    canonical TEXT NOT NULL,
+    PRIMARY KEY (guild_id, topic)
+);
+"""
+
+# 索引在 _migrate 之後才建：舊版的表（例如沒有 guild_id 的 rollups）要先升級，索引的欄位才存在
+INDEXES = """
+-- 別名改變時依原始寫法找出要搬動的 topic 統計列
+CREATE INDEX IF NOT EXISTS rollups_key ON rollups (guild_id, scope, key);
+CREATE INDEX IF NOT EXISTS sessions_user_start ON sessions (user_id, start_ts);
+-- 依時間範圍的查詢（歷史匯出、學習摘要）只讀索引就夠，不必回表
+CREATE INDEX IF NOT EXISTS sessions_window ON sessions (start_ts, id, end_ts, guild_id, channel_id, user_id, topic);
+"""
+
+OPEN, TOPIC, MOVE, CLOSE = "open", "topic", "move", "close"
+SCHEMA_VERSION = 4
+
+# 把 topic 統計列（原始寫法）的秒數從舊的標準主題搬到新的：先加到新的 subject 列，再從舊的扣掉
+_MOVE_TO_SUBJECT = """
+INSERT INTO rollups (guild_id, scope, period, bucket, key, seconds, sessions)
+SELECT guild_id, 'subject', period, bucket, ?, seconds, sessions FROM rollups
+WHERE guild_id = ? AND scope = 'topic' AND key = ?
+ON CONFLICT (period, bucket, guild_id, scope, key) DO UPDATE SET
+seconds = seconds + excluded.seconds, sessions = sessions + excluded.sessions
+"""
+_MOVE_FROM_SUBJECT = """
+UPDATE rollups AS s SET seconds = s.seconds - t.seconds, sessions = s.sessions - t.sessions
+FROM rollups AS t
+WHERE t.guild_id = ? AND t.scope = 'topic' AND t.key = ?
+  AND s.guild_id = t.guild_id AND s.scope = 'subject' AND s.key = ?
+  AND s.period = t.period AND s.bucket = t.bucket
+"""
+
+
+def connect(path, legacy_guild_id=0):
+    # 多個分片行程共用同一個檔案時，寫入鎖最多等 30 秒
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + FULL：每次 commit 都 fsync，所以批次 commit 就是批次 fsync
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.executescript(SCHEMA)
+    _migrate(conn, legacy_guild_id)
+    conn.executescript(INDEXES)
+    return conn
+
+
+def _migrate(conn, legacy_guild_id):
+    """
+    v1 只有單一伺服器：snapshot 以 user_id 為主鍵、rollups 沒有 guild_id、
+    TOPIC / MOVE / CLOSE 的 journal 沒記 guild_id。升級時全部歸到舊的 GUILD_ID。
+    v2 的 sessions 只有 (start_ts) 索引，v3 換成涵蓋索引 sessions_window。
+    v4 加上主題歸併：既有的 topic 統計複製成 subject 統計（還沒有別名，標準主題就是原始寫法）。
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    if row and int(row[0]) >= SCHEMA_VERSION:
+        return
+    with conn:
+        # DDL 預設不會自動開交易，明確 BEGIN 讓整個升級是原子的
+        conn.execute("BEGIN")
+        columns = {r[1]: r[5] for r in conn.execute("PRAGMA table_info(snapshot)")}
+        if columns.get("guild_id") == 0:
+            conn.execute("ALTER TABLE snapshot RENAME TO snapshot_v1")
+        if "guild_id" not in {r[1] for r in conn.execute("PRAGMA table_info(rollups)")}:
+            conn.execute("ALTER TABLE rollups RENAME TO rollups_v1")
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "snapshot_v1" in tables:
+            conn.execute(
+                "INSERT INTO snapshot (guild_id, user_id, join_ts, topic, channel_id, channel_name) "
+                "SELECT COALESCE(guild_id, ?), user_id, join_ts, topic, channel_id, channel_name FROM snapshot_v1",
+                (legacy_guild_id,)
+            )
+            conn.execute("DROP TABLE snapshot_v1")
+        if "rollups_v1" in tables:
+            conn.execute(
+                "INSERT INTO rollups (guild_id, scope, period, bucket, key, seconds, sessions) "
+                "SELECT ?, scope, period, bucket, key, seconds, sessions FROM rollups_v1",
+                (legacy_guild_id,)
+            )
+            conn.execute("DROP TABLE rollups_v1")
+        conn.execute("UPDATE journal SET guild_id = ? WHERE guild_id IS NULL", (legacy_guild_id,))
+        conn.execute("DROP INDEX IF EXISTS sessions_start")
+        conn.execute(
+            "INSERT OR IGNORE INTO rollups (guild_id, scope, period, bucket, key, seconds, sessions) "
+            "SELECT guild_id, 'subject', period, bucket, key, seconds, sessions FROM rollups WHERE scope = 'topic'"
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)
+        )
+
+
+def _apply(sessions, row):
+    """把一筆 journal 套用到 (guild_id, user_id) -> session 的 dict 上"""
+    seq, ts, kind, guild_id, user_id, channel_id, channel_name, topic = row
+    key = (guild_id, user_id)
+    if kind == OPEN:
+        sessions[key] = {
+            "guild_id": guild_id,
+            "join_ts": ts,
+            "topic": topic,
+            "channel_id": channel_id,
+            "channel_name": channel_name
+        }
+    elif kind == CLOSE:
+        sessions.pop(key, None)
+    elif key in sessions:
+        if kind == TOPIC:
+            sessions[key]["topic"] = topic
+        elif kind == MOVE:
+            sessions[key]["channel_id"] = channel_id
+            sessions[key]["channel_name"] = channel_name
+
+
+class Rebucket:
+    """別名改變：和統計增量走同一個佇列，寫入順序與 event loop 上發生的順序一致"""
+
+    __slots__ = ("guild_id", "alias", "canonical", "changes")
+
+    def __init__(self, guild_id, alias, canonical, changes):
+        self.guild_id = guild_id
+        self.alias = alias
+        self.canonical = canonical  # None = 移除別名
+        self.changes = changes  # [(原始寫法, 舊標準主題, 新標準主題)]
+
+
+class SessionStore:
+    """
+    事件處理器只把事件丟進佇列（不阻塞 event loop），
+    背景執行緒每 flush_interval 秒把累積的事件寫成一個交易並 fsync。
+    journal 超過 compact_every 筆時把目前開著的 session 寫入快照並清掉舊 journal，
+    所以重啟時只需要讀「快照 + 少量尾端 journal」，恢復時間不會隨歷史變長。
+
+    分片跑在不同行程時共用同一個資料庫：shard_ids / shard_count 決定這個行程負責哪些伺服器，
+    讀取、快照與清 journal 都只碰自己分片的列，last_alive 等 meta 也按分片分開存。
+
+    主備切換時 fence() 為假的實例（standby、或已失去租約的舊 leader）不寫入，整批丟棄；
+    standby 用 follow() 持續讀 leader 寫入的 journal，接手時只差最後一小段。
+
+    有 archive（session_archive.SessionArchive）時，每次寫入後把 sessions 表的新列接著寫進欄式封存。
+    """
+
+    def __init__(self, path, flush_interval=1.0, compact_every=2000, heartbeat=30.0,
+                 shard_ids=None, shard_count=None, legacy_guild_id=0, fence=None, archive=None):
+        self.path = path
+        self._fence = fence
+        self._archive = archive
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.heartbeat = heartbeat
+        if shard_ids and shard_count:
+            ids = ", ".join(str(int(i)) for i in shard_ids)
+            self._owned = f"((guild_id >> 22) % {int(shard_count)}) IN ({ids})"
+            self._partition = f"{int(shard_count)}:{ids.replace(' ', '')}"
+        else:
+            self._owned = "1"
+            self._partition = None
+        self._conn = connect(path, legacy_guild_id)
+        self._queue = queue.SimpleQueue()
+        self._rollups = queue.SimpleQueue()
+        self._completed = queue.SimpleQueue()
+        self._meta = queue.SimpleQueue()
+        self._topic_map = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._since_snapshot = self._conn.execute(
+            f"SELECT COUNT(*) FROM journal WHERE {self._owned}"
+        ).fetchone()[0]
+        self._last_heartbeat = 0.0
+        self._follower = None
+        self._follow_lock = threading.Lock()
+        self._follow_seq = 0
+        self._follow_sessions = None
+        self.written = 0
+        self.batches = 0
+        self.compactions = 0
+        self.fenced = 0
+        self.follow_reloads = 0
+
+    # ---------- 寫入（event loop 端呼叫） ----------
+    def open_session(self, guild_id, user_id, join_ts, channel_id, channel_name, topic=None):
+        self._queue.put((join_ts, OPEN, guild_id, user_id, channel_id, channel_name, topic))
+
+    def set_topic(self, guild_id, user_id, topic):
+        self._queue.put((time.time(), TOPIC, guild_id, user_id, None, None, topic))
+
+    def move(self, guild_id, user_id, channel_id, channel_name):
+        self._queue.put((time.time(), MOVE, guild_id, user_id, channel_id, channel_name, None))
+
+    def close_session(self, guild_id, user_id, ts=None):
+        self._queue.put((ts or time.time(), CLOSE, guild_id, user_id, None, None, None))
+
+    def add_rollups(self, deltas):
+        """RollupEngine.add_session() 回傳的增量，和 journal 在同一個交易寫入"""
+        self._rollups.put(deltas)
+
+    def add_completed(self, guild_id, user_id, channel_id, topic, start_ts, end_ts):
+        """已結束的 session，寫入歷史表供查詢"""
+        self._completed.put((guild_id, user_id, channel_id, topic, start_ts, end_ts))
+
+    def set_meta(self, key, value):
+        self._meta.put((key, value))
+
+    def map_topic(self, guild_id, topic, canonical):
+        """新的原始寫法被歸到別的標準主題"""
+        self._topic_map.put((guild_id, topic, canonical))
+
+    def rebucket(self, guild_id, alias, canonical, changes):
+        """設定 / 移除別名，並把受影響原始寫法的 subject 統計搬到新的標準主題（歷史 bucket 也一起）"""
+        self._rollups.put(Rebucket(guild_id, alias, canonical, changes))
+
+    # ---------- 背景寫入 ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+            self._thread.start()
+
+    def _drain(self, q):
+        rows = []
+        while True:
+            try:
+                rows.append(q.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._write_pending()
+            self._archive_step()
+        self._write_pending()
+        self._archive_step(final=True)
+
+    def _archive_step(self, final=False):
+        """已寫進 sessions 表的列接著封存；關機時讀完剩下的並把緩衝封存成 segment"""
+        if self._archive is None:
+            return
+        try:
+            while self._archive.ingest(self._conn, self._owned) and final:
+                pass
+            if final:
+                self._archive.seal()
+        except (OSError, sqlite3.Error, ArchiveError) as e:
+            log.error("archive.ingest_failed", f"❌ 寫入 session 封存失敗: {e}")
+
+    def _write_pending(self):
+        self._write_batch(
+            self._drain(self._queue), self._drain(self._rollups),
+            self._drain(self._completed), self._drain(self._meta), self._drain(self._topic_map)
+        )
+
+    def _write_batch(self, rows, rollups=(), completed=(), meta=(), topic_map=()):
+        now = time.time()
+        beat = now - self._last_heartbeat >= self.heartbeat
+        if not rows and not rollups and not completed and not meta and not topic_map and not beat:
+            return
+        dropped = len(rows) + len(rollups) + len(completed) + len(meta) + len(topic_map)
+        if self._fence is not None and not self._fence():
+            self._drop_fenced(dropped)
+            return
+        fenced = False
+        try:
+            with self._conn:
+                if rows:
+                    self._conn.executemany(
+                        "INSERT INTO journal (ts, kind, guild_id, user_id, channel_id, channel_name, topic) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                for deltas in rollups:
+                    if isinstance(deltas, Rebucket):
+                        self._rebucket(deltas)
+                        continue
+                    self._conn.executemany(
+                        "INSERT INTO rollups (guild_id, scope, period, bucket, key, seconds, sessions) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (period, bucket, guild_id, scope, key) DO UPDATE SET "
+                        "seconds = seconds + excluded.seconds, sessions = sessions + excluded.sessions",
+                        deltas
+                    )
+                if completed:
+                    self._conn.executemany(
+                        "INSERT INTO sessions (guild_id, user_id, channel_id, topic, start_ts, end_ts) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        completed
+                    )
+                if meta:
+                    self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta)
+                if topic_map:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO topic_map (guild_id, topic, canonical) VALUES (?, ?, ?)", topic_map
+                    )
+                # 記錄最後存活時間，重啟時用來結算期間離開的人
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (self._meta_key("last_alive"), str(now))
+                )
+                # 等寫入鎖最多 30 秒，比租約長：commit 前再確認一次，這段期間被接手就整批 rollback
+                if self._fence is not None and not self._fence():
+                    self._conn.rollback()
+                    fenced = True
+        except sqlite3.Error as e:
+            log.error("session_store.write_failed", f"❌ 寫入 session journal 失敗: {e}", rows=len(rows))
+            return
+        if fenced:
+            self._drop_fenced(dropped)
+            return
+        self._last_heartbeat = now
+        self.written += len(rows)
+        self.batches += 1
+        self._since_snapshot += len(rows)
+        if self._since_snapshot >= self.compact_every:
+            self.compact()
+
+    def _drop_fenced(self, dropped):
+        if dropped:
+            self.fenced += dropped
+            log.warning("session_store.fenced", f"⚠️  未持有租約，丟棄 {dropped} 筆寫入", dropped=dropped)
+
+    def _rebucket(self, job):
+        """只碰受影響原始寫法的統計列（走 rollups_key 索引），不重算整個歷史"""
+        if job.canonical is None:
+            self._conn.execute(
+                "DELETE FROM topic_aliases WHERE guild_id = ? AND alias = ?", (job.guild_id, job.alias)
+            )
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO topic_aliases (guild_id, alias, canonical) VALUES (?, ?, ?)",
+                (job.guild_id, job.alias, job.canonical)
+            )
+        for topic, old, new in job.changes:
+            if new == topic:
+                self._conn.execute(
+                    "DELETE FROM topic_map WHERE guild_id = ? AND topic = ?", (job.guild_id, topic)
+                )
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO topic_map (guild_id, topic, canonical) VALUES (?, ?, ?)",
+                    (job.guild_id, topic, new)
+                )
+            self._conn.execute(_MOVE_TO_SUBJECT, (new, job.guild_id, topic))
+            self._conn.execute(_MOVE_FROM_SUBJECT, (job.guild_id, topic, old))
+            self._conn.execute(
+                "DELETE FROM rollups WHERE guild_id = ? AND scope = 'subject' AND key = ? AND sessions <= 0",
+                (job.guild_id, old)
+            )
+
+    def compact(self):
+        """把 journal 摺疊進快照，刪除已套用的 journal"""
+        try:
+            with self._conn:
+                snapshot_seq, sessions = self._replay()
+                last_seq = self._conn.execute(
+                    f"SELECT MAX(seq) FROM journal WHERE {self._owned}"
+                ).fetchone()[0]
+                if last_seq is None:
+                    return
+                self._conn.execute(f"DELETE FROM snapshot WHERE {self._owned}")
+                self._conn.executemany(
+                    "INSERT INTO snapshot (guild_id, user_id, join_ts, topic, channel_id, channel_name) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (guild_id, uid, s["join_ts"], s["topic"], s["channel_id"], s["channel_name"])
+                        for (guild_id, uid), s in sessions.items()
+                    ]
+                )
+                self._conn.execute(f"DELETE FROM journal WHERE seq <= ? AND {self._owned}", (last_seq,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (self._meta_key("snapshot_seq"), str(last_seq))
+                )
+            self._since_snapshot = 0
+            self.compactions += 1
+        except sqlite3.Error as e:
+            log.error("session_store.compact_failed", f"❌ 壓縮 session journal 失敗: {e}")
+
+    # ---------- 讀取 ----------
+    def _meta_key(self, key):
+        return key if self._partition is None else f"{key}:{self._partition}"
+
+    def _replay(self, conn=None):
+        """快照 + 之後的 journal，回傳 (已套用到的 seq, sessions)"""
+        conn = conn or self._conn
+        sessions = {}
+        for uid, guild_id, join_ts, topic, channel_id, channel_name in conn.execute(
+            f"SELECT user_id, guild_id, join_ts, topic, channel_id, channel_name FROM snapshot WHERE {self._owned}"
+        ):
+            sessions[(guild_id, uid)] = {
+                "guild_id": guild_id,
+                "join_ts": join_ts,
+                "topic": topic,
+                "channel_id": channel_id,
+                "channel_name": channel_name
+            }
+        return self._tail(conn, sessions, self._snapshot_seq(conn)), sessions
+
+    def _snapshot_seq(self, conn):
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (self._meta_key("snapshot_seq"),)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def _tail(self, conn, sessions, after):
+        """把 seq > after 的 journal 套用到 sessions，回傳最後一筆的 seq"""
+        for row in conn.execute(
+            "SELECT seq, ts, kind, guild_id, user_id, channel_id, channel_name, topic "
+            f"FROM journal WHERE seq > ? AND {self._owned} ORDER BY seq",
+            (after,)
+        ):
+            _apply(sessions, row)
+            after = row[0]
+        return after
+
+    def _last_alive(self, conn):
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (self._meta_key("last_alive"),)
+        ).fetchone()
+        return float(row[0]) if row else None
+
+    def load(self):
+        """啟動時呼叫：回傳 (上次存活時間, 仍開著的 session)，session 以 (guild_id, user_id) 為 key"""
+        _, sessions = self._replay()
+        return self._last_alive(self._conn), sessions
+
+    def follow(self):
+        """
+        standby 定期呼叫（背景執行緒）：用另一條唯讀連線增量讀 leader 新寫的 journal，
+        回傳 (leader 上次存活時間, 仍開著的 session)。leader 壓縮過 journal、
+        還沒讀到的部分可能已被刪掉時，改從快照重讀。整次讀取在同一個讀交易裡，不會讀到壓縮到一半的狀態。
+        """
+        with self._follow_lock:
+            if self._follower is None:
+                self._follower = sqlite3.connect(
+                    f"file:{self.path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None
+                )
+            conn = self._follower
+            conn.execute("BEGIN")
+            try:
+                if self._follow_sessions is None or self._snapshot_seq(conn) > self._follow_seq:
+                    self._follow_seq, self._follow_sessions = self._replay(conn)
+                    self.follow_reloads += 1
+                else:
+                    self._follow_seq = self._tail(conn, self._follow_sessions, self._follow_seq)
+                last_alive = self._last_alive(conn)
+            finally:
+                conn.execute("COMMIT")
+            return last_alive, {key: dict(s) for key, s in self._follow_sessions.items()}
+
+    # 下面這些讀取預設用寫入連線，只能在背景寫入執行緒啟動前呼叫；
+    # 執行緒已經在跑（standby 接手）時由呼叫端傳入另一條唯讀連線（history.open_readonly）
+    def get_meta(self, key, conn=None):
+        """啟動時讀取（背景寫入執行緒啟動前，或傳入 conn）"""
+        row = (conn or self._conn).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def load_rollups(self, buckets, conn=None):
+        """讀回指定 (period, bucket) 的統計列"""
+        conn = conn or self._conn
+        rows = []
+        for period, bucket in buckets:
+            rows.extend(conn.execute(
+                "SELECT guild_id, scope, period, bucket, key, seconds, sessions FROM rollups "
+                f"WHERE period = ? AND bucket = ? AND {self._owned}",
+                (period, bucket)
+            ))
+        return rows
+
+    def load_topics(self, conn=None):
+        """啟動時讀取：每個伺服器用過的主題 (guild_id, topic, 次數, 最後使用時間)"""
+        return (conn or self._conn).execute(
+            "SELECT guild_id, topic, COUNT(*), MAX(end_ts) FROM sessions "
+            f"WHERE topic IS NOT NULL AND {self._owned} GROUP BY guild_id, topic"
+        ).fetchall()
+
+    def load_topic_canon(self, conn=None):
+        """啟動時讀取：(原始寫法對應, 別名)"""
+        conn = conn or self._conn
+        mapping = conn.execute(
+            f"SELECT guild_id, topic, canonical FROM topic_map WHERE {self._owned}"
+        ).fetchall()
+        aliases = conn.execute(
+            f"SELECT guild_id, alias, canonical FROM topic_aliases WHERE {self._owned}"
+        ).fetchall()
+        return mapping, aliases
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        else:
+            self._write_pending()
+            self._archive_step(final=True)
+        self._conn.close()
+        if self._follower is not None:
+            self._follower.close()
+
+    def stats(self):
+        return {
+            "pending": (
+                self._queue.qsize() + self._rollups.qsize()
+                + self._completed.qsize() + self._meta.qsize() + self._topic_map.qsize()
+            ),
+            "written": self.written,
+            "batches": self.batches,
+            "journal_since_snapshot": self._since_snapshot,
+            "compactions": self.compactions,
+            "fenced": self.fenced,
+            "follow_seq": self._follow_seq,
+            "follow_reloads": self.follow_reloads
+        }
@@ -0,0 +1,136 @@
+# =========================
+# sessions.py
+# 進行中的語音 session：__slots__ 紀錄 + monotonic 計時
+# =========================
+import time
+
+
+class VoiceSession:
+    """
+    一個進行中的 session。
+    join_ts 是加入時的牆上時間（只在建立時取一次，給顯示與持久化用），
+    持續時間一律用 monotonic_ns 計算，不受系統校時影響。
+    """
+
+    __slots__ = ("guild_id", "channel_id", "topic", "join_ts", "join_ns")
+
+    def __init__(self, guild_id, channel_id, join_ts, join_ns, topic=None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.topic = topic
+        self.join_ts = join_ts
+        self.join_ns = join_ns
+
+    def elapsed(self, now_ns=None):
+        """到目前為止的秒數"""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        return (now_ns - self.join_ns) / 1e9
+
+    def end_ts(self, now_ns=None):
+        """以 monotonic 換算的結束牆上時間"""
+        return self.join_ts + self.elapsed(now_ns)
+
+
+class SessionTable:
+    """
+    (guild_id, user_id) -> VoiceSession。
+    同一個人可能同時在不同伺服器的語音頻道，所以 key 一定要帶伺服器。
+
+    另外維護 channel_id -> {user_id: VoiceSession} 的房間索引（依進房順序），
+    所有進出與換頻道都經過這裡，兩份索引不會不同步；房間人數變化時呼叫 listener(guild_id, channel_id, 人數)。
+    """
+
+    __slots__ = ("_sessions", "_rooms", "listener")
+
+    def __init__(self, listener=None):
+        self._sessions = {}
+        self._rooms = {}
+        self.listener = listener
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def __iter__(self):
+        return iter(self._sessions)
+
+    def get(self, key):
+        return self._sessions.get(key)
+
+    def items(self):
+        return self._sessions.items()
+
+    def room(self, channel_id):
+        """頻道裡的人：{user_id: VoiceSession}（唯讀，依進房順序）"""
+        return self._rooms.get(channel_id, {})
+
+    def rooms(self):
+        """目前有人的頻道：channel_id -> 人數"""
+        return {channel_id: len(members) for channel_id, members in self._rooms.items()}
+
+    def _enter(self, user_id, session):
+        members = self._rooms.get(session.channel_id)
+        if members is None:
+            members = self._rooms[session.channel_id] = {}
+        members[user_id] = session
+        if self.listener is not None:
+            self.listener(session.guild_id, session.channel_id, len(members))
+
+    def _exit(self, user_id, session):
+        members = self._rooms.get(session.channel_id)
+        if members is None or members.pop(user_id, None) is None:
+            return
+        if not members:
+            del self._rooms[session.channel_id]
+        if self.listener is not None:
+            self.listener(session.guild_id, session.channel_id, len(members))
+
+    def open(self, key, channel_id, join_ts=None, topic=None):
+        """
+        開始追蹤；join_ts 為 None 表示現在加入。
+        恢復舊 session 時傳入當初的 join_ts，monotonic 起點依牆上時間差回推。
+        """
+        now_ns = time.monotonic_ns()
+        if join_ts is None:
+            join_ts = time.time()
+        else:
+            now_ns -= int((time.time() - join_ts) * 1e9)
+        session = VoiceSession(key[0], channel_id, join_ts, now_ns, topic)
+        return self.reopen(key, session)
+
+    def reopen(self, key, session, channel_id=None):
+        """把暫時離開的 session 放回來（可能回到別的頻道），加入時間與主題不變"""
+        previous = self._sessions.get(key)
+        if previous is not None:
+            self._exit(key[1], previous)
+        if channel_id is not None:
+            session.channel_id = channel_id
+        self._sessions[key] = session
+        self._enter(key[1], session)
+        return session
+
+    def move(self, key, channel_id):
+        """換頻道，回傳原本的 channel_id（沒有這個 session 或沒有換則回傳 None）"""
+        session = self._sessions.get(key)
+        if session is None or session.channel_id == channel_id:
+            return None
+        previous = session.channel_id
+        self._exit(key[1], session)
+        session.channel_id = channel_id
+        self._enter(key[1], session)
+        return previous
+
+    def close(self, key):
+        """停止追蹤並回傳該 session（不存在則回傳 None）"""
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            self._exit(key[1], session)
+        return session
+
+    def clear(self):
+        """全部丟掉（失去 leader 身分時，狀態改以共享資料庫為準）；不觸發 listener"""
+        self._sessions.clear()
+        self._rooms.clear()
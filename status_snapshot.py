@@ -0,0 +1,338 @@
+# =========================
+# status_snapshot.py
+# 健康檢查 / 狀態端點的預先序列化回應：狀態改變才重算，支援 ETag 與 HEAD
+# =========================
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from starlette.responses import Response
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    loads = json.loads
+
+JSON_TYPE = "application/json"
+
+
+class _Entry:
+    __slots__ = ("key", "etag", "get", "head", "not_modified")
+
+    def __init__(self, key, etag, body):
+        self.key = key
+        self.etag = etag
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        self.get = Response(body, media_type=JSON_TYPE, headers=headers)
+        # HEAD 不帶 body，但 Content-Length 與 GET 一致
+        self.head = Response(
+            media_type=JSON_TYPE, headers={**headers, "Content-Length": str(len(body))}
+        )
+        self.not_modified = Response(status_code=304, headers=headers)
+
+
+def _make_entry(key, stable, volatile, strict=False):
+    """strict：ETag 以整個回應內容計算，時鐘欄位（佇列深度、統計等）變了也不會回 304"""
+    body = dumps({**stable, **volatile})
+    etag = f'W/"{zlib.crc32(body if strict else dumps(stable)):08x}"'
+    return _Entry(key, etag, body)
+
+
+def _etag_matches(header, etag):
+    """If-None-Match 用弱比較：W/"x" 與 "x" 視為相同"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class StatusBoard:
+    """
+    bot 端在狀態改變時呼叫 publish()；web 端只讀已經序列化好的回應。
+    每個端點的 builder 回傳 (穩定欄位, 時鐘欄位)：
+    穩定欄位決定弱 ETag，時鐘欄位（uptime、timestamp）每秒最多重算一次。
+    時鐘欄位本身就是重點的端點（/status 的佇列深度、執行統計）用 route(path, strict_etag=True)，ETag 涵蓋整個回應。
+    """
+
+    def __init__(self, **state):
+        self.state = dict(state)
+        self.version = 1
+        self.last_probe = None
+        self._builders = {}
+        self._strict = set()
+        self._cache = {}
+
+    def publish(self, **changes):
+        if all(self.state.get(k) == v for k, v in changes.items()):
+            return
+        # copy-on-write：web 執行緒讀到的永遠是完整的一份
+        self.state = {**self.state, **changes}
+        self.version += 1
+
+    def route(self, path, strict_etag=False):
+        def decorator(builder):
+            self._builders[path] = builder
+            if strict_etag:
+                self._strict.add(path)
+            return builder
+        return decorator
+
+    def _entry(self, path):
+        key = (self.version, int(time.monotonic()))
+        entry = self._cache.get(path)
+        if entry is None or entry.key != key:
+            entry = self._cache[path] = _make_entry(
+                key, *self._builders[path](self.state), strict=path in self._strict
+            )
+        return entry
+
+    def export(self):
+        """所有端點目前的 (穩定欄位, 時鐘欄位)，發布到共享快照給其他行程的 web worker"""
+        return {
+            "version": self.version,
+            "published_at": time.time(),
+            "state": self.state,
+            "routes": {path: builder(self.state) for path, builder in self._builders.items()},
+            "strict_etag": sorted(self._strict)
+        }
+
+    def respond(self, path, request):
+        if request.method == "HEAD":
+            # HEAD：狀態沒變就直接用快取，不管時鐘欄位是否過期
+            entry = self._cache.get(path)
+            if entry is None or entry.key[0] != self.version:
+                entry = self._entry(path)
+            return entry.head
+        entry = self._entry(path)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            return entry.not_modified
+        return entry.get
+
+
+# =========================
+# 跨行程共享快照：bot 行程寫、任意多個 web worker 行程讀
+# 檔案（預設在 /dev/shm）以 mmap 共用，格式：
+#   檔頭 32 bytes：magic、格式版本、seq（已發布幾次）、最近一次健康檢查時間（worker 寫）、每格容量
+#   兩格 slot：長度、crc32、內容；第 seq % 2 格是目前的版本
+# 寫入端只寫另一格，寫完才把 seq 加一（雙緩衝 + 序號，讀者不需要鎖、寫入端不用等讀者）；
+# 讀者複製內容前後各讀一次 seq，不同就重讀，再用 crc32 確認沒有讀到寫了一半的內容。
+# =========================
+MAGIC = b"ICSS"
+LAYOUT_VERSION = 1
+_HEADER = struct.Struct("<4sIQdI")
+_SEQ = struct.Struct("<Q")
+_PROBE = struct.Struct("<d")
+_SLOT = struct.Struct("<II")
+HEADER_SIZE = 32
+SEQ_OFFSET = 8
+PROBE_OFFSET = 16
+DEFAULT_CAPACITY = 1 << 20
+READ_ATTEMPTS = 8
+
+
+def default_snapshot_path(port):
+    """同一台機器上每個 bot（以 web port 區分）一個快照檔"""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"inside_curl_status_{port}")
+
+
+def _slot_offset(seq, capacity):
+    return HEADER_SIZE + (seq % 2) * (_SLOT.size + capacity)
+
+
+def _file_size(capacity):
+    return HEADER_SIZE + 2 * (_SLOT.size + capacity)
+
+
+class SnapshotWriter:
+    """bot 端：publish() 把一份序列化好的快照寫進共享檔案；只能有一個寫入者"""
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        size = _file_size(capacity)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 只加大不縮小：還映射著舊大小的 worker 讀到檔尾之外會 SIGBUS
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, layout, seq, probe, _ = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or layout != LAYOUT_VERSION:
+            seq, probe = 0, 0.0
+        # 重啟後 seq 接著上一輪往上數，worker 不會把新快照當成舊的
+        _HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, seq, probe, capacity)
+        self.seq = seq
+        self.published = 0
+        self.oversized = 0
+        self.last_size = 0
+
+    def publish(self, data):
+        if len(data) > self.capacity:
+            self.oversized += 1
+            return False
+        seq = self.seq + 1
+        offset = _slot_offset(seq, self.capacity)
+        _SLOT.pack_into(self._map, offset, len(data), zlib.crc32(data))
+        start = offset + _SLOT.size
+        self._map[start:start + len(data)] = data
+        _SEQ.pack_into(self._map, SEQ_OFFSET, seq)
+        self.seq = seq
+        self.published += 1
+        self.last_size = len(data)
+        return True
+
+    @property
+    def last_probe(self):
+        """worker 們最近一次收到 /health 的時間"""
+        probe = _PROBE.unpack_from(self._map, PROBE_OFFSET)[0]
+        return probe or None
+
+    def close(self):
+        # 檔案留著：worker 還在讀，下次啟動沿用
+        self._map.close()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "seq": self.seq,
+            "published": self.published,
+            "oversized": self.oversized,
+            "bytes": self.last_size,
+            "capacity": self.capacity
+        }
+
+
+class SnapshotReader:
+    """
+    worker 端：read() 回傳 (seq, 內容)。seq 沒變時只讀 8 bytes 就回傳上次複製的內容；
+    檔案還不存在（bot 還沒啟動）時回傳 (0, None)，下次再試。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self.capacity = 0
+        self.seq = 0
+        self.data = None
+        self.retries = 0
+
+    def _open(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return False
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, layout, _, _, capacity = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or layout != LAYOUT_VERSION or size < _file_size(capacity):
+            self._map.close()
+            self._map = None
+            return False
+        self.capacity = capacity
+        return True
+
+    def read(self):
+        if self._map is None and not self._open():
+            return 0, None
+        for _ in range(READ_ATTEMPTS):
+            seq = _SEQ.unpack_from(self._map, SEQ_OFFSET)[0]
+            if seq == self.seq or seq == 0:
+                return self.seq, self.data
+            offset = _slot_offset(seq, self.capacity)
+            length, crc = _SLOT.unpack_from(self._map, offset)
+            if length <= self.capacity:
+                start = offset + _SLOT.size
+                data = self._map[start:start + length]
+                if _SEQ.unpack_from(self._map, SEQ_OFFSET)[0] == seq and zlib.crc32(data) == crc:
+                    self.seq, self.data = seq, data
+                    return seq, data
+            self.retries += 1
+            # bot 重啟時可能換了容量：重新映射
+            if _HEADER.unpack_from(self._map)[4] != self.capacity and not self._open():
+                break
+        # 一直讀不到一致的版本：先沿用上一版
+        return self.seq, self.data
+
+    def note_probe(self, ts):
+        if self._map is not None:
+            _PROBE.pack_into(self._map, PROBE_OFFSET, ts)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class SharedStatusBoard(StatusBoard):
+    """
+    worker 端的 StatusBoard：各端點的 (穩定欄位, 時鐘欄位) 由 bot 算好放在共享快照裡，
+    這裡只負責序列化與 ETag / HEAD / 304。每個請求先 refresh()：快照 seq 沒變就沿用快取的回應。
+    bot 每秒發布一次，時鐘欄位和單行程時一樣最多落後約一秒。
+    """
+
+    def __init__(self, reader, stale_after=15.0):
+        super().__init__()
+        self.reader = reader
+        self.stale_after = stale_after
+        self.snapshot = None
+        self.version = 0
+
+    def refresh(self):
+        seq, data = self.reader.read()
+        if seq != self.version:
+            self.snapshot = loads(data) if data else None
+            self.version = seq
+            self._cache = {}
+        return self.snapshot
+
+    def age(self):
+        """快照發布到現在幾秒；還沒有快照時為 None"""
+        if self.snapshot is None:
+            return None
+        return time.time() - self.snapshot["published_at"]
+
+    @property
+    def stale(self):
+        """bot 超過 stale_after 秒沒有發布（卡住或已經停了）"""
+        age = self.age()
+        return age is None or age > self.stale_after
+
+    def _entry(self, path):
+        entry = self._cache.get(path)
+        if entry is None:
+            entry = self._cache[path] = _make_entry(
+                (self.version,), *self.snapshot["routes"][path],
+                strict=path in self.snapshot.get("strict_etag", ())
+            )
+        return entry
@@ -0,0 +1,68 @@
+# =========================
+# status_worker.py
+# 獨立行程的健康檢查 web worker：從 bot 發布的共享快照回應 / /health /ping /status，
+# 不 import bot、不和 bot 行程來回溝通，可以開任意多個分擔探測與儀表板流量
+# 用法：STATUS_SHM=/dev/shm/inside_curl_status_10000 uvicorn status_worker:app --port 10001 --workers 4
+# （Inside_Curl.py 設定 STATUS_WORKERS 時會自己用這個方式啟動）
+# =========================
+import os
+import time
+
+from fastapi import FastAPI, Request
+from starlette.responses import Response
+
+from status_snapshot import JSON_TYPE, SharedStatusBoard, SnapshotReader, default_snapshot_path, dumps
+
+STATUS_SHM = os.getenv("STATUS_SHM", "") or default_snapshot_path(int(os.getenv("PORT", 10000)))
+# bot 超過這麼久沒發布快照，/health 回 503
+STATUS_STALE_AFTER = float(os.getenv("STATUS_STALE_AFTER", 15))
+
+board = SharedStatusBoard(SnapshotReader(STATUS_SHM), stale_after=STATUS_STALE_AFTER)
+app = FastAPI(title="Inside_Curl status worker")
+
+
+def unavailable(request):
+    """還沒有快照（bot 尚未啟動）或快照過期（bot 卡住 / 已停止）"""
+    age = board.age()
+    body = dumps({
+        "status": "unavailable" if age is None else "stale",
+        "snapshot_age_seconds": None if age is None else round(age, 1)
+    })
+    if request.method == "HEAD":
+        return Response(status_code=503, media_type=JSON_TYPE, headers={"Content-Length": str(len(body))})
+    return Response(body, status_code=503, media_type=JSON_TYPE)
+
+
+@app.get("/")
+@app.head("/")
+async def home(request: Request):
+    if board.refresh() is None:
+        return unavailable(request)
+    return board.respond("/", request)
+
+
+@app.get("/health")
+@app.head("/health")
+async def health(request: Request):
+    """探測時間寫回共享檔案，bot 的 /status 才看得到 last_health_check"""
+    board.reader.note_probe(time.time())
+    board.refresh()
+    if board.stale:
+        return unavailable(request)
+    return board.respond("/health", request)
+
+
+@app.get("/ping")
+@app.head("/ping")
+async def ping(request: Request):
+    if board.refresh() is None:
+        return unavailable(request)
+    return board.respond("/ping", request)
+
+
+@app.get("/status")
+@app.head("/status")
+async def status(request: Request):
+    if board.refresh() is None:
+        return unavailable(request)
+    return board.respond("/status", request)
@@ -0,0 +1,117 @@
+# =========================
+# tests/test_session_store.py
+# 舊版資料庫的升級：v1（單一伺服器、rollups 沒有 guild_id）直接用新版開啟；
+# 主備切換的 fence：等寫入鎖期間失去租約的批次不能 commit
+# 用法：python -m pytest -q tests（或 python -m unittest discover tests）
+# =========================
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from session_store import SessionStore  # noqa: E402
+
+# user-003 時的 schema（snapshot 以 user_id 為主鍵、rollups 沒有 guild_id）
+V1_SCHEMA = """
+CREATE TABLE journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    guild_id INTEGER,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    channel_name TEXT,
+    topic TEXT
+);
+CREATE TABLE snapshot (
+    user_id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    join_ts REAL NOT NULL,
+    topic TEXT,
+    channel_id INTEGER,
+    channel_name TEXT
+);
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE rollups (
+    scope TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, scope, key)
+);
+"""
+
+LEGACY_GUILD_ID = 7
+
+
+class MigrateV1Test(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix="inside_curl_migrate_"), "v1.db")
+        conn = sqlite3.connect(self.path)
+        conn.executescript(V1_SCHEMA)
+        conn.execute(
+            "INSERT INTO snapshot (user_id, guild_id, join_ts, topic, channel_id, channel_name) "
+            "VALUES (1, NULL, 1000.0, '微積分', 10, 'room')"
+        )
+        conn.execute(
+            "INSERT INTO journal (ts, kind, guild_id, user_id, channel_id, channel_name, topic) "
+            "VALUES (1100.0, 'topic', NULL, 1, NULL, NULL, '線性代數')"
+        )
+        conn.execute(
+            "INSERT INTO rollups (scope, period, bucket, key, seconds, sessions) "
+            "VALUES ('topic', 'week', '2026-W01', '微積分', 3600, 2)"
+        )
+        conn.commit()
+        conn.close()
+
+    def test_open_v1_database(self):
+        store = SessionStore(self.path, legacy_guild_id=LEGACY_GUILD_ID)
+        try:
+            _, sessions = store.load()
+            self.assertEqual(sessions[(LEGACY_GUILD_ID, 1)]["topic"], "線性代數")
+            rows = store._conn.execute(
+                "SELECT guild_id, scope, key, seconds, sessions FROM rollups ORDER BY scope"
+            ).fetchall()
+            self.assertEqual(rows, [
+                (LEGACY_GUILD_ID, "subject", "微積分", 3600, 2),
+                (LEGACY_GUILD_ID, "topic", "微積分", 3600, 2)
+            ])
+            indexes = {r[0] for r in store._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue({"rollups_key", "sessions_user_start", "sessions_window"} <= indexes)
+        finally:
+            store.close()
+        # 升級過的資料庫再開一次不會重做
+        SessionStore(self.path, legacy_guild_id=LEGACY_GUILD_ID).close()
+
+
+class FenceTest(unittest.TestCase):
+    def test_lease_lost_while_writing(self):
+        path = os.path.join(tempfile.mkdtemp(prefix="inside_curl_fence_"), "s.db")
+        checks = []
+
+        def fence():
+            # 開始寫入時還持有租約，commit 前已被接手
+            checks.append(1)
+            return len(checks) == 1
+
+        store = SessionStore(path, fence=fence)
+        try:
+            store.open_session(1, 2, 100.0, 3, "room")
+            store._write_pending()
+            self.assertEqual(store._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0], 0)
+            self.assertEqual(store.fenced, 1)
+            self.assertEqual(store.batches, 0)
+        finally:
+            store._fence = None
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
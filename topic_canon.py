@@ -0,0 +1,264 @@
+# =========================
+# topic_canon.py
+# 主題歸併：把 /record 的原始輸入（「微積分 ch3」「Calculus 」「calculas」）對應到標準主題
+# 字元 n-gram 倒排索引做模糊比對，管理員維護的別名決定跨語言 / 縮寫的歸併
+# 歷史 session 一律保存原始寫法；原始寫法 -> 標準主題的對應改變時只搬動受影響的統計
+# =========================
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+
+MAX_TOPIC_LENGTH = 100
+# Dice 相似度達到 AUTO_THRESHOLD 自動歸入；達到 SUGGEST_THRESHOLD 只列為建議
+AUTO_THRESHOLD = 0.7
+SUGGEST_THRESHOLD = 0.5
+MAX_SUGGESTIONS = 5
+
+# 章節 / 作業編號之類的尾巴不影響主題：「微積分 ch3」「線代 第二章」「物理 hw 5」
+_QUALIFIER = re.compile(
+    r"((?<![a-z])(ch|chap|chapter|sec|section|lec|lecture|hw|unit|part|week|wk|ep)\s*\.?\s*\d+(?!\d)"
+    r"|第\s*[0-9一二三四五六七八九十百]+\s*[章節节課课回講讲單元单元週周]"
+    r"|\(\s*\d+\s*\)|#\s*\d+)",
+    re.IGNORECASE
+)
+_RUN = re.compile(r"[a-z0-9]+|[^a-z0-9 ]+")
+_PUNCT = re.compile(r"[\s\-_/\\.,:;!?'\"()\[\]{}|·、，。：；！？「」『』（）【】]+")
+
+
+def fold(topic):
+    """比對用的 key：全形轉半形、大小寫不分、去掉章節編號與標點"""
+    text = unicodedata.normalize("NFKC", topic).casefold()
+    text = _QUALIFIER.sub(" ", text)
+    return " ".join(_PUNCT.sub(" ", text).split())
+
+
+def grams(key):
+    """
+    英數字段用前後補空白的 trigram，其他文字（中文常只有兩三個字）用 bigram：
+    英文的 bigram 太常見，posting 會很長；中文用 trigram 又幾乎不會有共同的 gram。
+    """
+    found = set()
+    for run in _RUN.findall(key):
+        size = 3 if run[0].isascii() else 2
+        padded = f" {run} "
+        found.update(padded[i:i + size] for i in range(max(1, len(padded) - size + 1)))
+    return frozenset(found)
+
+
+class NgramIndex:
+    """
+    key -> gram 集合，gram -> 含有它的 key 清單（倒排索引）。
+    查詢時把每個 gram 的 posting 丟進 Counter（C 實作的計數），得到每個候選共有幾個 gram，
+    不必逐一做集合交集；相似度門檻 t 換算成最少共有 need 個 gram，先用計數篩掉大部分候選。
+    """
+
+    __slots__ = ("grams", "postings")
+
+    def __init__(self):
+        self.grams = {}
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.grams)
+
+    def __contains__(self, key):
+        return key in self.grams
+
+    def add(self, key):
+        if key in self.grams:
+            return
+        key_grams = self.grams[key] = grams(key)
+        for gram in key_grams:
+            self.postings.setdefault(gram, []).append(key)
+
+    def remove(self, key):
+        key_grams = self.grams.pop(key, None)
+        if key_grams is None:
+            return
+        for gram in key_grams:
+            posting = self.postings[gram]
+            posting.remove(key)
+            if not posting:
+                del self.postings[gram]
+
+    def search(self, key, threshold=SUGGEST_THRESHOLD, limit=MAX_SUGGESTIONS):
+        """回傳 [(Dice 相似度, key)]，相似度高的在前"""
+        query = grams(key)
+        n = len(query)
+        # 2c / (n + m) >= t 且 c <= m  =>  c >= t * n / (2 - t)
+        need = max(1, math.ceil(threshold * n / (2 - threshold)))
+        counts = Counter()
+        for gram in query:
+            posting = self.postings.get(gram)
+            if posting:
+                counts.update(posting)
+        index = self.grams
+        scored = []
+        for candidate, shared in counts.items():
+            if shared >= need:
+                score = 2 * shared / (n + len(index[candidate]))
+                if score >= threshold:
+                    scored.append((score, candidate))
+        return heapq.nlargest(limit, scored)
+
+
+class GuildTopics:
+    """
+    一個伺服器的主題：
+    - mapping：每個用過的原始寫法 -> 標準主題（沒有特別對應時就是它自己）
+    - aliases：管理員設定的 fold(別名) -> 標準主題
+    - index：所有標準主題的 fold key，key -> 標準主題寫法放在 names
+    """
+
+    def __init__(self):
+        self.mapping = {}
+        self.aliases = {}
+        self.index = NgramIndex()
+        self.names = {}
+        self.members = {}  # 標準主題 fold key -> {對應到它的原始寫法}
+        self.by_key = {}  # fold(原始寫法) -> {原始寫法}
+
+    def _attach(self, raw, canonical):
+        self.mapping[raw] = canonical
+        key = fold(canonical) or canonical.casefold()
+        members = self.members.get(key)
+        if members is None:
+            members = self.members[key] = set()
+            self.names[key] = canonical
+            self.index.add(key)
+        members.add(raw)
+
+    def _detach(self, raw):
+        canonical = self.mapping.pop(raw)
+        key = fold(canonical) or canonical.casefold()
+        members = self.members[key]
+        members.discard(raw)
+        if not members:
+            del self.members[key]
+            del self.names[key]
+            self.index.remove(key)
+        return canonical
+
+    def load(self, raw, canonical=None):
+        """啟動時載入：歷史上的原始寫法與它目前的對應"""
+        if raw in self.mapping:
+            return
+        self._attach(raw, canonical or raw)
+        self.by_key.setdefault(fold(raw), set()).add(raw)
+
+    def canonical(self, raw):
+        if not raw:
+            return raw
+        return self.mapping.get(raw, raw)
+
+    def resolve(self, raw):
+        """
+        新輸入的主題 -> (標準主題, 方式, 建議)；方式是 known / alias / exact / fuzzy / new。
+        exact 是 fold 後與既有標準主題相同（大小寫、全半形、章節編號不同）。
+        """
+        if raw in self.mapping:
+            return self.mapping[raw], "known", []
+        key = fold(raw)
+        if not key:
+            return raw, "new", []
+        if key in self.aliases:
+            return self.aliases[key], "alias", []
+        if key in self.names:
+            return self.names[key], "exact", []
+        matches = self.index.search(key)
+        if matches and matches[0][0] >= AUTO_THRESHOLD:
+            return self.names[matches[0][1]], "fuzzy", []
+        return raw, "new", [self.names[match] for _, match in matches]
+
+    def register(self, raw, canonical):
+        """/record 用了新的原始寫法"""
+        if raw not in self.mapping:
+            self._attach(raw, canonical)
+            self.by_key.setdefault(fold(raw), set()).add(raw)
+
+    def suggest(self, text, limit=MAX_SUGGESTIONS):
+        key = fold(text)
+        if not key:
+            return []
+        return [self.names[match] for _, match in self.index.search(key, limit=limit)]
+
+    def _remap(self, raws, target):
+        """把 raws 改對應到 target(raw)，回傳實際有變的 [(原始寫法, 舊標準主題, 新標準主題)]"""
+        changes = []
+        for raw in sorted(raws):
+            new = target(raw)
+            old = self.mapping.get(raw, raw)
+            if new == old:
+                continue
+            self._detach(raw)
+            self._attach(raw, new)
+            changes.append((raw, old, new))
+        return changes
+
+    def set_alias(self, alias, canonical):
+        """
+        fold(alias) -> canonical。受影響的原始寫法：fold 後等於別名的，
+        以及目前對應的標準主題 fold 後等於別名的（先前自動歸到別名那個主題的寫法）。
+        """
+        key = fold(alias)
+        self.aliases[key] = canonical
+        raws = set(self.by_key.get(key, ()))
+        raws.update(self.members.get(key, ()))
+        return key, self._remap(raws, lambda raw: canonical)
+
+    def remove_alias(self, alias):
+        """
+        移除別名：經由這個別名歸併的原始寫法（fold 後等於別名，或自己的別名指向這個別名）
+        改回自己別名的目標，沒有別名就恢復成各自的寫法。
+        """
+        key = fold(alias)
+        canonical = self.aliases.pop(key, None)
+        if canonical is None:
+            return key, None
+        raws = {
+            raw for raw in self.members.get(fold(canonical) or canonical.casefold(), ())
+            if self.mapping[raw] == canonical and key in (fold(raw), fold(self.aliases.get(fold(raw), "")))
+        }
+        return key, self._remap(raws, lambda raw: self.aliases.get(fold(raw), raw))
+
+    def stats(self):
+        return {"topics": len(self.mapping), "canonical": len(self.names), "aliases": len(self.aliases)}
+
+
+class TopicCanon:
+    """各伺服器一份 GuildTopics"""
+
+    def __init__(self):
+        self.guilds = {}
+
+    def guild(self, guild_id):
+        topics = self.guilds.get(guild_id)
+        if topics is None:
+            topics = self.guilds[guild_id] = GuildTopics()
+        return topics
+
+    def load(self, topic_rows, map_rows, alias_rows):
+        """
+        topic_rows：(guild_id, 原始寫法, ...) 歷史上用過的主題；
+        map_rows：(guild_id, 原始寫法, 標準主題) 不是對應到自己的那些；
+        alias_rows：(guild_id, fold 後的別名, 標準主題)
+        """
+        for guild_id, alias_key, canonical in alias_rows:
+            self.guild(guild_id).aliases[alias_key] = canonical
+        for guild_id, raw, canonical in map_rows:
+            self.guild(guild_id).load(raw, canonical)
+        for guild_id, raw, *_ in topic_rows:
+            self.guild(guild_id).load(raw)
+
+    def canonical(self, guild_id, raw):
+        topics = self.guilds.get(guild_id)
+        return topics.canonical(raw) if topics is not None else raw
+
+    def stats(self):
+        totals = {"topics": 0, "canonical": 0, "aliases": 0}
+        for topics in self.guilds.values():
+            for name, value in topics.stats().items():
+                totals[name] += value
+        return totals
@@ -0,0 +1,151 @@
+# =========================
+# topics.py
+# /record 主題的自動完成：排序陣列前綴索引 + 依最近使用與次數排名
+# 每個 (伺服器, 用戶) 一份小索引（LRU 控制數量），每個伺服器一份共用索引
+# =========================
+import asyncio
+import bisect
+import heapq
+import math
+import time
+from collections import OrderedDict
+
+# Discord autocomplete 最多 25 個選項，值最長 100 字
+MAX_CHOICES = 25
+MAX_TOPIC_LENGTH = 100
+# 使用次數的半衰期：兩週前用過一次的主題，分數是今天用一次的一半
+HALF_LIFE = 14 * 86400
+
+
+def normalize(topic):
+    return " ".join(topic.split()).casefold()
+
+
+def decayed(score, last_ts, now):
+    return score * math.pow(0.5, max(0.0, now - last_ts) / HALF_LIFE)
+
+
+class PrefixIndex:
+    """
+    正規化後的主題排成一個排序陣列，前綴查詢就是兩次 bisect 取出一段範圍。
+    每個主題記錄原始寫法、衰減後的使用分數與最後使用時間；
+    分數 = 舊分數依時間衰減 + 1，同時反映次數與新舊。
+    """
+
+    __slots__ = ("keys", "entries")
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, topic, ts, count=1):
+        key = normalize(topic)
+        if not key:
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            bisect.insort(self.keys, key)
+            self.entries[key] = [topic, float(count), ts]
+            return
+        entry[0] = topic
+        entry[1] = decayed(entry[1], entry[2], ts) + count
+        entry[2] = max(entry[2], ts)
+
+    def search(self, prefix, now, limit=MAX_CHOICES, exclude=()):
+        """回傳 [(分數, 原始寫法)]，分數高的在前"""
+        prefix = normalize(prefix)
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\U0010ffff") if prefix else len(self.keys)
+        entries = self.entries
+        return heapq.nlargest(
+            limit,
+            (
+                (decayed(entries[key][1], entries[key][2], now), entries[key][0])
+                for key in self.keys[lo:hi] if key not in exclude
+            )
+        )
+
+
+class TopicIndex:
+    """
+    用戶索引只保留最近用過 autocomplete / /record 的 user_capacity 個 (guild_id, user_id)，
+    沒命中時在背景執行緒用 loader(guild_id, user_id) 從歷史表重建（走 (user_id, start_ts) 索引，只讀該用戶的列），
+    不佔用 event loop；同一個人同時的多次查詢共用一次載入。
+    伺服器索引啟動時一次載入，之後只增不減。
+    """
+
+    def __init__(self, loader, user_capacity=2000):
+        self.loader = loader
+        self.user_capacity = user_capacity
+        self.users = OrderedDict()
+        self.guilds = {}
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load_guild_rows(self, rows):
+        """rows: (guild_id, topic, 次數, 最後使用時間)"""
+        for guild_id, topic, count, last_ts in rows:
+            self.guilds.setdefault(guild_id, PrefixIndex()).add(topic, last_ts, count)
+
+    async def _user(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        index = self.users.get(key)
+        if index is not None:
+            self.hits += 1
+            self.users.move_to_end(key)
+            return index
+        task = self._loading.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._loading[key] = asyncio.ensure_future(self._load(key))
+        # 取消的是等待的一方（autocomplete 被新的輸入取代），載入照樣完成給下一次用
+        return await asyncio.shield(task)
+
+    async def _load(self, key):
+        try:
+            rows = await asyncio.to_thread(self.loader, *key)
+            index = PrefixIndex()
+            for topic, count, last_ts in rows:
+                index.add(topic, last_ts, count)
+            self.users[key] = index
+            if len(self.users) > self.user_capacity:
+                self.users.popitem(last=False)
+            return index
+        finally:
+            self._loading.pop(key, None)
+
+    def prewarm(self, guild_id, user_id):
+        """加入語音時先在背景載入，之後的 /record 與 autocomplete 直接命中"""
+        key = (guild_id, user_id)
+        if key not in self.users and key not in self._loading:
+            self.misses += 1
+            self._loading[key] = asyncio.ensure_future(self._load(key))
+
+    async def record(self, guild_id, user_id, topic, ts=None):
+        ts = time.time() if ts is None else ts
+        self.guilds.setdefault(guild_id, PrefixIndex()).add(topic, ts)
+        (await self._user(guild_id, user_id)).add(topic, ts)
+
+    async def suggest(self, guild_id, user_id, prefix, now=None, limit=MAX_CHOICES):
+        """自己用過的主題優先，不足再用伺服器其他人用過的補滿"""
+        now = time.time() if now is None else now
+        mine = (await self._user(guild_id, user_id)).search(prefix, now, limit)
+        topics = [topic for _, topic in mine]
+        guild = self.guilds.get(guild_id)
+        if guild is not None and len(topics) < limit:
+            seen = {normalize(topic) for topic in topics}
+            topics.extend(topic for _, topic in guild.search(prefix, now, limit - len(topics), seen))
+        return [topic[:MAX_TOPIC_LENGTH] for topic in topics]
+
+    def stats(self):
+        return {
+            "cached_users": len(self.users),
+            "loading": len(self._loading),
+            "guild_topics": sum(len(index) for index in self.guilds.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }